@@ -29,16 +29,26 @@ def create_app(config_class=Config):
     CORS(app)
     jwt.init_app(app)
     
+    # Statement timeouts and query caps per endpoint
+    from app.services.query_budget import init_query_budgets
+    init_query_budgets(app)
+    
+    # Background jobs (Celery worker, or inline when JOBS_EAGER)
+    from app.services.jobs import init_jobs
+    init_jobs(app)
+    
     # Register blueprints
     from app.routes.claims import claims_bp
     from app.routes.monitoring import monitoring_bp
     from app.routes.analytics import analytics_bp
     from app.routes.alerts import alerts_bp
+    from app.routes.jobs import jobs_bp
     
     app.register_blueprint(claims_bp, url_prefix='/api/claims')
     app.register_blueprint(monitoring_bp, url_prefix='/api/monitoring')
     app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
     app.register_blueprint(alerts_bp, url_prefix='/api/alerts')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
     
     # Health check endpoint
     @app.route('/health')
@@ -59,7 +69,8 @@ def create_app(config_class=Config):
                 'claims': '/api/claims',
                 'monitoring': '/api/monitoring',
                 'analytics': '/api/analytics',
-                'alerts': '/api/alerts'
+                'alerts': '/api/alerts',
+                'jobs': '/api/jobs'
             }
         }
     
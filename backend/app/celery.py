@@ -0,0 +1,11 @@
+"""
+Celery Entry Point
+Worker and beat processes: celery -A app.celery worker|beat
+"""
+
+import os
+from app import create_app
+from config.settings import config
+
+flask_app = create_app(config[os.environ.get('FLASK_ENV', 'development')])
+celery = flask_app.extensions['celery']
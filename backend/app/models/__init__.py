@@ -1,4 +1,4 @@
 # Models package
-from .fra_claim import FRAClaim, MonitoringData, Alert
+from .fra_claim import FRAClaim, MonitoringData, Alert, ClaimNDVIStats, MonitoringRollup, NDVIForecast, AnalyticsRollup, Job, NotificationOutbox
 
-__all__ = ['FRAClaim', 'MonitoringData', 'Alert']
\ No newline at end of file
+__all__ = ['FRAClaim', 'MonitoringData', 'Alert', 'ClaimNDVIStats', 'MonitoringRollup', 'NDVIForecast', 'AnalyticsRollup', 'Job', 'NotificationOutbox']
\ No newline at end of file
@@ -3,6 +3,6 @@ Alert Model
 Environmental alerts and violations
 """
 
-from app.models.fra_claim import Alert
+from app.models.fra_claim import Alert, NotificationOutbox
 
-__all__ = ['Alert']
\ No newline at end of file
+__all__ = ['Alert', 'NotificationOutbox']
\ No newline at end of file
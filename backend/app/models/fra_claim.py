@@ -1,6 +1,6 @@
 from app import db
 from geoalchemy2 import Geometry
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY, insert as pg_insert
 from sqlalchemy import func
 from datetime import datetime
 import uuid
@@ -39,7 +39,7 @@ class FRAClaim(db.Model):
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.String(100))
-    metadata = db.Column(JSONB)
+    claim_metadata = db.Column('metadata', JSONB)  # 'metadata' is reserved on declarative models
     
     monitoring_data = db.relationship('MonitoringData', backref='claim', lazy='dynamic')
     alerts = db.relationship('Alert', backref='claim', lazy='dynamic')
@@ -116,6 +116,7 @@ class MonitoringData(db.Model):
             'vegetation_loss_area': self.vegetation_loss_area,
             'vegetation_gain_area': self.vegetation_gain_area,
             'cloud_cover_percentage': self.cloud_cover_percentage,
+            'health_class_area_ha': (self.additional_metrics or {}).get('health_class_area_ha'),
             'processed_at': self.processed_at.isoformat()
         }
 
@@ -127,12 +128,22 @@ class Alert(db.Model):
     
     alert_type = db.Column(db.String(50), nullable=False)
     severity = db.Column(db.String(20), nullable=False)
+    # Stored by Postgres from severity, so listings can order and page by an index
+    severity_rank = db.Column(db.SmallInteger, db.Computed(
+        "CASE severity WHEN 'critical' THEN 4 WHEN 'high' THEN 3 "
+        "WHEN 'medium' THEN 2 WHEN 'low' THEN 1 ELSE 0 END",
+        persisted=True
+    ))
     status = db.Column(db.String(20), default='active')
     
     detected_at = db.Column(db.DateTime, default=datetime.utcnow)
     affected_area_hectares = db.Column(db.Float)
     confidence_score = db.Column(db.Float)
     
+    # Repeat detections coalesce into the open alert (incident) of the same claim and type
+    occurrence_count = db.Column(db.Integer, nullable=False, default=1)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
     alert_geometry = db.Column(Geometry('POLYGON', srid=4326))
     
     reported_to_authorities = db.Column(db.Boolean, default=False)
@@ -159,12 +170,321 @@ class Alert(db.Model):
             'detected_at': self.detected_at.isoformat(),
             'affected_area_hectares': self.affected_area_hectares,
             'confidence_score': self.confidence_score,
+            'occurrence_count': self.occurrence_count,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None,
             'reported_to_authorities': self.reported_to_authorities
         }
 
+class ClaimNDVIStats(db.Model):
+    """Running NDVI statistics per claim, updated on every monitoring insert"""
+    __tablename__ = 'claim_ndvi_stats'
+    
+    claim_id = db.Column(UUID(as_uuid=True), db.ForeignKey('fra_claims.id'), primary_key=True)
+    
+    observation_count = db.Column(db.Integer, nullable=False, default=0)
+    ndvi_mean = db.Column(db.Float, nullable=False, default=0.0)
+    ndvi_m2 = db.Column(db.Float, nullable=False, default=0.0)
+    ndvi_min = db.Column(db.Float)
+    ndvi_max = db.Column(db.Float)
+    
+    latest_ndvi = db.Column(db.Float)
+    latest_observation_date = db.Column(db.Date)
+    
+    # OLS sums over t = days since origin_date
+    origin_date = db.Column(db.Date)
+    sum_t = db.Column(db.Float, nullable=False, default=0.0)
+    sum_tt = db.Column(db.Float, nullable=False, default=0.0)
+    sum_ty = db.Column(db.Float, nullable=False, default=0.0)
+    
+    # Streaming anomaly detector state: EWM level/variance and per-month baselines
+    ewm_mean = db.Column(db.Float)
+    ewm_var = db.Column(db.Float)
+    seasonal_count = db.Column(ARRAY(db.Integer))
+    seasonal_mean = db.Column(ARRAY(db.Float))
+    seasonal_m2 = db.Column(ARRAY(db.Float))
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    claim = db.relationship('FRAClaim', backref=db.backref('ndvi_stats', uselist=False))
+    
+    def __repr__(self):
+        return f'<ClaimNDVIStats {self.claim_id}: n={self.observation_count}>'
+    
+    @classmethod
+    def locked_for_claim(cls, claim_id):
+        """Get or create the stats row for a claim, locked for the current transaction"""
+        db.session.execute(
+            pg_insert(cls.__table__).values(
+                claim_id=claim_id,
+                observation_count=0,
+                ndvi_mean=0.0,
+                ndvi_m2=0.0,
+                sum_t=0.0,
+                sum_tt=0.0,
+                sum_ty=0.0
+            ).on_conflict_do_nothing(index_elements=['claim_id'])
+        )
+        return cls.query.filter_by(claim_id=claim_id).with_for_update().populate_existing().one()
+    
+    def add_observation(self, observation_date, ndvi_value):
+        """Fold one observation into the running statistics (Welford + OLS sums)"""
+        ndvi_value = float(ndvi_value)
+        n = self.observation_count or 0
+        
+        if self.origin_date is None:
+            self.origin_date = observation_date
+        elif observation_date < self.origin_date:
+            # Re-base the OLS sums so t stays non-negative for back-filled observations
+            shift = float((self.origin_date - observation_date).days)
+            sum_y = (self.ndvi_mean or 0.0) * n
+            self.sum_tt = self.sum_tt + 2 * shift * self.sum_t + n * shift ** 2
+            self.sum_ty = self.sum_ty + shift * sum_y
+            self.sum_t = self.sum_t + n * shift
+            self.origin_date = observation_date
+        
+        n += 1
+        delta = ndvi_value - (self.ndvi_mean or 0.0)
+        self.ndvi_mean = (self.ndvi_mean or 0.0) + delta / n
+        self.ndvi_m2 = (self.ndvi_m2 or 0.0) + delta * (ndvi_value - self.ndvi_mean)
+        self.observation_count = n
+        
+        self.ndvi_min = ndvi_value if self.ndvi_min is None else min(self.ndvi_min, ndvi_value)
+        self.ndvi_max = ndvi_value if self.ndvi_max is None else max(self.ndvi_max, ndvi_value)
+        
+        if self.latest_observation_date is None or observation_date >= self.latest_observation_date:
+            self.latest_observation_date = observation_date
+            self.latest_ndvi = ndvi_value
+        
+        t = float((observation_date - self.origin_date).days)
+        self.sum_t = (self.sum_t or 0.0) + t
+        self.sum_tt = (self.sum_tt or 0.0) + t * t
+        self.sum_ty = (self.sum_ty or 0.0) + t * ndvi_value
+    
+    @property
+    def ndvi_std(self):
+        if not self.observation_count:
+            return None
+        return (self.ndvi_m2 / self.observation_count) ** 0.5
+    
+    @property
+    def trend_slope_per_day(self):
+        """Least-squares NDVI slope per day over the whole history"""
+        n = self.observation_count or 0
+        denominator = n * self.sum_tt - self.sum_t ** 2
+        if n < 2 or denominator <= 0:
+            return None
+        return (n * self.sum_ty - self.sum_t * self.ndvi_mean * n) / denominator
+    
+    def to_dict(self):
+        slope = self.trend_slope_per_day
+        return {
+            'claim_id': str(self.claim_id),
+            'data_points': self.observation_count,
+            'mean_ndvi': round(self.ndvi_mean, 3) if self.observation_count else None,
+            'std_ndvi': round(self.ndvi_std, 3) if self.observation_count else None,
+            'min_ndvi': round(self.ndvi_min, 3) if self.ndvi_min is not None else None,
+            'max_ndvi': round(self.ndvi_max, 3) if self.ndvi_max is not None else None,
+            'latest_ndvi': round(self.latest_ndvi, 3) if self.latest_ndvi is not None else None,
+            'latest_observation_date': self.latest_observation_date.isoformat() if self.latest_observation_date else None,
+            'first_observation_date': self.origin_date.isoformat() if self.origin_date else None,
+            'trend_slope_per_day': round(slope, 6) if slope is not None else None,
+            'trend': None if slope is None else 'stable' if abs(slope) < 1e-4 else 'improving' if slope > 0 else 'declining',
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class MonitoringRollup(db.Model):
+    """Weekly/monthly NDVI aggregates per claim, maintained incrementally at ingest"""
+    __tablename__ = 'monitoring_rollups'
+    
+    claim_id = db.Column(UUID(as_uuid=True), db.ForeignKey('fra_claims.id'), primary_key=True)
+    resolution = db.Column(db.String(10), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    
+    observation_count = db.Column(db.Integer, nullable=False, default=0)
+    ndvi_sum = db.Column(db.Float, nullable=False, default=0.0)
+    ndvi_sum_sq = db.Column(db.Float, nullable=False, default=0.0)
+    ndvi_min = db.Column(db.Float)
+    ndvi_max = db.Column(db.Float)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MonitoringRollup {self.claim_id}: {self.resolution} {self.period_start}>'
+    
+    @classmethod
+    def record(cls, claim_id, observation_date, ndvi_value):
+        """Fold one observation into every rollup resolution with an atomic upsert"""
+        from app.services.rollups import ROLLUP_RESOLUTIONS, period_start
+        
+        ndvi_value = float(ndvi_value)
+        table = cls.__table__
+        for resolution in ROLLUP_RESOLUTIONS:
+            statement = pg_insert(table).values(
+                claim_id=claim_id,
+                resolution=resolution,
+                period_start=period_start(resolution, observation_date),
+                observation_count=1,
+                ndvi_sum=ndvi_value,
+                ndvi_sum_sq=ndvi_value * ndvi_value,
+                ndvi_min=ndvi_value,
+                ndvi_max=ndvi_value,
+                updated_at=datetime.utcnow()
+            )
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=['claim_id', 'resolution', 'period_start'],
+                set_={
+                    'observation_count': table.c.observation_count + 1,
+                    'ndvi_sum': table.c.ndvi_sum + statement.excluded.ndvi_sum,
+                    'ndvi_sum_sq': table.c.ndvi_sum_sq + statement.excluded.ndvi_sum_sq,
+                    'ndvi_min': func.least(table.c.ndvi_min, statement.excluded.ndvi_min),
+                    'ndvi_max': func.greatest(table.c.ndvi_max, statement.excluded.ndvi_max),
+                    'updated_at': statement.excluded.updated_at
+                }
+            ))
+    
+    @property
+    def ndvi_mean(self):
+        return self.ndvi_sum / self.observation_count if self.observation_count else None
+    
+    @property
+    def ndvi_std(self):
+        if not self.observation_count:
+            return None
+        mean = self.ndvi_mean
+        return max(self.ndvi_sum_sq / self.observation_count - mean * mean, 0.0) ** 0.5
+    
+    def to_dict(self):
+        return {
+            'date': self.period_start.isoformat(),
+            'resolution': self.resolution,
+            'ndvi_mean': round(self.ndvi_mean, 4) if self.observation_count else None,
+            'ndvi_min': self.ndvi_min,
+            'ndvi_max': self.ndvi_max,
+            'ndvi_std': round(self.ndvi_std, 4) if self.observation_count else None,
+            'observations': self.observation_count
+        }
+
+class AnalyticsRollup(db.Model):
+    """Claim, alert and NDVI totals per time bucket, state, district and status, maintained on write"""
+    __tablename__ = 'analytics_rollups'
+    
+    metric = db.Column(db.String(20), primary_key=True)
+    bucket = db.Column(db.String(10), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    state = db.Column(db.String(50), primary_key=True)
+    district = db.Column(db.String(100), primary_key=True)
+    status = db.Column(db.String(30), primary_key=True, default='')  # '' for metrics without a status
+    
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Float, nullable=False, default=0.0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.metric}: {self.bucket} {self.period_start} {self.state}/{self.district}>'
+
+class NDVIForecast(db.Model):
+    """Precomputed monthly NDVI forecasts with prediction intervals (nightly batch)"""
+    __tablename__ = 'ndvi_forecasts'
+    
+    claim_id = db.Column(UUID(as_uuid=True), db.ForeignKey('fra_claims.id'), primary_key=True)
+    target_month = db.Column(db.Date, primary_key=True)
+    
+    horizon_months = db.Column(db.SmallInteger, nullable=False)
+    predicted_ndvi = db.Column(db.Float, nullable=False)
+    lower_ndvi = db.Column(db.Float, nullable=False)
+    upper_ndvi = db.Column(db.Float, nullable=False)
+    
+    model = db.Column(db.String(20), nullable=False)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NDVIForecast {self.claim_id}: {self.target_month} = {self.predicted_ndvi:.3f}>'
+    
+    def to_dict(self):
+        return {
+            'target_month': self.target_month.isoformat(),
+            'horizon_months': self.horizon_months,
+            'predicted_ndvi': round(self.predicted_ndvi, 3),
+            'lower_ndvi': round(self.lower_ndvi, 3),
+            'upper_ndvi': round(self.upper_ndvi, 3)
+        }
+
+class NotificationOutbox(db.Model):
+    """Alert notification owed to one recipient, written in the alert's transaction"""
+    __tablename__ = 'notification_outbox'
+    
+    STATUSES = ('pending', 'sent', 'failed')
+    
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    alert_id = db.Column(UUID(as_uuid=True), db.ForeignKey('alerts.id', ondelete='CASCADE'), nullable=False)
+    event = db.Column(db.String(30), nullable=False)  # alert.created, alert.escalated
+    recipient = db.Column(db.String(200), nullable=False)
+    payload = db.Column(JSONB, nullable=False)
+    
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.event} -> {self.recipient} ({self.status})>'
+
+class Job(db.Model):
+    """Background job: status, progress and result location of a registered task"""
+    __tablename__ = 'jobs'
+    
+    STATUSES = ('queued', 'running', 'succeeded', 'failed')
+    
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    task = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    params = db.Column(JSONB)
+    
+    progress = db.Column(db.Float, nullable=False, default=0.0)  # 0-1
+    progress_message = db.Column(db.String(200))
+    
+    result = db.Column(JSONB)
+    result_path = db.Column(db.String(500))
+    error = db.Column(db.Text)
+    
+    created_by = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<Job {self.task}: {self.id} ({self.status})>'
+    
+    def to_dict(self):
+        return {
+            'id': str(self.id),
+            'task': self.task,
+            'status': self.status,
+            'progress': round(self.progress or 0.0, 3),
+            'progress_message': self.progress_message,
+            'result': self.result,
+            'has_result_file': self.result_path is not None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
 db.Index('idx_fra_claims_status', FRAClaim.status)
 db.Index('idx_fra_claims_state_district', FRAClaim.state, FRAClaim.district)
 db.Index('idx_fra_claims_geometry', FRAClaim.geometry, postgresql_using='gist')
 db.Index('idx_monitoring_date', MonitoringData.observation_date)
 db.Index('idx_alerts_type_severity', Alert.alert_type, Alert.severity)
 db.Index('idx_alerts_status', Alert.status)
+db.Index('uq_alerts_open_claim_type', Alert.claim_id, Alert.alert_type, unique=True,
+         postgresql_where=Alert.status == 'active')
+db.Index('idx_alerts_active_rank_detected', Alert.severity_rank.desc(), Alert.detected_at.desc(),
+         Alert.id.desc(), postgresql_where=Alert.status == 'active')
+db.Index('idx_ndvi_forecasts_target_predicted', NDVIForecast.target_month, NDVIForecast.predicted_ndvi)
+db.Index('idx_jobs_status_created', Job.status, Job.created_at)
+db.Index('idx_notification_outbox_due', NotificationOutbox.next_attempt_at,
+         postgresql_where=NotificationOutbox.status == 'pending')
@@ -0,0 +1,8 @@
+"""
+Job Model
+Background job status and results
+"""
+
+from app.models.fra_claim import Job
+
+__all__ = ['Job']
@@ -3,6 +3,6 @@ Monitoring Data Model
 Satellite monitoring and NDVI analysis data
 """
 
-from app.models.fra_claim import MonitoringData
+from app.models.fra_claim import MonitoringData, ClaimNDVIStats, MonitoringRollup, NDVIForecast
 
-__all__ = ['MonitoringData']
\ No newline at end of file
+__all__ = ['MonitoringData', 'ClaimNDVIStats', 'MonitoringRollup', 'NDVIForecast']
\ No newline at end of file
@@ -1,29 +1,54 @@
 
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response
 from flask_restful import Api, Resource
 from app import db
 from app.models import FRAClaim, Alert
-from sqlalchemy import func, desc
+from app.services.snapshot_cache import get_snapshot_cache
+from app.services.alert_incidents import record_detection
+from app.services.alert_events import get_event_bus, stream_slots, format_sse
+from sqlalchemy import func, desc, case, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager
 from datetime import datetime, timedelta
+import base64
 import json
+import time
+import uuid
 
 alerts_bp = Blueprint('alerts', __name__)
 api = Api(alerts_bp)
 
+# Tables whose writes invalidate the alert statistics snapshot
+ALERT_STATS_TABLES = ('alerts', 'fra_claims')
+
 class AlertsListAPI(Resource):
     
     def get(self):
         try:
+            # Offset paging was replaced by keyset cursors; a page number would silently restart
+            if 'page' in request.args:
+                return {'error': 'page is no longer supported; pass the next_cursor of the previous response as cursor'}, 400
+            
             severity = request.args.get('severity')
             status = request.args.get('status', 'active')
             alert_type = request.args.get('type')
             state = request.args.get('state')
             days = request.args.get('days', 30, type=int)
-            page = request.args.get('page', 1, type=int)
-            per_page = min(request.args.get('per_page', 50, type=int), 100)
-            
-            query = Alert.query.join(FRAClaim)
+            cursor = request.args.get('cursor')
+            include_total = request.args.get('include_total', 'false').lower() == 'true'
+            per_page = max(1, min(request.args.get('per_page', 50, type=int), 100))
+            
+            # Claim columns come from the join, not five lazy loads per alert
+            query = Alert.query.join(FRAClaim).options(
+                contains_eager(Alert.claim).load_only(
+                    FRAClaim.claim_id,
+                    FRAClaim.village_name,
+                    FRAClaim.district,
+                    FRAClaim.state,
+                    FRAClaim.area_hectares
+                )
+            )
             
             if severity:
                 query = query.filter(Alert.severity == severity)
@@ -39,21 +64,34 @@ class AlertsListAPI(Resource):
                 cutoff_date = datetime.utcnow() - timedelta(days=days)
                 query = query.filter(Alert.detected_at >= cutoff_date)
             
-            severity_order = func.case(
-                (Alert.severity == 'critical', 4),
-                (Alert.severity == 'high', 3),
-                (Alert.severity == 'medium', 2),
-                (Alert.severity == 'low', 1),
-                else_=0
-            )
-            
-            query = query.order_by(desc(severity_order), desc(Alert.detected_at))
-            
-            alerts = query.paginate(
-                page=page,
-                per_page=per_page,
-                error_out=False
-            )
+            total = query.order_by(None).count() if include_total else None
+            
+            # Keyset pagination: continue strictly after the last row of the previous page,
+            # walking idx_alerts_active_rank_detected instead of counting and skipping rows
+            sort_key = tuple_(Alert.severity_rank, Alert.detected_at, Alert.id)
+            if cursor:
+                try:
+                    rank, detected_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+                    if isinstance(rank, bool) or not isinstance(rank, int):
+                        raise ValueError('cursor rank must be an integer')
+                    position = (rank, datetime.fromisoformat(detected_at), uuid.UUID(last_id))
+                except (ValueError, TypeError, AttributeError):
+                    return {'error': 'Invalid cursor'}, 400
+                query = query.filter(sort_key < tuple_(*position))
+            
+            rows = query.order_by(
+                desc(Alert.severity_rank),
+                desc(Alert.detected_at),
+                desc(Alert.id)
+            ).limit(per_page + 1).all()
+            
+            alerts, has_next = rows[:per_page], len(rows) > per_page
+            next_cursor = None
+            if has_next:
+                last = alerts[-1]
+                next_cursor = base64.urlsafe_b64encode(json.dumps(
+                    [last.severity_rank, last.detected_at.isoformat(), str(last.id)]
+                ).encode()).decode()
             
             result = {
                 'alerts': [
@@ -67,18 +105,18 @@ class AlertsListAPI(Resource):
                             'area_hectares': alert.claim.area_hectares
                         }
                     }
-                    for alert in alerts.items
+                    for alert in alerts
                 ],
                 'pagination': {
-                    'page': page,
-                    'pages': alerts.pages,
                     'per_page': per_page,
-                    'total': alerts.total,
-                    'has_next': alerts.has_next,
-                    'has_prev': alerts.has_prev
+                    'cursor': cursor,
+                    'next_cursor': next_cursor,
+                    'has_next': has_next,
+                    'total': total
                 },
                 'summary': {
-                    'total_alerts': alerts.total,
+                    'returned_alerts': len(alerts),
+                    'total_alerts': total,
                     'filters_applied': {
                         'severity': severity,
                         'status': status,
@@ -118,8 +156,9 @@ class AlertCreateAPI(Resource):
             if data['severity'] not in valid_severities:
                 return {'error': f'Invalid severity. Must be one of: {valid_severities}'}, 400
             
-            alert = Alert(
-                claim_id=claim.id,
+            # An open alert of the same type on this claim absorbs the detection
+            alert, created = record_detection(
+                claim.id,
                 alert_type=data['alert_type'],
                 severity=data['severity'],
                 affected_area_hectares=data.get('affected_area_hectares'),
@@ -127,14 +166,14 @@ class AlertCreateAPI(Resource):
                 alert_details=data.get('alert_details', {})
             )
             
-            db.session.add(alert)
             db.session.commit()
             
             return {
-                'message': 'Alert created successfully',
+                'message': 'Alert created successfully' if created else 'Alert merged into the open alert for this claim',
                 'alert_id': str(alert.id),
+                'created': created,
                 'alert': alert.to_dict()
-            }, 201
+            }, 201 if created else 200
             
         except Exception as e:
             db.session.rollback()
@@ -157,6 +196,20 @@ class AlertUpdateAPI(Resource):
                 valid_statuses = ['active', 'resolved', 'false_positive']
                 if data['status'] not in valid_statuses:
                     return {'error': f'Invalid status. Must be one of: {valid_statuses}'}, 400
+                
+                # Reopening must not create a second open incident of the same claim and type
+                if data['status'] == 'active' and alert.status != 'active':
+                    open_alert = Alert.query.filter(
+                        Alert.claim_id == alert.claim_id,
+                        Alert.alert_type == alert.alert_type,
+                        Alert.status == 'active',
+                        Alert.id != alert.id
+                    ).first()
+                    if open_alert:
+                        return {
+                            'error': f'Claim already has an open {alert.alert_type} alert',
+                            'open_alert_id': str(open_alert.id)
+                        }, 409
                 alert.status = data['status']
                 
                 if data['status'] == 'resolved':
@@ -178,105 +231,166 @@ class AlertUpdateAPI(Resource):
                 'alert': alert.to_dict()
             }, 200
             
+        except IntegrityError:
+            # Another request opened the incident between the check and the commit
+            db.session.rollback()
+            return {'error': 'Claim already has an open alert of this type'}, 409
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
 
+def compute_alert_stats(days):
+    """Alert statistics in two aggregate queries: totals/response times, then breakdowns"""
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    active = Alert.status == 'active'
+    
+    # NULL unless resolved with an authority response, so the aggregates skip other alerts
+    response_hours = case(
+        (Alert.status == 'resolved', func.extract('epoch', Alert.authority_response_date - Alert.detected_at) / 3600)
+    )
+    
+    overview = db.session.query(
+        func.count(Alert.id).label('total'),
+        func.count(Alert.id).filter(active).label('active'),
+        func.count(Alert.id).filter(Alert.status == 'resolved').label('resolved'),
+        func.count(Alert.id).filter(Alert.detected_at >= cutoff_date).label('recent'),
+        func.count(Alert.id).filter(
+            active, Alert.severity == 'critical', Alert.reported_to_authorities == False
+        ).label('critical_unreported'),
+        func.count(response_hours).label('responded'),
+        func.avg(response_hours).label('mean_hours'),
+        func.percentile_cont(0.5).within_group(response_hours).label('median_hours'),
+        func.percentile_cont(0.9).within_group(response_hours).label('p90_hours')
+    ).one()
+    
+    # Active alerts by severity, by type and by state in one pass
+    breakdowns = db.session.query(
+        func.grouping(Alert.severity).label('by_severity'),
+        func.grouping(Alert.alert_type).label('by_type'),
+        Alert.severity,
+        Alert.alert_type,
+        FRAClaim.state,
+        func.count(Alert.id).label('count')
+    ).join(FRAClaim).filter(active).group_by(
+        func.grouping_sets(tuple_(Alert.severity), tuple_(Alert.alert_type), tuple_(FRAClaim.state))
+    ).all()
+    
+    def hours(value):
+        return round(float(value), 2) if value is not None else 0
+    
+    critical_alerts = overview.critical_unreported
+    
+    return {
+        'overview': {
+            'total_alerts': overview.total,
+            'active_alerts': overview.active,
+            'resolved_alerts': overview.resolved,
+            'recent_alerts': overview.recent,
+            'resolution_rate': round((overview.resolved / overview.total * 100), 1) if overview.total > 0 else 0
+        },
+        'severity_breakdown': {
+            row.severity: int(row.count) for row in breakdowns if not row.by_severity
+        },
+        'type_breakdown': {
+            row.alert_type: int(row.count) for row in breakdowns if not row.by_type
+        },
+        'state_distribution': [
+            {
+                'state': row.state,
+                'alert_count': int(row.count)
+            }
+            for row in breakdowns if row.by_severity and row.by_type
+        ],
+        'response_metrics': {
+            'average_response_time_hours': hours(overview.mean_hours),
+            'median_response_time_hours': hours(overview.median_hours),
+            'p90_response_time_hours': hours(overview.p90_hours),
+            'critical_alerts_pending': critical_alerts,
+            'total_resolved_alerts': overview.responded
+        },
+        'urgent_attention': {
+            'critical_unreported': critical_alerts,
+            'requires_immediate_action': critical_alerts > 0
+        },
+        'period': {
+            'days': days,
+            'start_date': cutoff_date.isoformat(),
+            'end_date': datetime.utcnow().isoformat()
+        }
+    }
+
 class AlertStatsAPI(Resource):
     """GET /api/alerts/statistics - Alert statistics and trends"""
     
     def get(self):
         try:
             days = request.args.get('days', 30, type=int)
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            
-            total_alerts = Alert.query.count()
-            active_alerts = Alert.query.filter_by(status='active').count()
-            resolved_alerts = Alert.query.filter_by(status='resolved').count()
-            
-            recent_alerts = Alert.query.filter(
-                Alert.detected_at >= cutoff_date
-            ).count()
-            
-            severity_stats = db.session.query(
-                Alert.severity,
-                func.count(Alert.id).label('count')
-            ).filter(Alert.status == 'active').group_by(Alert.severity).all()
-            
-            type_stats = db.session.query(
-                Alert.alert_type,
-                func.count(Alert.id).label('count')
-            ).filter(Alert.status == 'active').group_by(Alert.alert_type).all()
-            
-            state_stats = db.session.query(
-                FRAClaim.state,
-                func.count(Alert.id).label('alert_count')
-            ).join(Alert).filter(
-                Alert.status == 'active'
-            ).group_by(FRAClaim.state).all()
-            
-            resolved_with_response = Alert.query.filter(
-                Alert.status == 'resolved',
-                Alert.authority_response_date.isnot(None),
-                Alert.detected_at.isnot(None)
-            ).all()
-            
-            response_times = []
-            for alert in resolved_with_response:
-                response_time = (alert.authority_response_date - alert.detected_at).total_seconds() / 3600  # hours
-                response_times.append(response_time)
-            
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-            
-            critical_alerts = Alert.query.filter(
-                Alert.status == 'active',
-                Alert.severity == 'critical',
-                Alert.reported_to_authorities == False
-            ).count()
             
-            result = {
-                'overview': {
-                    'total_alerts': total_alerts,
-                    'active_alerts': active_alerts,
-                    'resolved_alerts': resolved_alerts,
-                    'recent_alerts': recent_alerts,
-                    'resolution_rate': round((resolved_alerts / total_alerts * 100), 1) if total_alerts > 0 else 0
-                },
-                'severity_breakdown': {
-                    severity: int(count) for severity, count in severity_stats
-                },
-                'type_breakdown': {
-                    alert_type: int(count) for alert_type, count in type_stats
-                },
-                'state_distribution': [
-                    {
-                        'state': state,
-                        'alert_count': int(count)
-                    }
-                    for state, count in state_stats
-                ],
-                'response_metrics': {
-                    'average_response_time_hours': round(avg_response_time, 2),
-                    'critical_alerts_pending': critical_alerts,
-                    'total_resolved_alerts': len(resolved_with_response)
-                },
-                'urgent_attention': {
-                    'critical_unreported': critical_alerts,
-                    'requires_immediate_action': critical_alerts > 0
-                },
-                'period': {
-                    'days': days,
-                    'start_date': cutoff_date.isoformat(),
-                    'end_date': datetime.utcnow().isoformat()
-                }
-            }
+            # Recomputed only when alerts or claims change, shared by concurrent callers
+            result, cache_status = get_snapshot_cache().get_or_compute(
+                'alert_stats',
+                {'days': days},
+                ALERT_STATS_TABLES,
+                lambda: compute_alert_stats(days)
+            )
             
-            return result, 200
+            return result, 200, {'X-Cache': cache_status}
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class AlertStreamAPI(Resource):
+    """GET /api/alerts/stream - Server-Sent Events feed of created and updated alerts"""
+    
+    def get(self):
+        # Each open stream keeps a worker thread; beyond the cap, clients back off and retry
+        slots = stream_slots()
+        if not slots.acquire(blocking=False):
+            retry_after = current_app.config.get('ALERT_STREAM_RETRY_AFTER', 30)
+            return {'error': 'Too many open alert streams, retry later'}, 503, {'Retry-After': str(retry_after)}
+        
+        try:
+            severity = request.args.get('severity')
+            status = request.args.get('status')
+            
+            bus = get_event_bus()
+            heartbeat = current_app.config.get('ALERT_STREAM_HEARTBEAT', 15)
+            max_seconds = current_app.config.get('ALERT_STREAM_MAX_SECONDS', 300)
+            
+            # EventSource resends the last id it saw when it reconnects
+            last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or bus.latest_id()
+            
+            def stream(last_id):
+                # Clients reconnect after the connection is recycled, resuming from last_id
+                yield f'retry: {heartbeat * 1000}\n\n'
+                deadline = time.monotonic() + max_seconds
+                while time.monotonic() < deadline:
+                    events = bus.read(last_id, timeout=heartbeat)
+                    if not events:
+                        yield ': keep-alive\n\n'
+                        continue
+                    for event_id, event_type, payload in events:
+                        last_id = event_id
+                        if severity and payload.get('severity') != severity:
+                            continue
+                        if status and payload.get('status') != status:
+                            continue
+                        yield format_sse(event_id, event_type, payload)
+            
+            response = Response(stream(last_event_id), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # let nginx pass events through unbuffered
+            })
+            # The server closes the response when the stream ends or the client disconnects
+            response.call_on_close(slots.release)
+            return response
             
         except Exception as e:
+            slots.release()
             return {'error': str(e)}, 500
 
 api.add_resource(AlertsListAPI, '/')
 api.add_resource(AlertCreateAPI, '/create')
 api.add_resource(AlertUpdateAPI, '/<string:alert_id>')
 api.add_resource(AlertStatsAPI, '/statistics')
+api.add_resource(AlertStreamAPI, '/stream')
@@ -1,106 +1,120 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, current_app, Response, send_file, stream_with_context
 from flask_restful import Api, Resource
 from app import db
 from app.models import FRAClaim, MonitoringData, Alert
-from sqlalchemy import func, desc, extract
+from app.services.columnar import ARROW_MIMETYPE, negotiate_format, columnar_response
+from app.services.snapshot_cache import get_snapshot_cache
+from app.services.report_export import (
+    STREAM_FORMATS, export_report_query, report_columns, report_metadata, stream_arrow, stream_report
+)
+from app.services.spatial_export import SPATIAL_FORMATS, claims_version, find_cached_export
+from app.services.jobs import enqueue_job, job_accepted
+from app.services.analytics_rollups import METRIC_VALUES, timeseries
+from sqlalchemy import func, tuple_, case
 from datetime import datetime, timedelta
-import json
-import io
-import csv
+import os
 
 analytics_bp = Blueprint('analytics', __name__)
 api = Api(analytics_bp)
 
+# Tables whose writes invalidate the dashboard snapshot
+DASHBOARD_TABLES = ('fra_claims', 'alerts', 'monitoring_data')
+
+def compute_dashboard_stats(days):
+    """Dashboard payload in three aggregate queries (claims, alerts, monitoring)"""
+    cutoff_date = datetime.utcnow() - timedelta(days=days)
+    approved = FRAClaim.status == 'Approved'
+    
+    claims = db.session.query(
+        func.count(FRAClaim.id).label('total'),
+        func.count(FRAClaim.id).filter(approved).label('approved'),
+        func.count(FRAClaim.id).filter(FRAClaim.status == 'Pending').label('pending'),
+        func.count(FRAClaim.id).filter(FRAClaim.status == 'Under Review').label('under_review'),
+        func.count(FRAClaim.id).filter(FRAClaim.status == 'Rejected').label('rejected'),
+        func.count(FRAClaim.id).filter(FRAClaim.created_at >= cutoff_date).label('recent'),
+        func.coalesce(func.sum(FRAClaim.area_hectares), 0).label('total_area'),
+        func.coalesce(func.sum(FRAClaim.area_hectares).filter(approved), 0).label('approved_area'),
+        func.coalesce(func.sum(FRAClaim.claimant_families), 0).label('total_families'),
+        func.coalesce(func.sum(FRAClaim.claimant_families).filter(approved), 0).label('protected_families')
+    ).one()
+    
+    active = Alert.status == 'active'
+    alerts = db.session.query(
+        func.count(Alert.id).filter(active).label('active'),
+        func.count(Alert.id).filter(active, Alert.severity == 'critical').label('critical'),
+        func.count(Alert.id).filter(Alert.detected_at >= cutoff_date).label('recent')
+    ).one()
+    
+    # Every monitoring row references a claim, so no join is needed for coverage
+    monitoring = db.session.query(
+        func.count(func.distinct(MonitoringData.claim_id)).label('monitored_claims'),
+        func.avg(MonitoringData.ndvi_mean).filter(
+            MonitoringData.observation_date >= cutoff_date.date()
+        ).label('avg_ndvi')
+    ).one()
+    
+    total_claims = claims.total
+    total_area = float(claims.total_area)
+    approved_area = float(claims.approved_area)
+    total_families = int(claims.total_families)
+    protected_families = int(claims.protected_families)
+    monitoring_coverage = (monitoring.monitored_claims / total_claims * 100) if total_claims > 0 else 0
+    
+    system_health = {
+        'data_freshness': 'good',  
+        'alert_response_time': '< 2 hours',
+        'api_status': 'operational',
+        'database_status': 'healthy'
+    }
+    
+    return {
+        'overview': {
+            'total_claims': total_claims,
+            'approved_claims': claims.approved,
+            'pending_claims': claims.pending,
+            'under_review': claims.under_review,
+            'rejected_claims': claims.rejected,
+            'approval_rate': round((claims.approved / total_claims * 100), 1) if total_claims > 0 else 0,
+            'recent_claims': claims.recent
+        },
+        'area_statistics': {
+            'total_area_hectares': round(total_area, 2),
+            'approved_area_hectares': round(approved_area, 2),
+            'area_under_protection': round((approved_area / total_area * 100), 1) if total_area > 0 else 0
+        },
+        'community_impact': {
+            'total_families': total_families,
+            'protected_families': protected_families,
+            'families_coverage': round((protected_families / total_families * 100), 1) if total_families > 0 else 0
+        },
+        'environmental_monitoring': {
+            'active_alerts': alerts.active,
+            'critical_alerts': alerts.critical,
+            'recent_alerts': alerts.recent,
+            'monitoring_coverage': round(monitoring_coverage, 1),
+            'average_ndvi': round(monitoring.avg_ndvi, 3) if monitoring.avg_ndvi else None
+        },
+        'system_health': system_health,
+        'generated_at': datetime.utcnow().isoformat(),
+        'period_days': days
+    }
+
 class DashboardStatsAPI(Resource):
     """GET /api/analytics/dashboard - Comprehensive dashboard statistics"""
     
     def get(self):
         try:
-
             days = request.args.get('days', 30, type=int)
-            cutoff_date = datetime.utcnow() - timedelta(days=days)
-            
-
-            total_claims = FRAClaim.query.count()
-            approved_claims = FRAClaim.query.filter_by(status='Approved').count()
-            pending_claims = FRAClaim.query.filter_by(status='Pending').count()
-            under_review = FRAClaim.query.filter_by(status='Under Review').count()
-            rejected_claims = FRAClaim.query.filter_by(status='Rejected').count()
-            
-            recent_claims = FRAClaim.query.filter(
-                FRAClaim.created_at >= cutoff_date
-            ).count()
-            
-            total_area = db.session.query(func.sum(FRAClaim.area_hectares)).scalar() or 0
-            approved_area = db.session.query(func.sum(FRAClaim.area_hectares)).filter_by(
-                status='Approved'
-            ).scalar() or 0
-            
-            total_families = db.session.query(func.sum(FRAClaim.claimant_families)).scalar() or 0
-            protected_families = db.session.query(func.sum(FRAClaim.claimant_families)).filter_by(
-                status='Approved'
-            ).scalar() or 0
-            
-            active_alerts = Alert.query.filter_by(status='active').count()
-            critical_alerts = Alert.query.filter(
-                Alert.status == 'active',
-                Alert.severity == 'critical'
-            ).count()
             
-            recent_alerts = Alert.query.filter(
-                Alert.detected_at >= cutoff_date
-            ).count()
+            # One computation per data version and window, shared by every concurrent viewer
+            result, cache_status = get_snapshot_cache().get_or_compute(
+                'dashboard',
+                {'days': days},
+                DASHBOARD_TABLES,
+                lambda: compute_dashboard_stats(days)
+            )
             
-            monitored_claims = db.session.query(FRAClaim.id).join(MonitoringData).distinct().count()
-            monitoring_coverage = (monitored_claims / total_claims * 100) if total_claims > 0 else 0
-            
-            recent_monitoring = db.session.query(
-                func.avg(MonitoringData.ndvi_mean).label('avg_ndvi')
-            ).filter(
-                MonitoringData.observation_date >= cutoff_date.date(),
-                MonitoringData.ndvi_mean.isnot(None)
-            ).scalar()
-            
-            system_health = {
-                'data_freshness': 'good',  
-                'alert_response_time': '< 2 hours',
-                'api_status': 'operational',
-                'database_status': 'healthy'
-            }
-            
-            result = {
-                'overview': {
-                    'total_claims': total_claims,
-                    'approved_claims': approved_claims,
-                    'pending_claims': pending_claims,
-                    'under_review': under_review,
-                    'rejected_claims': rejected_claims,
-                    'approval_rate': round((approved_claims / total_claims * 100), 1) if total_claims > 0 else 0,
-                    'recent_claims': recent_claims
-                },
-                'area_statistics': {
-                    'total_area_hectares': round(total_area, 2),
-                    'approved_area_hectares': round(approved_area, 2),
-                    'area_under_protection': round((approved_area / total_area * 100), 1) if total_area > 0 else 0
-                },
-                'community_impact': {
-                    'total_families': int(total_families),
-                    'protected_families': int(protected_families),
-                    'families_coverage': round((protected_families / total_families * 100), 1) if total_families > 0 else 0
-                },
-                'environmental_monitoring': {
-                    'active_alerts': active_alerts,
-                    'critical_alerts': critical_alerts,
-                    'recent_alerts': recent_alerts,
-                    'monitoring_coverage': round(monitoring_coverage, 1),
-                    'average_ndvi': round(recent_monitoring, 3) if recent_monitoring else None
-                },
-                'system_health': system_health,
-                'generated_at': datetime.utcnow().isoformat(),
-                'period_days': days
-            }
-            
-            return result, 200
+            return result, 200, {'X-Cache': cache_status}
             
         except Exception as e:
             return {'error': str(e)}, 500
@@ -110,68 +124,83 @@ class PerformanceMetricsAPI(Resource):
     
     def get(self):
         try:
-            processing_times = db.session.query(
-                FRAClaim.application_date,
-                FRAClaim.approval_date,
-                FRAClaim.status
-            ).filter(
-                FRAClaim.approval_date.isnot(None)
-            ).all()
+            sla_threshold = current_app.config.get('PROCESSING_SLA_DAYS', 90)
             
-            processing_days = []
-            for app_date, approval_date, status in processing_times:
-                if app_date and approval_date:
-                    days = (approval_date - app_date).days
-                    processing_days.append(days)
+            # Whole days, as (approval - application).days; NULL for claims without an
+            # approval date, which every aggregate below ignores
+            processing_days = func.date_part('day', FRAClaim.approval_date - FRAClaim.application_date)
+            # Monthly trends cover approved claims only; others land in the NULL month group, which is dropped
+            approval_month = case(
+                (FRAClaim.status == 'Approved', func.date_trunc('month', FRAClaim.approval_date))
+            )
             
-            avg_processing_time = sum(processing_days) / len(processing_days) if processing_days else 0
+            # Overall, per-state and per-approval-month metrics in one pass over the claims
+            rows = db.session.query(
+                func.grouping(FRAClaim.state).label('by_state'),
+                func.grouping(approval_month).label('by_month'),
+                FRAClaim.state,
+                approval_month.label('month'),
+                func.count(FRAClaim.id).label('total'),
+                func.count(FRAClaim.id).filter(FRAClaim.status == 'Approved').label('approved'),
+                func.count(processing_days).label('processed'),
+                func.count(processing_days).filter(processing_days <= sla_threshold).label('within_sla'),
+                func.avg(processing_days).label('avg_days'),
+                func.percentile_cont(0.5).within_group(processing_days).label('p50_days'),
+                func.percentile_cont(0.9).within_group(processing_days).label('p90_days'),
+                func.percentile_cont(0.99).within_group(processing_days).label('p99_days')
+            ).group_by(
+                func.grouping_sets(tuple_(), tuple_(FRAClaim.state), tuple_(approval_month))
+            ).all()
             
-            sla_threshold = 90
-            within_sla = len([d for d in processing_days if d <= sla_threshold])
-            sla_compliance = (within_sla / len(processing_days) * 100) if processing_days else 0
+            def processing(row):
+                if row is None or not row.processed:
+                    return {
+                        'average_processing_days': 0,
+                        'p50_processing_days': 0,
+                        'p90_processing_days': 0,
+                        'p99_processing_days': 0,
+                        'sla_compliance_percentage': 0
+                    }
+                return {
+                    'average_processing_days': round(float(row.avg_days), 1),
+                    'p50_processing_days': round(float(row.p50_days), 1),
+                    'p90_processing_days': round(float(row.p90_days), 1),
+                    'p99_processing_days': round(float(row.p99_days), 1),
+                    'sla_compliance_percentage': round(row.within_sla / row.processed * 100, 1)
+                }
             
-            monthly_approvals = db.session.query(
-                extract('year', FRAClaim.approval_date).label('year'),
-                extract('month', FRAClaim.approval_date).label('month'),
-                func.count(FRAClaim.id).label('approvals')
-            ).filter(
-                FRAClaim.status == 'Approved',
-                FRAClaim.approval_date.isnot(None)
-            ).group_by('year', 'month').order_by('year', 'month').all()
+            overall = next((row for row in rows if row.by_state and row.by_month), None)
+            state_rows = sorted((row for row in rows if not row.by_state), key=lambda row: row.state or '')
+            month_rows = sorted((row for row in rows if not row.by_month and row.month is not None), key=lambda row: row.month)
             
-            state_performance = db.session.query(
-                FRAClaim.state,
-                func.count(FRAClaim.id).label('total'),
-                func.sum(func.case([(FRAClaim.status == 'Approved', 1)], else_=0)).label('approved'),
-                func.avg(
-                    func.extract('epoch', FRAClaim.approval_date - FRAClaim.application_date) / 86400
-                ).label('avg_days')
-            ).group_by(FRAClaim.state).all()
+            overall_metrics = processing(overall)
+            avg_processing_time = overall_metrics['average_processing_days']
+            sla_compliance = overall_metrics['sla_compliance_percentage']
             
             result = {
                 'processing_metrics': {
-                    'average_processing_days': round(avg_processing_time, 1),
-                    'sla_compliance_percentage': round(sla_compliance, 1),
+                    **overall_metrics,
                     'sla_threshold_days': sla_threshold,
-                    'total_processed_claims': len(processing_days)
+                    'total_processed_claims': overall.processed if overall else 0
                 },
                 'monthly_trends': [
                     {
-                        'year': int(year),
-                        'month': int(month),
-                        'approvals': int(approvals)
+                        'year': row.month.year,
+                        'month': row.month.month,
+                        'approvals': row.approved,
+                        **processing(row)
                     }
-                    for year, month, approvals in monthly_approvals
+                    for row in month_rows
                 ],
                 'state_performance': [
                     {
-                        'state': state,
-                        'total_claims': int(total),
-                        'approved_claims': int(approved or 0),
-                        'approval_rate': round((approved or 0) / total * 100, 1),
-                        'average_processing_days': round(float(avg_days or 0), 1)
+                        'state': row.state,
+                        'total_claims': row.total,
+                        'approved_claims': row.approved,
+                        'approval_rate': round(row.approved / row.total * 100, 1),
+                        **processing(row)
                     }
-                    for state, total, approved, avg_days in state_performance
+                    for row in state_rows
                 ],
                 'performance_indicators': {
                     'efficiency_score': min(100, round(sla_compliance, 0)),
@@ -185,119 +214,134 @@ class PerformanceMetricsAPI(Resource):
         except Exception as e:
             return {'error': str(e)}, 500
 
+class TimeSeriesAPI(Resource):
+    """GET /api/analytics/timeseries - Claims, approvals, alerts or NDVI per time bucket"""
+    
+    def get(self):
+        try:
+            metric = request.args.get('metric', 'claims')
+            bucket = request.args.get('bucket', 'month')
+            group_by = [column for column in request.args.get('group_by', '').split(',') if column]
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            filters = {
+                column: request.args[column]
+                for column in ('state', 'district', 'status')
+                if request.args.get(column)
+            }
+            
+            # Served from the rollups, so the cost follows buckets x groups, not row counts
+            rows = timeseries(
+                metric, bucket, group_by,
+                start=datetime.fromisoformat(start_date).date() if start_date else None,
+                end=datetime.fromisoformat(end_date).date() if end_date else None,
+                filters=filters
+            )
+            value_name, report_mean = METRIC_VALUES[metric]
+            
+            series = {}
+            for row in rows:
+                period, *groups, count, value_sum = row
+                entry = series.setdefault(tuple(groups), {
+                    'group': dict(zip(group_by, groups)),
+                    'periods': [],
+                    'count': [],
+                    value_name: []
+                })
+                entry['periods'].append(period.isoformat())
+                entry['count'].append(int(count))
+                value = value_sum / count if report_mean else value_sum
+                entry[value_name].append(round(float(value), 4))
+            
+            return {
+                'metric': metric,
+                'bucket': bucket,
+                'group_by': group_by,
+                'filters': filters,
+                'value': f'mean_{value_name}' if report_mean else f'total_{value_name}',
+                'series': list(series.values())
+            }, 200
+            
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
 class ExportReportAPI(Resource):
     """GET /api/analytics/export - Export comprehensive report"""
     
     def get(self):
         try:
-            format_type = request.args.get('format', 'json')  
+            format_type = request.args.get('format')
             
-            if format_type not in ['json', 'csv']:
-                return {'error': 'Invalid format. Use json or csv'}, 400
+            if format_type is None or format_type in ['arrow', 'npz']:
+                format_type = negotiate_format(request, format_type)
+            elif format_type not in ['json', 'csv', 'ndjson', 'fgb', 'gpkg']:
+                return {'error': 'Invalid format. Use json, csv, ndjson, arrow, npz, fgb or gpkg'}, 400
             
-            claims_data = db.session.query(
-                FRAClaim.claim_id,
-                FRAClaim.village_name,
-                FRAClaim.district,
-                FRAClaim.state,
-                FRAClaim.area_hectares,
-                FRAClaim.status,
-                FRAClaim.claimant_families,
-                FRAClaim.application_date,
-                FRAClaim.approval_date
-            ).all()
+            # Spatial layers are built by the worker once per state and data version
+            if format_type in SPATIAL_FORMATS:
+                # States match case-insensitively, so the cache key does too
+                state = (request.args.get('state') or '').strip().lower()
+                state = None if state in ('', 'all') else state
+                params = {'format': format_type, 'state': state or 'all', 'version': claims_version(state)}
+                
+                job = find_cached_export(params)
+                if job and job.status == 'succeeded' and job.result_path and os.path.exists(job.result_path):
+                    return send_file(
+                        os.path.abspath(job.result_path),
+                        mimetype=SPATIAL_FORMATS[format_type][1],
+                        as_attachment=True,
+                        download_name=os.path.basename(job.result_path),
+                        conditional=True
+                    )
+                if job is None or job.status == 'succeeded':
+                    job = enqueue_job('spatial_export', params)
+                return job_accepted(job)
             
-            latest_monitoring = db.session.query(
-                FRAClaim.claim_id,
-                MonitoringData.ndvi_mean,
-                MonitoringData.observation_date
-            ).join(MonitoringData).order_by(
-                FRAClaim.claim_id, 
-                desc(MonitoringData.observation_date)
-            ).distinct(FRAClaim.claim_id).all()
+            batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+            filename = f'fra_atlas_report_{datetime.utcnow().strftime("%Y%m%d")}'
+            metadata = report_metadata()
             
-            active_alerts = db.session.query(
-                FRAClaim.claim_id,
-                Alert.alert_type,
-                Alert.severity,
-                Alert.detected_at
-            ).join(Alert).filter(Alert.status == 'active').all()
+            # Large text exports run as a background job; poll /api/jobs/<id> for the file
+            run_async = request.args.get('async')
+            if run_async is None:
+                run_async = metadata['total_claims'] > current_app.config.get('EXPORT_ASYNC_THRESHOLD', 20000)
+            else:
+                run_async = run_async.lower() in ['true', '1']
+            if run_async and format_type in STREAM_FORMATS:
+                return job_accepted(enqueue_job('export_report', {'format': format_type}))
             
-            report_data = []
-            monitoring_dict = {claim_id: (ndvi, date) for claim_id, ndvi, date in latest_monitoring}
-            alerts_dict = {}
-            for claim_id, alert_type, severity, detected_at in active_alerts:
-                if claim_id not in alerts_dict:
-                    alerts_dict[claim_id] = []
-                alerts_dict[claim_id].append({
-                    'type': alert_type,
-                    'severity': severity,
-                    'detected_at': detected_at.isoformat()
-                })
+            # Arrow streams one record batch per cursor batch; .npz is a zip archive
+            # that must be built whole, so it is only offered up to EXPORT_NPZ_MAX_ROWS
+            if format_type == 'arrow':
+                rows = export_report_query(include_alert_details=False).yield_per(batch_size)
+                response = Response(stream_with_context(stream_arrow(rows, batch_size, metadata)),
+                                    mimetype=ARROW_MIMETYPE)
+                response.headers['Vary'] = 'Accept'
+                response.headers['Content-Disposition'] = f'attachment; filename={filename}.arrow'
+                return response
             
-            for claim in claims_data:
-                claim_id = claim.claim_id
-                ndvi_data = monitoring_dict.get(claim_id, (None, None))
-                alerts = alerts_dict.get(claim_id, [])
-                
-                report_data.append({
-                    'claim_id': claim_id,
-                    'village_name': claim.village_name,
-                    'district': claim.district,
-                    'state': claim.state,
-                    'area_hectares': float(claim.area_hectares),
-                    'status': claim.status,
-                    'claimant_families': claim.claimant_families,
-                    'application_date': claim.application_date.isoformat() if claim.application_date else None,
-                    'approval_date': claim.approval_date.isoformat() if claim.approval_date else None,
-                    'latest_ndvi': float(ndvi_data[0]) if ndvi_data[0] else None,
-                    'last_monitored': ndvi_data[1].isoformat() if ndvi_data[1] else None,
-                    'active_alerts': len(alerts),
-                    'alert_details': alerts
-                })
+            if format_type == 'npz':
+                max_rows = current_app.config.get('EXPORT_NPZ_MAX_ROWS', 100000)
+                if metadata['total_claims'] > max_rows:
+                    return {'error': f'npz exports are limited to {max_rows} claims; use arrow, csv or ndjson'}, 400
+                rows = export_report_query(include_alert_details=False).all()
+                return columnar_response(report_columns(rows), format_type, metadata=metadata, filename=filename)
             
-            if format_type == 'json':
-                return {
-                    'report_metadata': {
-                        'generated_at': datetime.utcnow().isoformat(),
-                        'total_claims': len(report_data),
-                        'report_type': 'comprehensive_fra_analysis'
-                    },
-                    'claims_data': report_data
-                }, 200
+            # Server-side cursor: rows are fetched batch_size at a time while the response streams
+            mimetype, extension = STREAM_FORMATS[format_type]
+            body = stream_report(format_type, batch_size, metadata)
             
-            elif format_type == 'csv':
-                output = io.StringIO()
-                writer = csv.writer(output)
-                
-                headers = [
-                    'claim_id', 'village_name', 'district', 'state', 
-                    'area_hectares', 'status', 'claimant_families',
-                    'application_date', 'approval_date', 'latest_ndvi',
-                    'last_monitored', 'active_alerts'
-                ]
-                writer.writerow(headers)
-                
-                for row in report_data:
-                    writer.writerow([
-                        row['claim_id'], row['village_name'], row['district'],
-                        row['state'], row['area_hectares'], row['status'],
-                        row['claimant_families'], row['application_date'],
-                        row['approval_date'], row['latest_ndvi'],
-                        row['last_monitored'], row['active_alerts']
-                    ])
-                
-                output.seek(0)
-                return send_file(
-                    io.BytesIO(output.getvalue().encode()),
-                    mimetype='text/csv',
-                    as_attachment=True,
-                    download_name=f'fra_atlas_report_{datetime.utcnow().strftime("%Y%m%d")}.csv'
-                )
+            response = Response(stream_with_context(body), mimetype=mimetype)
+            if format_type != 'json':
+                response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+            return response
             
         except Exception as e:
             return {'error': str(e)}, 500
 
 api.add_resource(DashboardStatsAPI, '/dashboard')
 api.add_resource(PerformanceMetricsAPI, '/performance')
+api.add_resource(TimeSeriesAPI, '/timeseries')
 api.add_resource(ExportReportAPI, '/export')
@@ -0,0 +1,65 @@
+"""
+Job API Routes
+Background job status polling and result download
+"""
+
+from flask import Blueprint, send_file
+from flask_restful import Api, Resource
+from app import db
+from app.models import Job
+import os
+import uuid
+
+jobs_bp = Blueprint('jobs', __name__)
+api = Api(jobs_bp)
+
+def get_job(job_id):
+    try:
+        return db.session.get(Job, uuid.UUID(job_id))
+    except ValueError:
+        return None
+
+class JobStatusAPI(Resource):
+    """GET /api/jobs/<job_id> - Status and progress of a background job"""
+    
+    def get(self, job_id):
+        try:
+            job = get_job(job_id)
+            if not job:
+                return {'error': 'Job not found'}, 404
+            
+            result = job.to_dict()
+            if job.status == 'succeeded' and job.result_path:
+                result['result_url'] = f'/api/jobs/{job.id}/result'
+            
+            return result, 200
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class JobResultAPI(Resource):
+    """GET /api/jobs/<job_id>/result - Download the result file of a finished job"""
+    
+    def get(self, job_id):
+        try:
+            job = get_job(job_id)
+            if not job:
+                return {'error': 'Job not found'}, 404
+            
+            if job.status != 'succeeded':
+                return {'error': f'Job is {job.status}', 'status_url': f'/api/jobs/{job.id}'}, 409
+            
+            if not job.result_path or not os.path.exists(job.result_path):
+                return {'error': 'Job has no result file'}, 404
+            
+            return send_file(
+                os.path.abspath(job.result_path),
+                as_attachment=True,
+                download_name=os.path.basename(job.result_path)
+            )
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+api.add_resource(JobStatusAPI, '/<string:job_id>')
+api.add_resource(JobResultAPI, '/<string:job_id>/result')
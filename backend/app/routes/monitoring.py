@@ -3,17 +3,73 @@ Monitoring API Routes
 Satellite monitoring and NDVI analysis endpoints
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_restful import Api, Resource
 from app import db
-from app.models import FRAClaim, MonitoringData, Alert
+from app.models import FRAClaim, MonitoringData, Alert, ClaimNDVIStats, MonitoringRollup, NDVIForecast
 from app.services.ndvi_processor import NDVIProcessor
-from sqlalchemy import func, desc
+from app.services.anomaly_detector import StreamingAnomalyDetector
+from app.services.change_detection import RasterChangeDetector, RasterUnavailable, iter_raster_blocks, to_wgs84
+from app.services.cache import LRUCache
+from app.services.compositing import TemporalCompositor
+from app.services.rollups import RESOLUTIONS, choose_resolution, expected_raw_points, period_start
+from app.services.ingestion import ingest_observation, missing_fields
+from app.services.alert_incidents import record_detection
+from app.services.jobs import enqueue_job, job_accepted, stage_job_input
+from app.services.columnar import negotiate_format, columnar_response, json_column, json_records, to_column
+from itertools import groupby
+from sqlalchemy import func, desc, and_
+from sqlalchemy.orm import contains_eager
 from datetime import datetime, timedelta
+import numpy as np
 import json
+import math
+import uuid
 
 monitoring_bp = Blueprint('monitoring', __name__)
 api = Api(monitoring_bp)
+ndvi_processor = NDVIProcessor()
+
+def get_analysis_cache():
+    """Per-app LRU cache of full NDVIProcessor analyses"""
+    if 'analysis_cache' not in current_app.extensions:
+        current_app.extensions['analysis_cache'] = LRUCache(current_app.config.get('ANALYSIS_CACHE_SIZE', 1024))
+    return current_app.extensions['analysis_cache']
+
+def data_version(stats):
+    """Version of a claim's monitoring history; changes whenever an observation is ingested"""
+    if stats is None:
+        return None
+    return (stats.observation_count, stats.updated_at.isoformat() if stats.updated_at else None)
+
+def run_claim_analysis(claim, stats, series, method, penalty):
+    """Full NDVIProcessor analysis plus recommendations for one claim, cached by data version"""
+    cache = get_analysis_cache()
+    key = (str(claim.id), data_version(stats), method, penalty)
+    
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, True
+    
+    if series is None:
+        series = db.session.query(
+            MonitoringData.observation_date,
+            MonitoringData.ndvi_mean
+        ).filter(
+            MonitoringData.claim_id == claim.id,
+            MonitoringData.ndvi_mean.isnot(None)
+        ).order_by(MonitoringData.observation_date).all()
+    
+    analysis = ndvi_processor.process_time_series(
+        [{'date': observation_date, 'ndvi': ndvi} for observation_date, ndvi in series],
+        change_point_method=method,
+        penalty=penalty
+    )
+    if 'error' not in analysis:
+        analysis['recommendations'] = ndvi_processor.generate_alert_recommendation(analysis)
+    
+    cache.set(key, analysis)
+    return analysis, False
 
 class NDVIAnalysisAPI(Resource):
     """GET /api/monitoring/ndvi/<claim_id> - Get NDVI analysis for a claim"""
@@ -38,15 +94,94 @@ class NDVIAnalysisAPI(Resource):
             else:
                 end_date = datetime.utcnow()
             
-            # Get monitoring data
-            monitoring_data = MonitoringData.query.filter(
-                MonitoringData.claim_id == claim.id,
-                MonitoringData.observation_date >= start_date.date(),
-                MonitoringData.observation_date <= end_date.date()
-            ).order_by(MonitoringData.observation_date).all()
+            response_format = negotiate_format(request, request.args.get('format'))
             
-            # Calculate statistics
-            ndvi_values = [data.ndvi_mean for data in monitoring_data if data.ndvi_mean is not None]
+            # Long ranges read weekly/monthly rollups instead of every raw observation
+            composite_window = request.args.get('composite')
+            max_points = request.args.get('max_points', current_app.config.get('MONITORING_POINT_BUDGET', 120), type=int)
+            resolution = request.args.get('resolution')
+            if composite_window:
+                resolution = 'raw'
+            elif resolution is None:
+                resolution = choose_resolution(
+                    start_date.date(), end_date.date(), max_points,
+                    expected_raw_points(claim.ndvi_stats, start_date.date(), end_date.date())
+                )
+            elif resolution not in RESOLUTIONS:
+                return {'error': f'Invalid resolution. Must be one of: {list(RESOLUTIONS)}'}, 400
+            
+            raw_observations = None
+            if resolution == 'raw':
+                monitoring_data = MonitoringData.query.filter(
+                    MonitoringData.claim_id == claim.id,
+                    MonitoringData.observation_date >= start_date.date(),
+                    MonitoringData.observation_date <= end_date.date()
+                ).order_by(MonitoringData.observation_date).all()
+                raw_observations = len(monitoring_data)
+                
+                # Optional regular-grid composite replaces the raw, cloud-affected series
+                if composite_window:
+                    compositor = TemporalCompositor(
+                        window=composite_window,
+                        min_quality=request.args.get('min_quality', 0.0, type=float),
+                        gap_fill=request.args.get('gap_fill', 'linear')
+                    )
+                    composite = compositor.composite(
+                        np.zeros(len(monitoring_data), dtype=np.int64),
+                        np.array([data.observation_date for data in monitoring_data], dtype='datetime64[D]'),
+                        np.array([data.ndvi_mean if data.ndvi_mean is not None else np.nan for data in monitoring_data]),
+                        1,
+                        data_quality=np.array([data.data_quality_score if data.data_quality_score is not None else np.nan for data in monitoring_data]),
+                        cloud_cover=np.array([data.cloud_cover_percentage if data.cloud_cover_percentage is not None else np.nan for data in monitoring_data]),
+                        start=np.datetime64(start_date.date()),
+                        end=np.datetime64(end_date.date())
+                    )
+                    observed = ~np.isnan(composite['values'][0])
+                    columns = {
+                        'date': composite['dates'][observed],
+                        'ndvi_mean': np.round(composite['values'][0][observed], 4),
+                        'observations': composite['observations'][0][observed],
+                        'gap_filled': composite['filled'][0][observed]
+                    }
+                    ndvi_values = columns['ndvi_mean'].tolist()
+                else:
+                    columns = {
+                        'date': to_column([data.observation_date for data in monitoring_data], 'datetime64[D]'),
+                        'ndvi_mean': to_column([data.ndvi_mean for data in monitoring_data], float),
+                        'ndvi_min': to_column([data.ndvi_min for data in monitoring_data], float),
+                        'ndvi_max': to_column([data.ndvi_max for data in monitoring_data], float),
+                        'satellite_source': to_column([data.satellite_source for data in monitoring_data]),
+                        'cloud_cover': to_column([data.cloud_cover_percentage for data in monitoring_data], float)
+                    }
+                    ndvi_values = [data.ndvi_mean for data in monitoring_data if data.ndvi_mean is not None]
+                
+                point_count = len(ndvi_values)
+                mean_ndvi = sum(ndvi_values) / len(ndvi_values) if ndvi_values else None
+                min_ndvi = min(ndvi_values) if ndvi_values else None
+                max_ndvi = max(ndvi_values) if ndvi_values else None
+            else:
+                # Periods overlapping the range; edge periods are included whole
+                rollups = MonitoringRollup.query.filter(
+                    MonitoringRollup.claim_id == claim.id,
+                    MonitoringRollup.resolution == resolution,
+                    MonitoringRollup.period_start >= period_start(resolution, start_date.date()),
+                    MonitoringRollup.period_start <= end_date.date()
+                ).order_by(MonitoringRollup.period_start).all()
+                
+                columns = {
+                    'date': to_column([rollup.period_start for rollup in rollups], 'datetime64[D]'),
+                    'ndvi_mean': np.round(to_column([rollup.ndvi_mean if rollup.observation_count else None for rollup in rollups], float), 4),
+                    'ndvi_min': to_column([rollup.ndvi_min for rollup in rollups], float),
+                    'ndvi_max': to_column([rollup.ndvi_max for rollup in rollups], float),
+                    'ndvi_std': np.round(to_column([rollup.ndvi_std if rollup.observation_count else None for rollup in rollups], float), 4),
+                    'observations': np.array([rollup.observation_count for rollup in rollups], dtype=np.int64)
+                }
+                ndvi_values = [rollup.ndvi_mean for rollup in rollups if rollup.observation_count]
+                
+                point_count = sum(rollup.observation_count for rollup in rollups)
+                mean_ndvi = sum(rollup.ndvi_sum for rollup in rollups) / point_count if point_count else None
+                min_ndvi = min(rollup.ndvi_min for rollup in rollups) if rollups else None
+                max_ndvi = max(rollup.ndvi_max for rollup in rollups) if rollups else None
             
             if not ndvi_values:
                 return {
@@ -59,12 +194,12 @@ class NDVIAnalysisAPI(Resource):
                 }, 200
             
             stats = {
-                'mean_ndvi': round(sum(ndvi_values) / len(ndvi_values), 3),
-                'min_ndvi': round(min(ndvi_values), 3),
-                'max_ndvi': round(max(ndvi_values), 3),
+                'mean_ndvi': round(mean_ndvi, 3),
+                'min_ndvi': round(min_ndvi, 3),
+                'max_ndvi': round(max_ndvi, 3),
                 'latest_ndvi': round(ndvi_values[-1], 3),
                 'trend': 'improving' if ndvi_values[-1] > ndvi_values[0] else 'degrading',
-                'data_points': len(ndvi_values)
+                'data_points': point_count
             }
             
             # Check for alerts
@@ -89,27 +224,171 @@ class NDVIAnalysisAPI(Resource):
                     'start_date': start_date.isoformat(),
                     'end_date': end_date.isoformat()
                 },
+                'resolution': resolution,
                 'ndvi_statistics': stats,
+                'lifetime_statistics': claim.ndvi_stats.to_dict() if claim.ndvi_stats else None,
                 'vegetation_status': current_status,
                 'thresholds': {
                     'alert_threshold': alert_threshold,
                     'critical_threshold': critical_threshold
                 },
-                'time_series': [
-                    {
-                        'date': data.observation_date.isoformat(),
-                        'ndvi_mean': data.ndvi_mean,
-                        'ndvi_min': data.ndvi_min,
-                        'ndvi_max': data.ndvi_max,
-                        'satellite_source': data.satellite_source,
-                        'cloud_cover': data.cloud_cover_percentage
-                    }
-                    for data in monitoring_data
-                ]
+                'composite': {
+                    'window': composite_window,
+                    'gap_fill': compositor.gap_fill,
+                    'raw_observations': raw_observations
+                } if composite_window else None
             }
             
+            # Binary consumers get the series as column arrays, the rest as metadata
+            if response_format != 'json':
+                return columnar_response(columns, response_format, metadata=result)
+            
+            result['time_series'] = json_records(columns)
             return result, 200
             
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class NDVIComparisonAPI(Resource):
+    """GET /api/monitoring/ndvi - NDVI series of many claims aligned on one date grid"""
+    
+    def get(self):
+        try:
+            claim_ids = [cid.strip() for cid in request.args.get('claim_ids', '').split(',') if cid.strip()]
+            district = request.args.get('district')
+            state = request.args.get('state')
+            grid = request.args.get('grid', 'observed')
+            if not claim_ids and not district:
+                return {'error': 'Provide claim_ids or district'}, 400
+            
+            max_claims = current_app.config.get('NDVI_COMPARISON_MAX_CLAIMS', 200)
+            if len(claim_ids) > max_claims:
+                return {'error': f'At most {max_claims} claims can be compared at once'}, 400
+            
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            start_date = datetime.fromisoformat(start_date.replace('Z', '+00:00')) if start_date else datetime.utcnow() - timedelta(days=365)
+            end_date = datetime.fromisoformat(end_date.replace('Z', '+00:00')) if end_date else datetime.utcnow()
+            
+            # Claims and their in-range observations in one round trip; claims without
+            # observations still come back as a single row with a NULL date
+            query = db.session.query(
+                FRAClaim.claim_id,
+                FRAClaim.village_name,
+                FRAClaim.district,
+                MonitoringData.observation_date,
+                MonitoringData.ndvi_mean
+            ).outerjoin(
+                MonitoringData, and_(
+                    MonitoringData.claim_id == FRAClaim.id,
+                    MonitoringData.observation_date >= start_date.date(),
+                    MonitoringData.observation_date <= end_date.date(),
+                    MonitoringData.ndvi_mean.isnot(None)
+                )
+            )
+            if claim_ids:
+                query = query.filter(FRAClaim.claim_id.in_(claim_ids))
+            if district:
+                query = query.filter(FRAClaim.district.ilike(district))
+            if state:
+                query = query.filter(FRAClaim.state.ilike(f'%{state}%'))
+            
+            rows = query.order_by(FRAClaim.claim_id, MonitoringData.observation_date).all()
+            
+            claims = {}
+            for claim_id, village_name, claim_district, _, _ in rows:
+                claims.setdefault(claim_id, {'village_name': village_name, 'district': claim_district})
+            if not claims:
+                return {'error': 'No claims found'}, 404
+            if len(claims) > max_claims:
+                return {'error': f'At most {max_claims} claims can be compared at once; narrow the filter'}, 400
+            
+            order = {claim_id: index for index, claim_id in enumerate(claims)}
+            observed = [row for row in rows if row[3] is not None]
+            claim_index = np.array([order[row[0]] for row in observed], dtype=np.int64)
+            dates = np.array([row[3] for row in observed], dtype='datetime64[D]')
+            values = np.array([row[4] for row in observed], dtype=float)
+            
+            if grid == 'observed':
+                # Union of observation dates; same-day duplicates are averaged
+                grid_dates, date_index = np.unique(dates, return_inverse=True)
+                cells = claim_index * grid_dates.size + date_index
+                size = len(claims) * grid_dates.size
+                counts = np.bincount(cells, minlength=size)
+                sums = np.bincount(cells, weights=values, minlength=size)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    matrix = np.where(counts > 0, sums / counts, np.nan).reshape(len(claims), grid_dates.size)
+            else:
+                compositor = TemporalCompositor(window=grid, gap_fill=request.args.get('gap_fill', 'none'))
+                composite = compositor.composite(
+                    claim_index, dates, values, len(claims),
+                    start=np.datetime64(start_date.date()),
+                    end=np.datetime64(end_date.date())
+                )
+                grid_dates, matrix = composite['dates'], composite['values']
+            
+            matrix = np.round(matrix, 4)
+            metadata = {
+                'period': {
+                    'start_date': start_date.isoformat(),
+                    'end_date': end_date.isoformat()
+                },
+                'grid': grid,
+                'claims': claims,
+                'missing_claim_ids': [claim_id for claim_id in claim_ids if claim_id not in claims]
+            }
+            
+            # Binary consumers get one 'date' column plus one column per claim
+            response_format = negotiate_format(request, request.args.get('format'))
+            if response_format != 'json':
+                columns = {'date': grid_dates}
+                columns.update((claim_id, matrix[index]) for claim_id, index in order.items())
+                return columnar_response(columns, response_format, metadata=metadata)
+            
+            return {
+                **metadata,
+                'dates': json_column(grid_dates),
+                'series': {claim_id: json_column(matrix[index]) for claim_id, index in order.items()}
+            }, 200
+            
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class NDVISummaryAPI(Resource):
+    """GET /api/monitoring/ndvi/<claim_id>/summary - Lifetime NDVI summary from running statistics"""
+    
+    def get(self, claim_id):
+        try:
+            result = db.session.query(FRAClaim, ClaimNDVIStats).outerjoin(
+                ClaimNDVIStats, ClaimNDVIStats.claim_id == FRAClaim.id
+            ).filter(FRAClaim.claim_id == claim_id).first()
+            
+            if not result:
+                return {'error': 'Claim not found'}, 404
+            
+            claim, stats = result
+            if not stats or not stats.observation_count:
+                return {
+                    'claim_id': claim_id,
+                    'message': 'No NDVI data available for this claim'
+                }, 200
+            
+            summary = stats.to_dict()
+            summary['claim_id'] = claim_id
+            
+            latest_ndvi = stats.latest_ndvi
+            summary['vegetation_status'] = (
+                'critical' if latest_ndvi < ndvi_processor.CRITICAL_THRESHOLD
+                else 'alert' if latest_ndvi < ndvi_processor.ALERT_THRESHOLD
+                else 'healthy'
+            )
+            
+            return summary, 200
+            
         except Exception as e:
             return {'error': str(e)}, 500
 
@@ -124,8 +403,8 @@ class DeforestationAlertsAPI(Resource):
             state = request.args.get('state')
             days = request.args.get('days', 30, type=int)
             
-            # Build query
-            query = Alert.query.join(FRAClaim)
+            # Build query (claim details come from the join, not one lazy load per alert)
+            query = Alert.query.join(FRAClaim).options(contains_eager(Alert.claim))
             
             # Apply filters
             if severity:
@@ -139,21 +418,12 @@ class DeforestationAlertsAPI(Resource):
             cutoff_date = datetime.utcnow() - timedelta(days=days)
             query = query.filter(Alert.detected_at >= cutoff_date)
             
-            # Order by severity and date
-            severity_order = {
-                'critical': 4,
-                'high': 3,
-                'medium': 2,
-                'low': 1
-            }
-            
+            # Order by severity (critical first) and date
             alerts = query.order_by(
+                desc(Alert.severity_rank),
                 desc(Alert.detected_at)
             ).all()
             
-            # Sort by severity (critical first)
-            alerts.sort(key=lambda x: severity_order.get(x.severity, 0), reverse=True)
-            
             # Prepare response
             result = {
                 'alerts': [
@@ -198,82 +468,59 @@ class SatelliteDataAPI(Resource):
             if not data:
                 return {'error': 'No data provided'}, 400
             
-            required_fields = ['claim_id', 'observation_date', 'ndvi_mean']
-            missing_fields = [field for field in required_fields if field not in data]
+            missing = missing_fields(data)
             
-            if missing_fields:
-                return {'error': f'Missing required fields: {missing_fields}'}, 400
+            if missing:
+                return {'error': f'Missing required fields: {missing}'}, 400
             
             # Find the claim
             claim = FRAClaim.query.filter_by(claim_id=data['claim_id']).first()
             if not claim:
                 return {'error': 'Claim not found'}, 404
             
-            # Create monitoring record
-            monitoring_record = MonitoringData(
-                claim_id=claim.id,
-                observation_date=datetime.fromisoformat(data['observation_date']).date(),
-                satellite_source=data.get('satellite_source', 'Sentinel-2'),
-                ndvi_mean=data['ndvi_mean'],
-                ndvi_min=data.get('ndvi_min'),
-                ndvi_max=data.get('ndvi_max'),
-                ndvi_std=data.get('ndvi_std'),
-                evi_mean=data.get('evi_mean'),
-                vegetation_loss_area=data.get('vegetation_loss_area'),
-                vegetation_gain_area=data.get('vegetation_gain_area'),
-                cloud_cover_percentage=data.get('cloud_cover_percentage'),
-                data_quality_score=data.get('data_quality_score'),
-                processing_version=data.get('processing_version', '1.0'),
-                additional_metrics=data.get('additional_metrics')
-            )
-            
-            db.session.add(monitoring_record)
-            
-            # Check for alerts
-            alert_threshold = 0.3
-            critical_threshold = 0.1
-            
-            if data['ndvi_mean'] < critical_threshold:
-                # Create critical alert
-                alert = Alert(
-                    claim_id=claim.id,
-                    alert_type='deforestation',
-                    severity='critical',
-                    affected_area_hectares=data.get('vegetation_loss_area', 0),
-                    confidence_score=0.95,
-                    alert_details={
-                        'ndvi_value': data['ndvi_mean'],
-                        'threshold': critical_threshold,
-                        'detection_method': 'NDVI_threshold'
-                    }
-                )
-                db.session.add(alert)
-            elif data['ndvi_mean'] < alert_threshold:
-                # Create warning alert
-                alert = Alert(
-                    claim_id=claim.id,
-                    alert_type='vegetation_degradation',
-                    severity='medium',
-                    affected_area_hectares=data.get('vegetation_loss_area', 0),
-                    confidence_score=0.85,
-                    alert_details={
-                        'ndvi_value': data['ndvi_mean'],
-                        'threshold': alert_threshold,
-                        'detection_method': 'NDVI_threshold'
-                    }
-                )
-                db.session.add(alert)
+            detector = StreamingAnomalyDetector.from_config(current_app.config)
+            monitoring_record, alert = ingest_observation(claim, data, detector)
             
             db.session.commit()
             
             return {
                 'message': 'Monitoring data processed successfully',
                 'monitoring_id': str(monitoring_record.id),
-                'ndvi_status': 'critical' if data['ndvi_mean'] < critical_threshold 
-                            else 'alert' if data['ndvi_mean'] < alert_threshold 
-                            else 'healthy'
+                'ndvi_status': 'critical' if data['ndvi_mean'] < detector.critical_threshold 
+                            else 'alert' if data['ndvi_mean'] < detector.alert_threshold 
+                            else 'healthy',
+                'alert': alert.to_dict() if alert else None
             }, 201
             
+        except ValueError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'error': str(e)}, 500
+
+class SatelliteBulkAPI(Resource):
+    """POST /api/monitoring/satellite/bulk - Queue a batch of satellite observations for ingestion"""
+    
+    def post(self):
+        try:
+            data = request.get_json()
+            observations = data.get('observations') if isinstance(data, dict) else None
+            
+            if not isinstance(observations, list) or not observations:
+                return {'error': 'Provide a non-empty observations list'}, 400
+            
+            max_batch = current_app.config.get('BULK_INGEST_MAX_OBSERVATIONS', 100000)
+            if len(observations) > max_batch:
+                return {'error': f'At most {max_batch} observations per batch'}, 400
+            
+            # The batch travels as a file; Job.params only records where it is
+            job = enqueue_job('ingest_observations', {
+                'observations_path': stage_job_input('ingest_observations', observations),
+                'observation_count': len(observations)
+            })
+            return job_accepted(job)
+            
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
@@ -290,20 +537,40 @@ class VegetationTrendsAPI(Resource):
             end_date = datetime.utcnow().date()
             start_date = end_date - timedelta(days=days)
             
-            # Build base query
-            query = db.session.query(
-                FRAClaim.state,
-                FRAClaim.district,
-                func.count(MonitoringData.id).label('monitoring_count'),
-                func.avg(MonitoringData.ndvi_mean).label('avg_ndvi'),
-                func.min(MonitoringData.ndvi_mean).label('min_ndvi'),
-                func.max(MonitoringData.ndvi_mean).label('max_ndvi')
-            ).join(MonitoringData).filter(
-                MonitoringData.observation_date >= start_date,
-                MonitoringData.observation_date <= end_date,
-                MonitoringData.ndvi_mean.isnot(None)
+            # Long windows aggregate monthly rollups (edge months included whole)
+            use_rollups = days >= current_app.config.get('TRENDS_ROLLUP_MIN_DAYS', 180)
+            rollup_filters = (
+                MonitoringRollup.resolution == 'month',
+                MonitoringRollup.period_start >= period_start('month', start_date),
+                MonitoringRollup.period_start <= end_date
             )
             
+            # Build base query
+            if use_rollups:
+                query = db.session.query(
+                    FRAClaim.state,
+                    FRAClaim.district,
+                    func.sum(MonitoringRollup.observation_count).label('monitoring_count'),
+                    (func.sum(MonitoringRollup.ndvi_sum) / func.sum(MonitoringRollup.observation_count)).label('avg_ndvi'),
+                    func.min(MonitoringRollup.ndvi_min).label('min_ndvi'),
+                    func.max(MonitoringRollup.ndvi_max).label('max_ndvi')
+                ).join(
+                    MonitoringRollup, MonitoringRollup.claim_id == FRAClaim.id
+                ).filter(*rollup_filters)
+            else:
+                query = db.session.query(
+                    FRAClaim.state,
+                    FRAClaim.district,
+                    func.count(MonitoringData.id).label('monitoring_count'),
+                    func.avg(MonitoringData.ndvi_mean).label('avg_ndvi'),
+                    func.min(MonitoringData.ndvi_mean).label('min_ndvi'),
+                    func.max(MonitoringData.ndvi_mean).label('max_ndvi')
+                ).join(MonitoringData).filter(
+                    MonitoringData.observation_date >= start_date,
+                    MonitoringData.observation_date <= end_date,
+                    MonitoringData.ndvi_mean.isnot(None)
+                )
+            
             if state:
                 query = query.filter(FRAClaim.state.ilike(f'%{state}%'))
             
@@ -312,16 +579,14 @@ class VegetationTrendsAPI(Resource):
             ).all()
             
             # Calculate overall trends
+            district_status_names = ('critical', 'degraded', 'moderate', 'healthy')
+            district_codes = ndvi_processor.classify_health(
+                [float(avg_ndvi) for _, _, _, avg_ndvi, _, _ in results],
+                edges=(0.1, 0.3, 0.5)
+            )
+            
             trends = []
-            for state_name, district, count, avg_ndvi, min_ndvi, max_ndvi in results:
-                status = 'healthy'
-                if avg_ndvi < 0.1:
-                    status = 'critical'
-                elif avg_ndvi < 0.3:
-                    status = 'degraded'
-                elif avg_ndvi < 0.5:
-                    status = 'moderate'
-                
+            for (state_name, district, count, avg_ndvi, min_ndvi, max_ndvi), code in zip(results, district_codes):
                 trends.append({
                     'state': state_name,
                     'district': district,
@@ -329,17 +594,36 @@ class VegetationTrendsAPI(Resource):
                     'average_ndvi': round(float(avg_ndvi), 3),
                     'min_ndvi': round(float(min_ndvi), 3),
                     'max_ndvi': round(float(max_ndvi), 3),
-                    'vegetation_status': status
+                    'vegetation_status': district_status_names[code]
                 })
             
             # Overall statistics
-            all_ndvi_values = db.session.query(MonitoringData.ndvi_mean).filter(
-                MonitoringData.observation_date >= start_date,
-                MonitoringData.observation_date <= end_date,
-                MonitoringData.ndvi_mean.isnot(None)
-            ).all()
+            if use_rollups:
+                # Classify each claim-month by its mean, weighted by its observations
+                rollup_rows = db.session.query(
+                    MonitoringRollup.ndvi_sum,
+                    MonitoringRollup.observation_count
+                ).filter(*rollup_filters).all()
+                sums = np.fromiter((row[0] for row in rollup_rows), dtype=float, count=len(rollup_rows))
+                weights = np.fromiter((row[1] for row in rollup_rows), dtype=float, count=len(rollup_rows))
+                ndvi_values = sums / np.maximum(weights, 1)
+                total_points = int(weights.sum())
+                average_ndvi = float(sums.sum() / weights.sum()) if total_points else None
+            else:
+                all_ndvi_values = db.session.query(MonitoringData.ndvi_mean).filter(
+                    MonitoringData.observation_date >= start_date,
+                    MonitoringData.observation_date <= end_date,
+                    MonitoringData.ndvi_mean.isnot(None)
+                ).all()
+                
+                ndvi_values = np.fromiter((val[0] for val in all_ndvi_values), dtype=float, count=len(all_ndvi_values))
+                weights = None
+                total_points = int(ndvi_values.size)
+                average_ndvi = float(ndvi_values.mean()) if ndvi_values.size else None
             
-            ndvi_values = [float(val[0]) for val in all_ndvi_values]
+            critical_count, degraded_count, healthy_count = np.bincount(
+                ndvi_processor.classify_health(ndvi_values, edges=(0.3, 0.5)), weights=weights, minlength=3
+            )[:3]
             
             summary = {
                 'period': {
@@ -347,12 +631,13 @@ class VegetationTrendsAPI(Resource):
                     'end_date': end_date.isoformat(),
                     'days': days
                 },
+                'resolution': 'month' if use_rollups else 'raw',
                 'overall_statistics': {
-                    'total_monitoring_points': len(ndvi_values),
-                    'average_ndvi': round(sum(ndvi_values) / len(ndvi_values), 3) if ndvi_values else 0,
-                    'healthy_areas': len([v for v in ndvi_values if v >= 0.5]),
-                    'degraded_areas': len([v for v in ndvi_values if 0.3 <= v < 0.5]),
-                    'critical_areas': len([v for v in ndvi_values if v < 0.3])
+                    'total_monitoring_points': total_points,
+                    'average_ndvi': round(average_ndvi, 3) if average_ndvi is not None else 0,
+                    'healthy_areas': int(healthy_count),
+                    'degraded_areas': int(degraded_count),
+                    'critical_areas': int(critical_count)
                 },
                 'regional_trends': trends
             }
@@ -362,8 +647,479 @@ class VegetationTrendsAPI(Resource):
         except Exception as e:
             return {'error': str(e)}, 500
 
+class ChangePointsAPI(Resource):
+    """GET /api/monitoring/change-points/<claim_id> - Detect change points in a claim's NDVI series"""
+    
+    def get(self, claim_id):
+        try:
+            claim = FRAClaim.query.filter_by(claim_id=claim_id).first()
+            if not claim:
+                return {'error': 'Claim not found'}, 404
+            
+            method = request.args.get('method', ndvi_processor.DEFAULT_CHANGE_POINT_METHOD)
+            penalty = request.args.get('penalty', type=float)
+            threshold = request.args.get('threshold', 0.1, type=float)
+            min_segment_length = request.args.get('min_segment_length', 2, type=int)
+            
+            if method not in ndvi_processor.CHANGE_POINT_METHODS:
+                return {'error': f'Invalid method. Must be one of: {list(ndvi_processor.CHANGE_POINT_METHODS)}'}, 400
+            
+            start_date = request.args.get('start_date')
+            end_date = request.args.get('end_date')
+            
+            query = db.session.query(
+                MonitoringData.observation_date,
+                MonitoringData.ndvi_mean
+            ).filter(
+                MonitoringData.claim_id == claim.id,
+                MonitoringData.ndvi_mean.isnot(None)
+            )
+            
+            if start_date:
+                query = query.filter(
+                    MonitoringData.observation_date >= datetime.fromisoformat(start_date.replace('Z', '+00:00')).date()
+                )
+            if end_date:
+                query = query.filter(
+                    MonitoringData.observation_date <= datetime.fromisoformat(end_date.replace('Z', '+00:00')).date()
+                )
+            
+            rows = query.order_by(MonitoringData.observation_date).all()
+            dates = [observation_date for observation_date, _ in rows]
+            ndvi_values = [ndvi for _, ndvi in rows]
+            
+            change_points = ndvi_processor.detect_change_points(
+                ndvi_values,
+                method=method,
+                penalty=penalty,
+                threshold=threshold,
+                min_segment_length=min_segment_length
+            )
+            
+            for point in change_points:
+                point['date'] = dates[point['index']].isoformat()
+            
+            return {
+                'claim_id': claim_id,
+                'method': method,
+                'parameters': {
+                    'penalty': penalty,
+                    'threshold': threshold,
+                    'min_segment_length': min_segment_length
+                },
+                'data_points': len(ndvi_values),
+                'change_points': change_points
+            }, 200
+            
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class ChangeDetectionAPI(Resource):
+    """POST /api/monitoring/change-detection/<claim_id> - Raster change detection between two observations"""
+    
+    def post(self, claim_id):
+        try:
+            from geoalchemy2.shape import from_shape, to_shape
+            
+            claim = FRAClaim.query.filter_by(claim_id=claim_id).first()
+            if not claim:
+                return {'error': 'Claim not found'}, 404
+            
+            data = request.get_json(silent=True) or {}
+            
+            thresholds = {}
+            for name, default in (('loss_threshold', -0.15), ('gain_threshold', 0.15)):
+                value = data.get(name, default)
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                    return {'error': f'{name} must be a finite number'}, 400
+                thresholds[name] = float(value)
+            
+            # Default to the two most recent observations that have a raster on disk
+            query = MonitoringData.query.filter(
+                MonitoringData.claim_id == claim.id,
+                MonitoringData.raw_data_path.isnot(None)
+            )
+            if data.get('before_id') and data.get('after_id'):
+                try:
+                    observation_ids = [uuid.UUID(str(data['before_id'])), uuid.UUID(str(data['after_id']))]
+                except ValueError:
+                    return {'error': 'before_id and after_id must be monitoring record UUIDs'}, 400
+                observations = query.filter(
+                    MonitoringData.id.in_(observation_ids)
+                ).order_by(MonitoringData.observation_date).all()
+            else:
+                observations = query.order_by(desc(MonitoringData.observation_date)).limit(2).all()[::-1]
+            
+            if len(observations) < 2:
+                return {'error': 'Two observations with raster data are required'}, 400
+            
+            before, after = observations
+            raster_info, blocks = iter_raster_blocks(
+                before.raw_data_path,
+                after.raw_data_path,
+                block_rows=current_app.config.get('CHANGE_DETECTION_BLOCK_ROWS', 512),
+                geometry=to_shape(claim.geometry) if claim.geometry is not None else None
+            )
+            
+            area_threshold = current_app.config.get('DEFORESTATION_AREA_THRESHOLD', 0.5)
+            detector = RasterChangeDetector(
+                pixel_area_ha=raster_info['pixel_area_ha'],
+                loss_threshold=thresholds['loss_threshold'],
+                gain_threshold=thresholds['gain_threshold'],
+                min_patch_area_ha=area_threshold,
+                transform=raster_info['transform']
+            )
+            # The after-raster's class-area histogram is tallied from the same strips
+            class_areas = np.zeros(len(ndvi_processor.HEALTH_CLASSES))
+            
+            def tally_after(strips):
+                for row_offset, before_block, after_block in strips:
+                    np.add(class_areas, ndvi_processor.class_area_histogram(
+                        after_block, raster_info['pixel_area_ha']), out=class_areas)
+                    yield row_offset, before_block, after_block
+            
+            result = detector.detect(tally_after(blocks()))
+            
+            after.vegetation_loss_area = result['loss_area_ha']
+            after.vegetation_gain_area = result['gain_area_ha']
+            after.additional_metrics = {
+                **(after.additional_metrics or {}),
+                **ndvi_processor.health_class_metrics(class_areas)
+            }
+            
+            # All loss patches of a run form one deforestation incident on the claim,
+            # merged into its open deforestation alert when there is one
+            alerts = []
+            if result['patches']:
+                from shapely.geometry import mapping
+                from shapely.ops import unary_union
+                
+                patches = []
+                geometries = []
+                for patch in result['patches']:
+                    geometry = to_wgs84(patch['geometry'], raster_info['crs'])
+                    geometries.append(geometry)
+                    patches.append({
+                        'area_ha': patch['area_ha'],
+                        'mean_ndvi_change': patch['mean_ndvi_change'],
+                        'pixel_count': patch['pixel_count'],
+                        'geometry': mapping(geometry)
+                    })
+                
+                total_area = sum(patch['area_ha'] for patch in result['patches'])
+                largest_area = max(patch['area_ha'] for patch in result['patches'])
+                mean_change = sum(
+                    patch['mean_ndvi_change'] * patch['area_ha'] for patch in result['patches']
+                ) / total_area if total_area else 0.0
+                
+                # alert_geometry is a single polygon; multi-patch footprints use their hull
+                footprint = unary_union(geometries)
+                if footprint.geom_type != 'Polygon':
+                    footprint = footprint.convex_hull
+                
+                alert, _ = record_detection(
+                    claim.id,
+                    alert_type='deforestation',
+                    severity='critical' if largest_area >= 10 * area_threshold else 'high',
+                    affected_area_hectares=total_area,
+                    confidence_score=round(min(0.99, max(0.5, abs(mean_change) / (2 * abs(detector.loss_threshold)))), 3),
+                    alert_details={
+                        'detection_method': 'raster_change_detection',
+                        'mean_ndvi_change': mean_change,
+                        'patch_count': len(patches),
+                        'patches': patches,
+                        'before_date': before.observation_date.isoformat(),
+                        'after_date': after.observation_date.isoformat()
+                    }
+                )
+                alert.alert_geometry = from_shape(footprint, srid=4326)
+                alert.satellite_image_before = before.raw_data_path
+                alert.satellite_image_after = after.raw_data_path
+                alerts.append(alert)
+            
+            db.session.commit()
+            
+            return {
+                'claim_id': claim_id,
+                'before_observation': before.to_dict(),
+                'after_observation': after.to_dict(),
+                'vegetation_loss_area_ha': result['loss_area_ha'],
+                'vegetation_gain_area_ha': result['gain_area_ha'],
+                'valid_area_ha': result['valid_area_ha'],
+                'health_class_area_ha': dict(zip(
+                    ndvi_processor.HEALTH_CLASSES,
+                    ndvi_processor.health_class_metrics(class_areas)['health_class_area_ha']
+                )),
+                'loss_patches': [
+                    {key: value for key, value in patch.items() if key != 'geometry'}
+                    for patch in result['patches']
+                ],
+                'alerts': [alert.to_dict() for alert in alerts]
+            }, 200
+            
+        except RasterUnavailable as e:
+            db.session.rollback()
+            role, observation = next(
+                (role, observation) for role, observation in (('before', before), ('after', after))
+                if observation.raw_data_path == e.path
+            )
+            return {
+                'error': f'Raster of the {role} observation {observation.id} '
+                         f'({observation.observation_date.isoformat()}) cannot be read: {e}'
+            }, 404
+        except ValueError as e:
+            db.session.rollback()
+            return {'error': str(e)}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'error': str(e)}, 500
+
+class ClaimAnalysisAPI(Resource):
+    """GET /api/monitoring/analysis/<claim_id> - Full NDVI analysis and recommendations for a claim"""
+    
+    def get(self, claim_id):
+        try:
+            method = request.args.get('method', ndvi_processor.DEFAULT_CHANGE_POINT_METHOD)
+            penalty = request.args.get('penalty', type=float)
+            if method not in ndvi_processor.CHANGE_POINT_METHODS:
+                return {'error': f'Invalid method. Must be one of: {list(ndvi_processor.CHANGE_POINT_METHODS)}'}, 400
+            
+            result = db.session.query(FRAClaim, ClaimNDVIStats).outerjoin(
+                ClaimNDVIStats, ClaimNDVIStats.claim_id == FRAClaim.id
+            ).filter(FRAClaim.claim_id == claim_id).first()
+            
+            if not result:
+                return {'error': 'Claim not found'}, 404
+            
+            claim, stats = result
+            analysis, cached = run_claim_analysis(claim, stats, None, method, penalty)
+            
+            return {
+                'claim_id': claim_id,
+                'claim_details': {
+                    'village_name': claim.village_name,
+                    'district': claim.district,
+                    'state': claim.state,
+                    'area_hectares': claim.area_hectares
+                },
+                'data_version': stats.observation_count if stats else 0,
+                'cached': cached,
+                'analysis': analysis
+            }, 200
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class DistrictAnalysisAPI(Resource):
+    """GET /api/monitoring/analysis/district/<district> - NDVI analysis for every claim in a district"""
+    
+    def get(self, district):
+        try:
+            state = request.args.get('state')
+            method = request.args.get('method', ndvi_processor.DEFAULT_CHANGE_POINT_METHOD)
+            penalty = request.args.get('penalty', type=float)
+            include_details = request.args.get('include_details', 'false').lower() in ['true', '1']
+            if method not in ndvi_processor.CHANGE_POINT_METHODS:
+                return {'error': f'Invalid method. Must be one of: {list(ndvi_processor.CHANGE_POINT_METHODS)}'}, 400
+            
+            query = db.session.query(FRAClaim, ClaimNDVIStats).outerjoin(
+                ClaimNDVIStats, ClaimNDVIStats.claim_id == FRAClaim.id
+            ).filter(FRAClaim.district.ilike(district))
+            if state:
+                query = query.filter(FRAClaim.state.ilike(f'%{state}%'))
+            
+            claims = query.order_by(FRAClaim.claim_id).all()
+            if not claims:
+                return {'error': 'No claims found for district'}, 404
+            
+            # One series fetch for every claim whose analysis is not cached at its current version
+            cache = get_analysis_cache()
+            stale_ids = [
+                claim.id for claim, stats in claims
+                if cache.get((str(claim.id), data_version(stats), method, penalty)) is None
+            ]
+            stale_set = set(stale_ids)
+            
+            series_by_claim = {}
+            if stale_ids:
+                rows = db.session.query(
+                    MonitoringData.claim_id,
+                    MonitoringData.observation_date,
+                    MonitoringData.ndvi_mean
+                ).filter(
+                    MonitoringData.claim_id.in_(stale_ids),
+                    MonitoringData.ndvi_mean.isnot(None)
+                ).order_by(
+                    MonitoringData.claim_id,
+                    MonitoringData.observation_date
+                ).all()
+                
+                for claim_uuid, group in groupby(rows, key=lambda row: row[0]):
+                    series_by_claim[claim_uuid] = [(observation_date, ndvi) for _, observation_date, ndvi in group]
+            
+            analyses = []
+            for claim, stats in claims:
+                series = series_by_claim.get(claim.id, [] if claim.id in stale_set else None)
+                analysis, cached = run_claim_analysis(claim, stats, series, method, penalty)
+                
+                entry = {
+                    'claim_id': claim.claim_id,
+                    'village_name': claim.village_name,
+                    'cached': cached
+                }
+                if 'error' in analysis:
+                    entry['error'] = analysis['error']
+                else:
+                    entry.update({
+                        'mean_ndvi': analysis['statistics']['mean_ndvi'],
+                        'health_status': analysis['health_assessment']['status'],
+                        'overall_trend': analysis['trend_analysis']['overall_trend'],
+                        'anomaly_count': len(analysis['anomalies']),
+                        'change_point_count': len(analysis['change_points']),
+                        'priority': analysis['recommendations']['priority'],
+                        'action_required': analysis['recommendations']['action_required']
+                    })
+                    if include_details:
+                        entry['analysis'] = analysis
+                analyses.append(entry)
+            
+            priority_order = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+            analyses.sort(key=lambda entry: priority_order.get(entry.get('priority'), 4))
+            
+            return {
+                'district': district,
+                'state': state,
+                'total_claims': len(analyses),
+                'claims_recomputed': len(stale_ids),
+                'action_required': sum(1 for entry in analyses if entry.get('action_required')),
+                'analyses': analyses
+            }, 200
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class ForecastAPI(Resource):
+    """GET /api/monitoring/forecast/<claim_id> - Precomputed NDVI forecast for a claim"""
+    
+    def get(self, claim_id):
+        try:
+            claim = FRAClaim.query.filter_by(claim_id=claim_id).first()
+            if not claim:
+                return {'error': 'Claim not found'}, 404
+            
+            forecasts = NDVIForecast.query.filter_by(
+                claim_id=claim.id
+            ).order_by(NDVIForecast.target_month).all()
+            
+            if not forecasts:
+                return {
+                    'claim_id': claim_id,
+                    'message': 'No forecast available for this claim yet'
+                }, 200
+            
+            alert_threshold = current_app.config.get('NDVI_ALERT_THRESHOLD', 0.3)
+            first_crossing = next(
+                (forecast.target_month.isoformat() for forecast in forecasts
+                 if forecast.predicted_ndvi < alert_threshold),
+                None
+            )
+            
+            return {
+                'claim_id': claim_id,
+                'model': forecasts[0].model,
+                'generated_at': forecasts[0].generated_at.isoformat(),
+                'alert_threshold': alert_threshold,
+                'predicted_threshold_crossing': first_crossing,
+                'forecast': [
+                    {
+                        **forecast.to_dict(),
+                        'below_alert_threshold': forecast.predicted_ndvi < alert_threshold
+                    }
+                    for forecast in forecasts
+                ]
+            }, 200
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+class AtRiskForecastAPI(Resource):
+    """GET /api/monitoring/forecast/at-risk - Claims predicted to cross the NDVI alert threshold"""
+    
+    def get(self):
+        try:
+            state = request.args.get('state')
+            district = request.args.get('district')
+            months = request.args.get('months', 3, type=int)
+            use_lower = request.args.get('use_lower_bound', 'false').lower() in ['true', '1']
+            
+            alert_threshold = current_app.config.get('NDVI_ALERT_THRESHOLD', 0.3)
+            bound = NDVIForecast.lower_ndvi if use_lower else NDVIForecast.predicted_ndvi
+            
+            query = db.session.query(
+                FRAClaim.claim_id,
+                FRAClaim.village_name,
+                FRAClaim.district,
+                FRAClaim.state,
+                func.min(NDVIForecast.target_month).label('first_crossing'),
+                func.min(NDVIForecast.predicted_ndvi).label('min_predicted'),
+                func.min(NDVIForecast.lower_ndvi).label('min_lower')
+            ).join(
+                NDVIForecast, NDVIForecast.claim_id == FRAClaim.id
+            ).filter(
+                NDVIForecast.horizon_months <= months,
+                bound < alert_threshold
+            )
+            
+            if state:
+                query = query.filter(FRAClaim.state.ilike(f'%{state}%'))
+            if district:
+                query = query.filter(FRAClaim.district.ilike(f'%{district}%'))
+            
+            results = query.group_by(
+                FRAClaim.claim_id, FRAClaim.village_name, FRAClaim.district, FRAClaim.state
+            ).order_by('min_predicted').all()
+            
+            return {
+                'at_risk_claims': [
+                    {
+                        'claim_id': claim_id,
+                        'village_name': village_name,
+                        'district': district_name,
+                        'state': state_name,
+                        'first_predicted_crossing': first_crossing.isoformat(),
+                        'min_predicted_ndvi': round(min_predicted, 3),
+                        'min_lower_ndvi': round(min_lower, 3)
+                    }
+                    for claim_id, village_name, district_name, state_name, first_crossing, min_predicted, min_lower in results
+                ],
+                'summary': {
+                    'total_at_risk': len(results),
+                    'alert_threshold': alert_threshold,
+                    'filters': {
+                        'state': state,
+                        'district': district,
+                        'months': months,
+                        'use_lower_bound': use_lower
+                    }
+                }
+            }, 200
+            
+        except Exception as e:
+            return {'error': str(e)}, 500
+
 # Register API resources
+api.add_resource(NDVIComparisonAPI, '/ndvi')
 api.add_resource(NDVIAnalysisAPI, '/ndvi/<string:claim_id>')
+api.add_resource(NDVISummaryAPI, '/ndvi/<string:claim_id>/summary')
 api.add_resource(DeforestationAlertsAPI, '/alerts')
 api.add_resource(SatelliteDataAPI, '/satellite')
-api.add_resource(VegetationTrendsAPI, '/trends')
\ No newline at end of file
+api.add_resource(SatelliteBulkAPI, '/satellite/bulk')
+api.add_resource(VegetationTrendsAPI, '/trends')
+api.add_resource(ChangePointsAPI, '/change-points/<string:claim_id>')
+api.add_resource(ChangeDetectionAPI, '/change-detection/<string:claim_id>')
+api.add_resource(ClaimAnalysisAPI, '/analysis/<string:claim_id>')
+api.add_resource(DistrictAnalysisAPI, '/analysis/district/<string:district>')
+api.add_resource(ForecastAPI, '/forecast/<string:claim_id>')
+api.add_resource(AtRiskForecastAPI, '/forecast/at-risk')
\ No newline at end of file
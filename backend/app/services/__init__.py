@@ -1,4 +1,13 @@
 # Services package
 from .ndvi_processor import NDVIProcessor
+from .anomaly_detector import StreamingAnomalyDetector
+from .seasonal_analysis import SeasonalDecomposer
+from .change_detection import RasterChangeDetector
+from .cache import LRUCache
+from .forecasting import NDVIForecaster
+from .snapshot_cache import SnapshotCache
+from .parquet_export import ParquetExporter
+from .jobs import JobContext, enqueue_job
+from .notifications import NotificationDispatcher
 
-__all__ = ['NDVIProcessor']
\ No newline at end of file
+__all__ = ['NDVIProcessor', 'StreamingAnomalyDetector', 'SeasonalDecomposer', 'RasterChangeDetector', 'LRUCache', 'NDVIForecaster', 'SnapshotCache', 'ParquetExporter', 'JobContext', 'enqueue_job', 'NotificationDispatcher']
\ No newline at end of file
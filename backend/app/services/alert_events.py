@@ -0,0 +1,189 @@
+"""
+Alert Event Service
+Fan-out bus of alert create/update events behind the /api/alerts/stream SSE feed
+"""
+
+import re
+import json
+import threading
+import logging
+from collections import deque
+from typing import List, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Alert
+
+logger = logging.getLogger(__name__)
+
+# (event id, event type, payload)
+AlertEvent = Tuple[str, str, dict]
+
+
+class MemoryEventBus:
+    """In-process ring buffer; fans out to the threads of one worker (tests, single-process setups)"""
+    
+    def __init__(self, max_len: int = 10000):
+        self._events = deque(maxlen=max_len)
+        self._sequence = 0
+        self._condition = threading.Condition()
+    
+    def publish(self, event_type: str, payload: dict) -> str:
+        with self._condition:
+            self._sequence += 1
+            self._events.append((self._sequence, event_type, payload))
+            self._condition.notify_all()
+            return str(self._sequence)
+    
+    def latest_id(self) -> str:
+        with self._condition:
+            return str(self._sequence)
+    
+    def read(self, after_id: str, timeout: float) -> List[AlertEvent]:
+        """
+        Events after after_id, waiting up to timeout seconds for the first one
+        
+        An id beyond the current sequence (issued before a restart reset it)
+        resumes from the current sequence rather than skipping new events.
+        """
+        with self._condition:
+            after = int(after_id) if after_id.isdigit() else self._sequence
+            after = min(after, self._sequence)
+            self._condition.wait_for(lambda: self._sequence > after, timeout=timeout)
+            return [
+                (str(sequence), event_type, payload)
+                for sequence, event_type, payload in self._events
+                if sequence > after
+            ]
+
+
+class RedisEventBus:
+    """
+    Redis stream (XADD/XREAD): every worker and host reads the same ordered log,
+    and the stream ids double as SSE event ids for Last-Event-ID resume
+    """
+    
+    ID_PATTERN = re.compile(r'^\d+-\d+$')
+    
+    def __init__(self, client, key: str = 'fra:alerts:events', max_len: int = 10000):
+        self.client = client
+        self.key = key
+        self.max_len = max_len
+    
+    def publish(self, event_type: str, payload: dict) -> str:
+        event_id = self.client.xadd(
+            self.key,
+            {'type': event_type, 'data': json.dumps(payload, default=str)},
+            maxlen=self.max_len,
+            approximate=True
+        )
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+    
+    def latest_id(self) -> str:
+        newest = self.client.xrevrange(self.key, count=1)
+        if not newest:
+            return '0-0'
+        event_id = newest[0][0]
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+    
+    def read(self, after_id: str, timeout: float) -> List[AlertEvent]:
+        if not self.ID_PATTERN.match(after_id or ''):
+            after_id = self.latest_id()
+        response = self.client.xread({self.key: after_id}, count=500, block=int(timeout * 1000))
+        events = []
+        for _, entries in response or []:
+            for event_id, fields in entries:
+                fields = {
+                    (key.decode() if isinstance(key, bytes) else key): (value.decode() if isinstance(value, bytes) else value)
+                    for key, value in fields.items()
+                }
+                event_id = event_id.decode() if isinstance(event_id, bytes) else event_id
+                events.append((event_id, fields['type'], json.loads(fields['data'])))
+        return events
+
+
+def create_event_bus(config):
+    """Redis stream bus from REDIS_URL when reachable, otherwise the in-process bus"""
+    max_len = config.get('ALERT_EVENTS_MAX_LEN', 10000)
+    if config.get('ALERT_EVENTS_BACKEND', 'redis') == 'redis':
+        try:
+            import redis
+            client = redis.Redis.from_url(
+                config['REDIS_URL'],
+                socket_connect_timeout=0.5,
+                # Reads block for up to a heartbeat interval
+                socket_timeout=config.get('ALERT_STREAM_HEARTBEAT', 15) + 5
+            )
+            client.ping()
+            return RedisEventBus(client, max_len=max_len)
+        except Exception as e:
+            logger.warning('Redis unavailable for alert events (%s); using in-process bus', e)
+    return MemoryEventBus(max_len=max_len)
+
+
+def get_event_bus():
+    """Per-app alert event bus, created on first use"""
+    if 'alert_events' not in current_app.extensions:
+        current_app.extensions['alert_events'] = create_event_bus(current_app.config)
+    return current_app.extensions['alert_events']
+
+
+def stream_slots():
+    """Per-worker semaphore bounding the SSE connections that may hold a request thread"""
+    if 'alert_stream_slots' not in current_app.extensions:
+        current_app.extensions['alert_stream_slots'] = threading.BoundedSemaphore(
+            current_app.config.get('ALERT_STREAM_MAX_CONNECTIONS', 4)
+        )
+    return current_app.extensions['alert_stream_slots']
+
+
+def format_sse(event_id: str, event_type: str, payload: dict) -> str:
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(payload, default=str)}\n\n'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_alert_events(session, flush_context):
+    """Serialize flushed alerts now; they are published only once the transaction commits"""
+    pending = session.info.setdefault('alert_events', {})
+    for instance in session.new:
+        if isinstance(instance, Alert):
+            pending[instance.id] = ('alert.created', instance.to_dict(), instance)
+    for instance in session.dirty:
+        if isinstance(instance, Alert) and session.is_modified(instance, include_collections=False):
+            # An alert created and updated in the same transaction is still a creation
+            event_type = pending.get(instance.id, ('alert.updated',))[0]
+            pending[instance.id] = (event_type, instance.to_dict(), instance)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_alert_events(session):
+    if session.in_nested_transaction():
+        return  # savepoint released; publish with the outer commit
+    pending = session.info.pop('alert_events', None)
+    if not pending or not has_app_context():
+        return
+    try:
+        bus = get_event_bus()
+        for event_type, payload, _ in pending.values():
+            bus.publish(event_type, payload)
+    except Exception:
+        logger.exception('Could not publish %d alert events', len(pending))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_alert_events(session, previous_transaction):
+    """
+    A full rollback drops every pending event; a savepoint rollback (one bad row
+    of a bulk ingest) only drops the alerts it un-inserted
+    """
+    if previous_transaction.parent is None:
+        session.info.pop('alert_events', None)
+        return
+    if not previous_transaction.nested:
+        return  # a failed flush inside the transaction; its savepoint or root decides
+    pending = session.info.get('alert_events', {})
+    for alert_id, (_, _, instance) in list(pending.items()):
+        if inspect(instance).transient:
+            del pending[alert_id]
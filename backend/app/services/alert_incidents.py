@@ -0,0 +1,147 @@
+"""
+Alert Incident Service
+Coalesces repeat detections into one open alert per claim and alert type
+"""
+
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Alert
+
+SEVERITY_RANKS = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+
+def _open_alert(claim_id, alert_type: str) -> Optional[Alert]:
+    """The claim's open alert of this type, row-locked until the transaction ends"""
+    return Alert.query.filter(
+        Alert.claim_id == claim_id,
+        Alert.alert_type == alert_type,
+        Alert.status == 'active'
+    ).with_for_update().first()
+
+
+def merge_detection(alert: Alert, severity: str, confidence_score: Optional[float] = None,
+                    affected_area_hectares: Optional[float] = None,
+                    alert_details: Optional[dict] = None, detected_at: Optional[datetime] = None):
+    """
+    Fold a repeat detection into an open alert: one more occurrence, latest
+    sighting, worst severity so far, mean confidence over the occurrences and
+    the largest affected area
+    """
+    occurrences = alert.occurrence_count or 1
+    alert.occurrence_count = occurrences + 1
+    alert.last_seen_at = max(filter(None, [alert.last_seen_at, detected_at or datetime.utcnow()]))
+    
+    if SEVERITY_RANKS.get(severity, 0) > SEVERITY_RANKS.get(alert.severity, 0):
+        alert.severity = severity
+    if confidence_score is not None:
+        current = alert.confidence_score if alert.confidence_score is not None else confidence_score
+        alert.confidence_score = current + (confidence_score - current) / (occurrences + 1)
+    if affected_area_hectares is not None:
+        alert.affected_area_hectares = max(alert.affected_area_hectares or 0.0, affected_area_hectares)
+    if alert_details:
+        alert.alert_details = {**(alert.alert_details or {}), **alert_details}
+
+
+def record_detection(claim_id, alert_type: str, severity: str,
+                     confidence_score: Optional[float] = None,
+                     affected_area_hectares: Optional[float] = None,
+                     alert_details: Optional[dict] = None,
+                     detected_at: Optional[datetime] = None) -> Tuple[Alert, bool]:
+    """
+    Open a new alert, or update the claim's open alert of the same type (the caller commits)
+    
+    The partial unique index uq_alerts_open_claim_type allows one open alert
+    per (claim, type). An existing one is locked and updated; otherwise the
+    insert runs in a savepoint, and if a concurrent writer opened the alert
+    first the index rejects it and the detection is merged into theirs.
+    Going through the session keeps the flush hooks (analytics rollups,
+    snapshot versions) informed.
+    
+    Returns:
+        (alert, created)
+    """
+    detection = {
+        'confidence_score': confidence_score,
+        'affected_area_hectares': affected_area_hectares,
+        'alert_details': alert_details,
+        'detected_at': detected_at
+    }
+    
+    alert = _open_alert(claim_id, alert_type)
+    if alert is None:
+        seen_at = detected_at or datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                alert = Alert(
+                    claim_id=claim_id,
+                    alert_type=alert_type,
+                    severity=severity,
+                    detected_at=seen_at,
+                    last_seen_at=seen_at,
+                    occurrence_count=1,
+                    confidence_score=confidence_score,
+                    affected_area_hectares=affected_area_hectares,
+                    alert_details=alert_details
+                )
+                db.session.add(alert)
+            return alert, True
+        except IntegrityError:
+            alert = _open_alert(claim_id, alert_type)
+            if alert is None:
+                raise
+    
+    merge_detection(alert, severity, **detection)
+    return alert, False
+
+
+def compact_open_alerts() -> Dict[str, int]:
+    """
+    Merge duplicate open alerts of the same claim and type into their oldest
+    row, so the partial unique index can be built on existing data (the caller commits)
+    
+    Returns:
+        Incidents kept and duplicate rows removed
+    """
+    merged = db.session.execute(text("""
+        WITH groups AS (
+            SELECT claim_id, alert_type,
+                   (array_agg(id ORDER BY detected_at, id))[1] AS keep_id,
+                   sum(coalesce(occurrence_count, 1)) AS occurrences,
+                   max(coalesce(last_seen_at, detected_at)) AS last_seen,
+                   max(CASE severity WHEN 'critical' THEN 4 WHEN 'high' THEN 3
+                                     WHEN 'medium' THEN 2 WHEN 'low' THEN 1 ELSE 0 END) AS worst_rank,
+                   avg(confidence_score) AS confidence,
+                   max(affected_area_hectares) AS area
+            FROM alerts
+            WHERE status = 'active'
+            GROUP BY claim_id, alert_type
+            HAVING count(*) > 1
+        ),
+        kept AS (
+            UPDATE alerts a
+            SET occurrence_count = g.occurrences,
+                last_seen_at = g.last_seen,
+                severity = CASE g.worst_rank WHEN 4 THEN 'critical' WHEN 3 THEN 'high'
+                                             WHEN 2 THEN 'medium' WHEN 1 THEN 'low' ELSE a.severity END,
+                confidence_score = coalesce(g.confidence, a.confidence_score),
+                affected_area_hectares = coalesce(g.area, a.affected_area_hectares)
+            FROM groups g
+            WHERE a.id = g.keep_id
+            RETURNING a.id
+        ),
+        removed AS (
+            DELETE FROM alerts a
+            USING groups g
+            WHERE a.claim_id = g.claim_id AND a.alert_type = g.alert_type
+              AND a.status = 'active' AND a.id <> g.keep_id
+            RETURNING a.id
+        )
+        SELECT (SELECT count(*) FROM kept) AS incidents, (SELECT count(*) FROM removed) AS removed
+    """)).one()
+    
+    return {'incidents': merged.incidents, 'duplicates_removed': merged.removed}
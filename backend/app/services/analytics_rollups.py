@@ -0,0 +1,267 @@
+"""
+Analytics Rollup Service
+Time-bucketed claim, alert and NDVI totals kept current by the ORM write paths
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, func, insert, literal, cast, Date, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import FRAClaim, MonitoringData, Alert, AnalyticsRollup
+from .rollups import period_start
+
+BUCKETS = ('week', 'month', 'quarter', 'year')
+GROUP_BY = ('state', 'district', 'status')
+
+# metric -> (model, date attribute, status attribute or None, summed value attribute)
+METRICS = {
+    'claims': (FRAClaim, 'application_date', 'status', 'area_hectares'),
+    'approvals': (FRAClaim, 'approval_date', 'status', 'area_hectares'),
+    'alerts': (Alert, 'detected_at', 'status', 'affected_area_hectares'),
+    'ndvi': (MonitoringData, 'observation_date', None, 'ndvi_mean')
+}
+
+# metric -> (name of the reported value, report the mean instead of the sum)
+METRIC_VALUES = {
+    'claims': ('area_hectares', False),
+    'approvals': ('area_hectares', False),
+    'alerts': ('affected_area_hectares', False),
+    'ndvi': ('ndvi_mean', True)
+}
+
+RollupKey = Tuple[str, str, date, str, str, str]
+
+
+def bucket_start(bucket: str, day: date) -> date:
+    """First day of the bucket containing day, matching Postgres date_trunc"""
+    if isinstance(day, datetime):
+        day = day.date()
+    if bucket == 'quarter':
+        return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+    if bucket == 'year':
+        return date(day.year, 1, 1)
+    if bucket in ('week', 'month'):
+        return period_start(bucket, day)
+    raise ValueError(f'Invalid bucket. Must be one of: {list(BUCKETS)}')
+
+
+def _attribute_values(instance, names: Sequence[str], previous: bool) -> Dict[str, object]:
+    """Current attribute values, or the values before this flush when previous is set"""
+    state = inspect(instance)
+    values = {}
+    for name in names:
+        history = state.attrs[name].history
+        values[name] = history.deleted[0] if previous and history.deleted else getattr(instance, name)
+    return values
+
+
+def _contributions(instance, location: Tuple[str, str], previous: bool = False) -> List[Tuple[RollupKey, int, float]]:
+    """Rollup rows (key, count, value) an instance adds in every bucket"""
+    rows = []
+    for metric, (model, date_attr, status_attr, value_attr) in METRICS.items():
+        if not isinstance(instance, model):
+            continue
+        
+        names = [date_attr, value_attr] + ([status_attr] if status_attr else [])
+        values = _attribute_values(instance, names, previous)
+        if values[date_attr] is None:
+            continue
+        if metric == 'ndvi' and values[value_attr] is None:
+            continue
+        
+        status = (values[status_attr] or '') if status_attr else ''
+        for bucket in BUCKETS:
+            key = (metric, bucket, bucket_start(bucket, values[date_attr]), location[0], location[1], status)
+            rows.append((key, 1, float(values[value_attr] or 0.0)))
+    return rows
+
+
+def _claim_locations(session, instances) -> Dict[object, Tuple[str, str]]:
+    """(state, district) per claim id for the alerts and observations of a flush, in one query"""
+    claim_ids = {instance.claim_id for instance in instances if not isinstance(instance, FRAClaim)}
+    if not claim_ids:
+        return {}
+    with session.no_autoflush:
+        rows = session.query(FRAClaim.id, FRAClaim.state, FRAClaim.district).filter(
+            FRAClaim.id.in_(claim_ids)
+        ).all()
+    return {claim_id: (state, district) for claim_id, state, district in rows}
+
+
+def _location(instance, locations, previous: bool = False) -> Optional[Tuple[str, str]]:
+    if isinstance(instance, FRAClaim):
+        values = _attribute_values(instance, ['state', 'district'], previous)
+        return values['state'], values['district']
+    return locations.get(instance.claim_id)
+
+
+def apply_deltas(session, deltas: Dict[RollupKey, List[float]]):
+    """Add (count, value) deltas to their rollup rows with one atomic upsert"""
+    rows = [
+        {
+            'metric': metric, 'bucket': bucket, 'period_start': start,
+            'state': state, 'district': district, 'status': status,
+            'item_count': int(count), 'value_sum': value, 'updated_at': datetime.utcnow()
+        }
+        for (metric, bucket, start, state, district, status), (count, value) in deltas.items()
+        if count or value
+    ]
+    if not rows:
+        return
+    
+    table = AnalyticsRollup.__table__
+    statement = pg_insert(table).values(rows)
+    session.execute(statement.on_conflict_do_update(
+        index_elements=['metric', 'bucket', 'period_start', 'state', 'district', 'status'],
+        set_={
+            'item_count': table.c.item_count + statement.excluded.item_count,
+            'value_sum': table.c.value_sum + statement.excluded.value_sum,
+            'updated_at': statement.excluded.updated_at
+        }
+    ))
+
+
+def _track_previous_values():
+    """
+    Load an attribute's old value when it is assigned, so updates to expired
+    instances (the usual case after a commit) still know which key to leave
+    """
+    attributes = {(FRAClaim, 'state'), (FRAClaim, 'district')}
+    for model, date_attr, status_attr, value_attr in METRICS.values():
+        attributes.update((model, name) for name in (date_attr, status_attr, value_attr) if name)
+    for model, name in attributes:
+        event.listen(getattr(model, name), 'set', lambda *args: None, active_history=True)
+
+
+_track_previous_values()
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_analytics_rollups(session, flush_context):
+    """
+    Fold the flush into the rollups: new rows add their contribution, deleted
+    rows subtract theirs and updated rows move from their old key to the new
+    one (e.g. a claim changing status or gaining an approval date). Runs in
+    the flushing transaction, so rollups commit or roll back with the data.
+    
+    A claim moving to another state/district does not carry its alerts and
+    observations along; `flask rebuild-analytics-rollups` re-derives everything.
+    """
+    tracked = tuple({model for model, *_ in METRICS.values()})
+    new = [instance for instance in session.new if isinstance(instance, tracked)]
+    dirty = [
+        instance for instance in session.dirty
+        if isinstance(instance, tracked) and session.is_modified(instance, include_collections=False)
+    ]
+    deleted = [instance for instance in session.deleted if isinstance(instance, tracked)]
+    if not (new or dirty or deleted):
+        return
+    
+    locations = _claim_locations(session, (*new, *dirty, *deleted))
+    deltas = defaultdict(lambda: [0, 0.0])
+    
+    def add(instance, sign, previous=False):
+        location = _location(instance, locations, previous)
+        if location is None:
+            return
+        for key, count, value in _contributions(instance, location, previous):
+            deltas[key][0] += sign * count
+            deltas[key][1] += sign * value
+    
+    for instance in new:
+        add(instance, 1)
+    for instance in dirty:
+        add(instance, -1, previous=True)
+        add(instance, 1)
+    for instance in deleted:
+        add(instance, -1, previous=True)
+    
+    apply_deltas(session, deltas)
+
+
+def rebuild_rollups() -> int:
+    """Recompute every rollup row from the source tables (the caller commits)"""
+    table = AnalyticsRollup.__table__
+    db.session.execute(table.delete())
+    
+    for metric, (model, date_attr, status_attr, value_attr) in METRICS.items():
+        date_column = getattr(model, date_attr)
+        value_column = getattr(model, value_attr)
+        status = getattr(model, status_attr) if status_attr else literal('')
+        
+        for bucket in BUCKETS:
+            period = cast(func.date_trunc(bucket, date_column), Date)
+            select = db.session.query(
+                literal(metric),
+                literal(bucket),
+                period,
+                FRAClaim.state,
+                FRAClaim.district,
+                func.coalesce(status, ''),
+                func.count(),
+                func.coalesce(func.sum(value_column), 0.0),
+                func.now()
+            ).select_from(model).filter(date_column.isnot(None))
+            
+            if model is not FRAClaim:
+                select = select.join(FRAClaim, FRAClaim.id == model.claim_id)
+            if metric == 'ndvi':
+                select = select.filter(value_column.isnot(None))
+            select = select.group_by(period, FRAClaim.state, FRAClaim.district, func.coalesce(status, ''))
+            
+            db.session.execute(insert(table).from_select([
+                'metric', 'bucket', 'period_start', 'state', 'district', 'status',
+                'item_count', 'value_sum', 'updated_at'
+            ], select.statement))
+    
+    return db.session.query(func.count()).select_from(table).scalar()
+
+
+def timeseries(metric: str, bucket: str, group_by: Sequence[str] = (),
+               start: Optional[date] = None, end: Optional[date] = None,
+               filters: Optional[Dict[str, str]] = None):
+    """
+    Read a metric's series from the rollups
+    
+    Cost depends on the number of buckets and groups returned, not on the
+    number of claims, alerts or observations behind them.
+    
+    Returns:
+        Rows of (period_start, *group values, count, value_sum) ordered by group then period
+    """
+    if metric not in METRICS:
+        raise ValueError(f'Invalid metric. Must be one of: {list(METRICS)}')
+    if bucket not in BUCKETS:
+        raise ValueError(f'Invalid bucket. Must be one of: {list(BUCKETS)}')
+    unknown = [column for column in group_by if column not in GROUP_BY]
+    if unknown:
+        raise ValueError(f'Invalid group_by {unknown}. Must be among: {list(GROUP_BY)}')
+    
+    group_columns = [getattr(AnalyticsRollup, column) for column in group_by]
+    query = db.session.query(
+        AnalyticsRollup.period_start,
+        *group_columns,
+        func.sum(AnalyticsRollup.item_count).label('count'),
+        func.sum(AnalyticsRollup.value_sum).label('value_sum')
+    ).filter(
+        AnalyticsRollup.metric == metric,
+        AnalyticsRollup.bucket == bucket
+    )
+    
+    if start:
+        query = query.filter(AnalyticsRollup.period_start >= bucket_start(bucket, start))
+    if end:
+        query = query.filter(AnalyticsRollup.period_start <= end)
+    for column, value in (filters or {}).items():
+        query = query.filter(getattr(AnalyticsRollup, column) == value)
+    
+    return query.group_by(
+        AnalyticsRollup.period_start, *group_columns
+    ).having(
+        func.sum(AnalyticsRollup.item_count) > 0
+    ).order_by(*group_columns, AnalyticsRollup.period_start).all()
@@ -0,0 +1,186 @@
+"""
+Streaming Anomaly Detection Service
+Constant-time scoring of new NDVI observations against each claim's own baseline
+"""
+
+import math
+from typing import Dict, Optional
+
+
+class StreamingAnomalyDetector:
+    """
+    Scores NDVI observations against compact per-claim state kept on ClaimNDVIStats:
+    an exponentially weighted mean/variance and a per-month seasonal baseline.
+    Falls back to the fixed NDVI thresholds until a claim has enough history.
+    """
+    
+    def __init__(self, alpha: float = 0.2, z_threshold: float = 2.5,
+                 critical_z: float = 4.0, min_history: int = 6,
+                 min_seasonal: int = 3, min_std: float = 0.02,
+                 alert_threshold: float = 0.3, critical_threshold: float = 0.1):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.critical_z = critical_z
+        self.min_history = min_history
+        self.min_seasonal = max(min_seasonal, 2)  # the seasonal sample std needs two observations
+        self.min_std = min_std
+        self.alert_threshold = alert_threshold
+        self.critical_threshold = critical_threshold
+    
+    @classmethod
+    def from_config(cls, config) -> 'StreamingAnomalyDetector':
+        return cls(
+            alpha=config.get('ANOMALY_EWM_ALPHA', 0.2),
+            z_threshold=config.get('ANOMALY_Z_THRESHOLD', 2.5),
+            critical_z=config.get('ANOMALY_CRITICAL_Z', 4.0),
+            min_history=config.get('ANOMALY_MIN_HISTORY', 6),
+            min_seasonal=config.get('ANOMALY_MIN_SEASONAL', 3),
+            alert_threshold=config.get('NDVI_ALERT_THRESHOLD', 0.3),
+            critical_threshold=config.get('NDVI_CRITICAL_THRESHOLD', 0.1)
+        )
+    
+    def score(self, stats, observation_date, ndvi_value: float) -> Dict[str, any]:
+        """
+        Score an observation against the claim's baseline before it is folded in
+        
+        Args:
+            stats: ClaimNDVIStats row for the claim
+            observation_date: Date of the observation
+            ndvi_value: Observed mean NDVI
+            
+        Returns:
+            Baseline used, expected value, z-score and confidence
+        """
+        month = observation_date.month - 1
+        seasonal_count = (stats.seasonal_count or [0] * 12)[month]
+        history = stats.observation_count or 0
+        
+        if seasonal_count >= self.min_seasonal:
+            baseline = 'seasonal'
+            expected = stats.seasonal_mean[month]
+            std = math.sqrt(stats.seasonal_m2[month] / (seasonal_count - 1))
+            support = seasonal_count
+        elif history >= self.min_history and stats.ewm_mean is not None:
+            baseline = 'ewm'
+            expected = stats.ewm_mean
+            std = math.sqrt(stats.ewm_var or 0.0)
+            support = history
+        else:
+            return {
+                'baseline': 'threshold',
+                'expected_ndvi': None,
+                'z_score': None,
+                'confidence': self._threshold_confidence(ndvi_value),
+                'history': history
+            }
+        
+        std = max(std, self.min_std)
+        z_score = (ndvi_value - expected) / std
+        
+        # One-sided normal confidence, shrunk while the baseline is thin
+        confidence = 0.5 * (1 + math.erf(abs(z_score) / math.sqrt(2)))
+        confidence *= support / (support + 1.0)
+        
+        return {
+            'baseline': baseline,
+            'expected_ndvi': round(expected, 3),
+            'z_score': round(z_score, 2),
+            'confidence': round(confidence, 3),
+            'history': history
+        }
+    
+    def evaluate(self, stats, observation_date, ndvi_value: float) -> Optional[Dict[str, any]]:
+        """
+        Decide whether an observation should raise an alert
+        
+        Returns:
+            Alert attributes (alert_type, severity, confidence_score, alert_details) or None
+        """
+        result = self.score(stats, observation_date, ndvi_value)
+        z_score = result['z_score']
+        if z_score is not None and not math.isfinite(z_score):
+            # A corrupted baseline (non-finite aggregates) is no baseline at all
+            result = {
+                'baseline': 'threshold',
+                'expected_ndvi': None,
+                'z_score': None,
+                'confidence': self._threshold_confidence(ndvi_value),
+                'history': result['history']
+            }
+            z_score = None
+        
+        if z_score is None:
+            if ndvi_value < self.critical_threshold:
+                alert_type, severity, threshold = 'deforestation', 'critical', self.critical_threshold
+            elif ndvi_value < self.alert_threshold:
+                alert_type, severity, threshold = 'vegetation_degradation', 'medium', self.alert_threshold
+            else:
+                return None
+            method = 'NDVI_threshold'
+        else:
+            if z_score > -self.z_threshold:
+                return None
+            
+            if z_score <= -self.critical_z or ndvi_value < self.critical_threshold:
+                alert_type, severity = 'deforestation', 'critical'
+            elif ndvi_value < self.alert_threshold:
+                alert_type, severity = 'vegetation_degradation', 'high'
+            else:
+                alert_type, severity = 'vegetation_degradation', 'medium'
+            threshold = None
+            method = f'streaming_{result["baseline"]}_zscore'
+        
+        details = {
+            'ndvi_value': ndvi_value,
+            'detection_method': method,
+            'baseline': result['baseline'],
+            'expected_ndvi': result['expected_ndvi'],
+            'z_score': z_score,
+            'history_points': result['history']
+        }
+        if threshold is not None:
+            details['threshold'] = threshold
+        
+        return {
+            'alert_type': alert_type,
+            'severity': severity,
+            'confidence_score': result['confidence'],
+            'alert_details': details
+        }
+    
+    def update(self, stats, observation_date, ndvi_value: float):
+        """Fold an observation into the detector state (call before ClaimNDVIStats.add_observation)"""
+        ndvi_value = float(ndvi_value)
+        
+        # EWM level only follows in-order observations; back-fills still feed the seasonal baseline
+        is_latest = stats.latest_observation_date is None or observation_date >= stats.latest_observation_date
+        if stats.ewm_mean is None:
+            stats.ewm_mean = ndvi_value
+            stats.ewm_var = 0.0
+        elif is_latest:
+            diff = ndvi_value - stats.ewm_mean
+            increment = self.alpha * diff
+            stats.ewm_mean = stats.ewm_mean + increment
+            stats.ewm_var = (1 - self.alpha) * ((stats.ewm_var or 0.0) + diff * increment)
+        
+        # Per-month Welford; assign new lists so the ARRAY columns are flagged dirty
+        month = observation_date.month - 1
+        counts = list(stats.seasonal_count or [0] * 12)
+        means = list(stats.seasonal_mean or [0.0] * 12)
+        m2s = list(stats.seasonal_m2 or [0.0] * 12)
+        
+        counts[month] += 1
+        delta = ndvi_value - means[month]
+        means[month] += delta / counts[month]
+        m2s[month] += delta * (ndvi_value - means[month])
+        
+        stats.seasonal_count = counts
+        stats.seasonal_mean = means
+        stats.seasonal_m2 = m2s
+    
+    def _threshold_confidence(self, ndvi_value: float) -> float:
+        """Confidence for the warm-up threshold rule, growing with distance below the threshold"""
+        if ndvi_value >= self.alert_threshold:
+            return 0.0
+        depth = (self.alert_threshold - ndvi_value) / self.alert_threshold
+        return round(min(0.95, 0.6 + 0.35 * depth), 3)
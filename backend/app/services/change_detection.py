@@ -0,0 +1,286 @@
+"""
+Raster Change Detection Service
+Before/after NDVI differencing, connected loss patches and loss/gain areas
+"""
+
+import numpy as np
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+
+class RasterUnavailable(Exception):
+    """Raised when an observation's raster file is missing or cannot be read"""
+    
+    def __init__(self, path: str, reason: str):
+        super().__init__(f'{path}: {reason}')
+        self.path = path
+
+
+def _open_raster(path: str):
+    import rasterio
+    from rasterio.errors import RasterioIOError
+    
+    try:
+        return rasterio.open(path)
+    except RasterioIOError as e:
+        raise RasterUnavailable(path, str(e)) from e
+
+
+class RasterChangeDetector:
+    """
+    Tile-by-tile change detection over two co-registered NDVI rasters.
+    
+    Blocks are full-width row strips. Loss pixels are run-length encoded per row
+    and runs touching across rows (4-connectivity, including across strip
+    boundaries) are joined in a two-pass connected-components step, so memory
+    is bounded by one strip plus the run-length encoding of the loss mask.
+    """
+    
+    def __init__(self, pixel_area_ha: float, loss_threshold: float = -0.15,
+                 gain_threshold: float = 0.15, min_patch_area_ha: float = 0.5,
+                 transform: Optional[Tuple[float, ...]] = None):
+        """
+        Args:
+            pixel_area_ha: Area of one pixel in hectares
+            loss_threshold: NDVI difference at or below which a pixel counts as loss
+            gain_threshold: NDVI difference at or above which a pixel counts as gain
+            min_patch_area_ha: Loss patches smaller than this are not polygonized
+            transform: Affine (a, b, c, d, e, f) from pixel (col, row) to map
+                       coordinates; pixel coordinates are used when omitted
+        """
+        self.pixel_area_ha = pixel_area_ha
+        self.loss_threshold = loss_threshold
+        self.gain_threshold = gain_threshold
+        self.min_patch_area_ha = min_patch_area_ha
+        self.transform = transform
+    
+    def detect(self, blocks: Iterable[Tuple[int, np.ndarray, np.ndarray]]) -> Dict[str, any]:
+        """
+        Run change detection over (row_offset, before_block, after_block) strips
+        
+        Returns:
+            Loss/gain/valid hectares and the loss patches above min_patch_area_ha,
+            largest first, each with area, mean NDVI change and a polygon
+        """
+        loss_pixels = gain_pixels = valid_pixels = 0
+        run_rows, run_starts, run_ends, run_sums = [], [], [], []
+        pair_a, pair_b = [], []
+        run_offset = 0
+        carry = None  # runs of the previous strip's last row
+        
+        for row_offset, before, after in blocks:
+            before = np.asarray(before, dtype=float)
+            after = np.asarray(after, dtype=float)
+            diff = after - before
+            valid = ~np.isnan(diff)
+            loss = valid & (diff <= self.loss_threshold)
+            
+            valid_pixels += int(valid.sum())
+            loss_pixels += int(loss.sum())
+            gain_pixels += int((valid & (diff >= self.gain_threshold)).sum())
+            
+            rows, starts, ends, sums = self._encode_runs(loss, np.where(loss, diff, 0.0))
+            rows += row_offset
+            
+            # First pass: link runs overlapping a run in the row above
+            if carry is not None:
+                link_rows = np.concatenate((carry[0], rows))
+                link_starts = np.concatenate((carry[1], starts))
+                link_ends = np.concatenate((carry[2], ends))
+                link_ids = np.concatenate((carry[3], run_offset + np.arange(rows.size)))
+            else:
+                link_rows, link_starts, link_ends = rows, starts, ends
+                link_ids = run_offset + np.arange(rows.size)
+            
+            a, b = self._overlapping_pairs(link_rows, link_starts, link_ends, loss.shape[1])
+            pair_a.append(link_ids[a])
+            pair_b.append(link_ids[b])
+            
+            run_rows.append(rows)
+            run_starts.append(starts)
+            run_ends.append(ends)
+            run_sums.append(sums)
+            
+            last_row = row_offset + loss.shape[0] - 1
+            in_last_row = rows == last_row
+            carry = (rows[in_last_row], starts[in_last_row], ends[in_last_row],
+                     run_offset + np.flatnonzero(in_last_row))
+            run_offset += rows.size
+        
+        result = {
+            'loss_area_ha': round(loss_pixels * self.pixel_area_ha, 4),
+            'gain_area_ha': round(gain_pixels * self.pixel_area_ha, 4),
+            'valid_area_ha': round(valid_pixels * self.pixel_area_ha, 4),
+            'patches': []
+        }
+        if run_offset == 0:
+            return result
+        
+        rows = np.concatenate(run_rows)
+        starts = np.concatenate(run_starts)
+        ends = np.concatenate(run_ends)
+        sums = np.concatenate(run_sums)
+        pair_a = np.concatenate(pair_a)
+        pair_b = np.concatenate(pair_b)
+        
+        # Second pass: resolve run equivalences into patch labels
+        graph = coo_matrix((np.ones(pair_a.size, dtype=np.int8), (pair_a, pair_b)),
+                           shape=(run_offset, run_offset))
+        patch_count, labels = connected_components(graph, directed=False)
+        
+        lengths = ends - starts
+        patch_pixels = np.bincount(labels, weights=lengths, minlength=patch_count)
+        patch_sums = np.bincount(labels, weights=sums, minlength=patch_count)
+        
+        min_pixels = self.min_patch_area_ha / self.pixel_area_ha
+        large = np.flatnonzero(patch_pixels >= min_pixels)
+        large = large[np.argsort(-patch_pixels[large])]
+        
+        order = np.argsort(labels, kind='stable')
+        boundaries = np.searchsorted(labels[order], np.arange(patch_count + 1))
+        
+        for patch in large:
+            members = order[boundaries[patch]:boundaries[patch + 1]]
+            result['patches'].append({
+                'pixel_count': int(patch_pixels[patch]),
+                'area_ha': round(float(patch_pixels[patch]) * self.pixel_area_ha, 4),
+                'mean_ndvi_change': round(float(patch_sums[patch] / patch_pixels[patch]), 3),
+                'geometry': self._polygonize(rows[members], starts[members], ends[members])
+            })
+        
+        return result
+    
+    @staticmethod
+    def _encode_runs(mask: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Run-length encode a boolean block row by row (end column exclusive)"""
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        start_rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        
+        cumulative = np.zeros((mask.shape[0], mask.shape[1] + 1))
+        np.cumsum(values, axis=1, out=cumulative[:, 1:])
+        sums = cumulative[start_rows, ends] - cumulative[start_rows, starts]
+        
+        return start_rows, starts, ends, sums
+    
+    @staticmethod
+    def _overlapping_pairs(rows: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                           width: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Index pairs (i, j) where run j in the row above overlaps run i"""
+        if rows.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        
+        stride = width + 1
+        start_keys = rows * stride + starts
+        end_keys = rows * stride + ends
+        
+        above = (rows - 1) * stride
+        lo = np.searchsorted(end_keys, above + starts, side='right')
+        hi = np.searchsorted(start_keys, above + ends, side='left')
+        counts = np.maximum(hi - lo, 0)
+        
+        current = np.repeat(np.arange(rows.size), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return current, np.repeat(lo, counts) + offsets
+    
+    def _polygonize(self, rows: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        """Union of run rectangles, mapped through the affine transform"""
+        import shapely
+        from shapely.affinity import affine_transform
+        
+        polygon = shapely.unary_union(shapely.box(starts, rows, ends, rows + 1))
+        if self.transform is None:
+            return polygon
+        
+        a, b, c, d, e, f = self.transform[:6]
+        return affine_transform(polygon, [a, b, d, e, c, f])
+
+
+def iter_raster_blocks(before_path: str, after_path: str, block_rows: int = 512,
+                       geometry=None) -> Tuple[Dict[str, any], Callable[[], Iterable]]:
+    """
+    Open two co-registered single-band NDVI rasters for strip-wise reading
+    
+    When a WGS84 geometry is given, only the strips overlapping it are read and
+    pixels outside it are set to NaN, so areas are counted within the geometry.
+    
+    Returns:
+        (raster info with 'transform', 'crs', 'pixel_area_ha', 'shape',
+         zero-argument callable yielding (row_offset, before, after) strips)
+    """
+    from rasterio.features import geometry_mask
+    from rasterio.windows import Window, from_bounds
+    from rasterio.windows import transform as window_transform
+    
+    with _open_raster(before_path) as before_src, _open_raster(after_path) as after_src:
+        if before_src.shape != after_src.shape or before_src.transform != after_src.transform:
+            raise ValueError('Before and after rasters are not co-registered')
+        
+        transform = before_src.transform
+        crs = before_src.crs
+        height, width = before_src.shape
+    
+    if crs is not None and crs.is_projected:
+        pixel_area_ha = abs(transform.a * transform.e - transform.b * transform.d) / 10000
+    else:
+        # Geographic degrees: approximate metres at the raster's central latitude
+        center_lat = transform.f + transform.e * height / 2
+        metres_x = abs(transform.a) * 111320 * np.cos(np.radians(center_lat))
+        metres_y = abs(transform.e) * 110540
+        pixel_area_ha = metres_x * metres_y / 10000
+    
+    # Strips stay full-width; only the rows covering the geometry are read
+    first_row, last_row = 0, height
+    if geometry is not None:
+        geometry = from_wgs84(geometry, crs.to_string() if crs else None)
+        bounds = from_bounds(*geometry.bounds, transform=transform)
+        first_row = max(0, int(np.floor(bounds.row_off)))
+        last_row = min(height, int(np.ceil(bounds.row_off + bounds.height)))
+    
+    def blocks():
+        with _open_raster(before_path) as before_src, _open_raster(after_path) as after_src:
+            for row_offset in range(first_row, last_row, block_rows):
+                window = Window(0, row_offset, width, min(block_rows, last_row - row_offset))
+                before = before_src.read(1, window=window, masked=True).astype(float).filled(np.nan)
+                after = after_src.read(1, window=window, masked=True).astype(float).filled(np.nan)
+                if geometry is not None:
+                    outside = geometry_mask([geometry], out_shape=before.shape,
+                                            transform=window_transform(window, transform))
+                    before[outside] = np.nan
+                    after[outside] = np.nan
+                yield row_offset, before, after
+    
+    info = {
+        'transform': tuple(transform)[:6],
+        'crs': crs.to_string() if crs else None,
+        'pixel_area_ha': pixel_area_ha,
+        'shape': (height, width)
+    }
+    return info, blocks
+
+
+def to_wgs84(geometry, crs: Optional[str]):
+    """Reproject a shapely geometry from the raster CRS to EPSG:4326"""
+    if crs is None or crs.upper() in ('EPSG:4326', 'OGC:CRS84'):
+        return geometry
+    
+    from pyproj import Transformer
+    from shapely.ops import transform
+    
+    transformer = Transformer.from_crs(crs, 'EPSG:4326', always_xy=True)
+    return transform(transformer.transform, geometry)
+
+
+def from_wgs84(geometry, crs: Optional[str]):
+    """Reproject a shapely geometry from EPSG:4326 to the raster CRS"""
+    if crs is None or crs.upper() in ('EPSG:4326', 'OGC:CRS84'):
+        return geometry
+    
+    from pyproj import Transformer
+    from shapely.ops import transform
+    
+    transformer = Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+    return transform(transformer.transform, geometry)
@@ -0,0 +1,140 @@
+"""
+Columnar Response Service
+Content negotiation and binary (Arrow IPC / NumPy .npz) serialization of column arrays
+"""
+
+import io
+import json
+import numpy as np
+from typing import Dict, Optional
+from flask import Response
+
+JSON_MIMETYPE = 'application/json'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+NPZ_MIMETYPE = 'application/x-npz'
+
+FORMAT_MIMETYPES = {
+    'json': JSON_MIMETYPE,
+    'arrow': ARROW_MIMETYPE,
+    'npz': NPZ_MIMETYPE
+}
+
+# Metadata entry of .npz payloads; column names never start with an underscore
+NPZ_METADATA_KEY = '__metadata__'
+
+
+def arrow_available() -> bool:
+    """Whether the optional pyarrow dependency is installed"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate_format(request, explicit: Optional[str] = None) -> str:
+    """
+    Pick 'json', 'arrow' or 'npz' for a request
+    
+    An explicit format (e.g. a ?format= argument) wins over the Accept header.
+    JSON is preferred on ties so browsers sending */* keep getting JSON, and
+    Arrow requests fall back to .npz when pyarrow is not installed.
+    """
+    if explicit in FORMAT_MIMETYPES:
+        selected = explicit
+    else:
+        mimetype = request.accept_mimetypes.best_match(
+            [JSON_MIMETYPE, ARROW_MIMETYPE, NPZ_MIMETYPE], default=JSON_MIMETYPE
+        )
+        selected = next(name for name, value in FORMAT_MIMETYPES.items() if value == mimetype)
+    
+    if selected == 'arrow' and not arrow_available():
+        return 'npz'
+    return selected
+
+
+def to_column(values, dtype=None) -> np.ndarray:
+    """
+    Column array from a sequence that may contain None
+    
+    Numeric dtypes map None to NaN, 'datetime64[D]' maps None to NaT and the
+    default object dtype keeps None so Arrow can encode it as null.
+    """
+    if dtype is None:
+        return np.array(list(values), dtype=object)
+    if np.dtype(dtype).kind == 'M':
+        return np.array([value if value is not None else 'NaT' for value in values], dtype=dtype)
+    return np.array([value if value is not None else np.nan for value in values], dtype=dtype)
+
+
+def json_column(column: np.ndarray) -> list:
+    """JSON-ready list of a column: ISO dates, None for NaN/NaT, native Python scalars"""
+    column = np.asarray(column)
+    if column.dtype.kind == 'M':
+        if column.dtype == np.dtype('datetime64[ns]'):
+            column = column.astype('datetime64[us]')  # ns values would come back as ints
+        return [None if value is None else value.isoformat() for value in column.tolist()]
+    if column.dtype.kind == 'f':
+        return np.where(np.isnan(column), None, column).tolist()
+    return column.tolist()
+
+
+def json_records(columns: Dict[str, np.ndarray]) -> list:
+    """Row dicts from column arrays, for JSON responses of the same query path"""
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(json_column(column) for column in columns.values()))]
+
+
+def _arrow_payload(columns: Dict[str, np.ndarray], metadata: dict) -> bytes:
+    import pyarrow as pa
+    
+    arrays = [pa.array(column, from_pandas=True) for column in columns.values()]
+    table = pa.Table.from_arrays(arrays, names=list(columns))
+    table = table.replace_schema_metadata({'metadata': json.dumps(metadata, default=str)})
+    
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _npz_payload(columns: Dict[str, np.ndarray], metadata: dict) -> bytes:
+    arrays = {}
+    for name, column in columns.items():
+        column = np.asarray(column)
+        if column.dtype == object:
+            # Object arrays would need pickling; store strings with '' for missing values
+            column = np.array(['' if value is None else str(value) for value in column], dtype=str)
+        arrays[name] = column
+    arrays[NPZ_METADATA_KEY] = np.array(json.dumps(metadata, default=str))
+    
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def columnar_response(columns: Dict[str, np.ndarray], response_format: str,
+                      metadata: Optional[dict] = None, filename: Optional[str] = None) -> Response:
+    """
+    Serialize equal-length column arrays as an Arrow IPC stream or a .npz archive
+    
+    Args:
+        columns: Ordered column name -> 1-D array
+        response_format: 'arrow' or 'npz' (see negotiate_format)
+        metadata: JSON-serializable context, stored as Arrow schema metadata
+                  or as the '__metadata__' entry of the .npz archive
+        filename: Sends the payload as an attachment when given (extension added)
+    """
+    metadata = metadata or {}
+    if response_format == 'arrow':
+        payload, extension = _arrow_payload(columns, metadata), 'arrow'
+    elif response_format == 'npz':
+        payload, extension = _npz_payload(columns, metadata), 'npz'
+    else:
+        raise ValueError(f'Unsupported columnar format: {response_format}')
+    
+    response = Response(payload, mimetype=FORMAT_MIMETYPES[response_format])
+    response.headers['Vary'] = 'Accept'
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.{extension}'
+    return response
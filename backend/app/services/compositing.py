@@ -0,0 +1,163 @@
+"""
+Temporal Compositing Service
+Maximum-value NDVI composites on a regular date grid with gap filling
+"""
+
+import re
+import numpy as np
+from typing import Dict, Optional
+
+from .seasonal_analysis import SeasonalDecomposer
+
+
+class TemporalCompositor:
+    """
+    Builds claims x windows maximum-value composites from irregular, cloud-affected
+    observations. Each observation is scored as ndvi - quality_penalty * (1 - quality),
+    where quality = data_quality_score * (1 - cloud_cover / 100), so a clear scene
+    wins over a hazier one unless the hazier one is clearly greener. Windows are
+    fixed N-day bins aligned to the Unix epoch ('10D', '16D', ...) or calendar months.
+    """
+    
+    GAP_FILL_METHODS = ('none', 'linear', 'harmonic')
+    
+    def __init__(self, window: str = '10D', min_quality: float = 0.0,
+                 quality_penalty: float = 0.5, gap_fill: str = 'linear'):
+        if window != 'monthly' and not re.fullmatch(r'\d+D', window):
+            raise ValueError("Invalid composite window. Use 'monthly' or '<days>D', e.g. '10D'")
+        if gap_fill not in self.GAP_FILL_METHODS:
+            raise ValueError(f'Invalid gap fill method. Must be one of: {list(self.GAP_FILL_METHODS)}')
+        
+        self.window = window
+        self.min_quality = min_quality
+        self.quality_penalty = quality_penalty
+        self.gap_fill = gap_fill
+        self.seasonal = SeasonalDecomposer()
+    
+    def bin_index(self, dates: np.ndarray) -> np.ndarray:
+        """Absolute window number of each datetime64[D] value"""
+        if self.window == 'monthly':
+            return dates.astype('datetime64[M]').astype(np.int64)
+        return dates.astype(np.int64) // int(self.window[:-1])
+    
+    def bin_start(self, bins: np.ndarray) -> np.ndarray:
+        """First day of each absolute window number"""
+        if self.window == 'monthly':
+            return bins.astype('datetime64[M]').astype('datetime64[D]')
+        return (bins * int(self.window[:-1])).astype('datetime64[D]')
+    
+    @staticmethod
+    def quality(data_quality: Optional[np.ndarray], cloud_cover: Optional[np.ndarray], size: int) -> np.ndarray:
+        """Combined 0-1 quality; missing scores count as fully reliable"""
+        score = np.ones(size) if data_quality is None else np.nan_to_num(
+            np.asarray(data_quality, dtype=float), nan=1.0)
+        if cloud_cover is not None:
+            clear = 1 - np.nan_to_num(np.asarray(cloud_cover, dtype=float), nan=0.0) / 100
+            score = score * np.clip(clear, 0.0, 1.0)
+        return score
+    
+    def composite(self, claim_index: np.ndarray, dates: np.ndarray, ndvi: np.ndarray,
+                  n_claims: int, data_quality: Optional[np.ndarray] = None,
+                  cloud_cover: Optional[np.ndarray] = None,
+                  start: Optional[np.datetime64] = None,
+                  end: Optional[np.datetime64] = None) -> Dict[str, np.ndarray]:
+        """
+        Composite observations of many claims onto one regular grid
+        
+        Args:
+            claim_index: Row (0..n_claims-1) of each observation
+            dates: datetime64[D] observation dates
+            ndvi: Observed NDVI values
+            n_claims: Number of rows in the output
+            data_quality, cloud_cover: Optional per-observation quality inputs
+            start, end: Grid bounds, defaulting to the observed date range
+        
+        Returns:
+            'dates' (n_windows,), 'values' (n_claims, n_windows) NaN where empty,
+            'observations' per cell and 'filled' marking gap-filled cells
+        """
+        claim_index = np.asarray(claim_index, dtype=np.int64)
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        ndvi = np.asarray(ndvi, dtype=float)
+        quality = self.quality(data_quality, cloud_cover, ndvi.size)
+        
+        keep = ~np.isnan(ndvi) & (quality >= self.min_quality)
+        claim_index, dates, ndvi, quality = claim_index[keep], dates[keep], ndvi[keep], quality[keep]
+        
+        if start is None and dates.size:
+            start = dates.min()
+        if end is None and dates.size:
+            end = dates.max()
+        if start is None:
+            return {
+                'dates': np.array([], dtype='datetime64[D]'),
+                'values': np.empty((n_claims, 0)),
+                'observations': np.zeros((n_claims, 0), dtype=np.int64),
+                'filled': np.zeros((n_claims, 0), dtype=bool)
+            }
+        
+        first_bin = self.bin_index(np.array([start], dtype='datetime64[D]'))[0]
+        last_bin = self.bin_index(np.array([end], dtype='datetime64[D]'))[0]
+        n_windows = int(last_bin - first_bin + 1)
+        
+        bins = self.bin_index(dates) - first_bin
+        in_range = (bins >= 0) & (bins < n_windows)
+        cells = claim_index[in_range] * n_windows + bins[in_range]
+        ndvi, quality = ndvi[in_range], quality[in_range]
+        
+        # Best-scoring observation per cell: sort by (cell, score) and keep each cell's last
+        score = ndvi - self.quality_penalty * (1 - quality)
+        order = np.lexsort((score, cells))
+        sorted_cells = cells[order]
+        is_last = np.append(sorted_cells[1:] != sorted_cells[:-1], True) if sorted_cells.size else sorted_cells.astype(bool)
+        
+        values = np.full(n_claims * n_windows, np.nan)
+        values[sorted_cells[is_last]] = ndvi[order][is_last]
+        values = values.reshape(n_claims, n_windows)
+        observations = np.bincount(cells, minlength=n_claims * n_windows).reshape(n_claims, n_windows)
+        
+        grid = self.bin_start(np.arange(first_bin, last_bin + 1))
+        filled_values = self.fill_gaps(grid, values)
+        
+        return {
+            'dates': grid,
+            'values': filled_values,
+            'observations': observations,
+            'filled': np.isnan(values) & ~np.isnan(filled_values)
+        }
+    
+    def fill_gaps(self, grid: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Fill empty windows row-wise with the configured method"""
+        if self.gap_fill == 'none' or values.size == 0:
+            return values
+        if self.gap_fill == 'harmonic':
+            return self._harmonic_fill(grid, values)
+        return self._linear_fill(values)
+    
+    @staticmethod
+    def _linear_fill(values: np.ndarray) -> np.ndarray:
+        """Linear interpolation between the nearest observed windows (no extrapolation)"""
+        n_windows = values.shape[1]
+        positions = np.arange(n_windows)
+        observed = ~np.isnan(values)
+        
+        previous = np.maximum.accumulate(np.where(observed, positions, -1), axis=1)
+        following = np.minimum.accumulate(
+            np.where(observed, positions, n_windows)[:, ::-1], axis=1
+        )[:, ::-1]
+        interior = ~observed & (previous >= 0) & (following < n_windows)
+        
+        rows = np.arange(values.shape[0])[:, np.newaxis]
+        left = values[rows, np.clip(previous, 0, n_windows - 1)]
+        right = values[rows, np.clip(following, 0, n_windows - 1)]
+        span = np.maximum(following - previous, 1)
+        interpolated = left + (right - left) * (positions - previous) / span
+        
+        return np.where(interior, interpolated, values)
+    
+    def _harmonic_fill(self, grid: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Fill with each row's harmonic-regression fit; rows too sparse to fit fall back to linear"""
+        fit = self.seasonal.fit_batch(grid, values)
+        fitted = self.seasonal.predict(fit['coefficients'], grid, origin=grid.min())
+        filled = np.where(np.isnan(values), fitted, values)
+        return np.where(np.isnan(filled), self._linear_fill(values), filled)
@@ -0,0 +1,179 @@
+"""
+NDVI Forecasting Service
+Batch Holt-Winters and harmonic-trend forecasts over a claims x months matrix
+"""
+
+import warnings
+import numpy as np
+from datetime import datetime, date
+from typing import Dict
+
+from .seasonal_analysis import SeasonalDecomposer
+
+
+class NDVIForecaster:
+    """
+    Fits one model per claim, vectorized over the claims axis, on monthly mean NDVI.
+    'harmonic' reuses SeasonalDecomposer (trend + Fourier terms, analytic intervals);
+    'holt_winters' runs additive triple exponential smoothing with shared
+    smoothing constants, treating missing months as their own forecast.
+    """
+    
+    METHODS = ('harmonic', 'holt_winters')
+    SEASON_LENGTH = 12
+    
+    def __init__(self, method: str = 'harmonic', horizon: int = 6, z_value: float = 1.96,
+                 alpha: float = 0.3, beta: float = 0.05, gamma: float = 0.2):
+        if method not in self.METHODS:
+            raise ValueError(f'Invalid forecast method. Must be one of: {list(self.METHODS)}')
+        self.method = method
+        self.horizon = horizon
+        self.z_value = z_value
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+        self.seasonal = SeasonalDecomposer()
+    
+    def forecast(self, months: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Forecast every claim's next `horizon` months
+        
+        Args:
+            months: datetime64[M] grid of length n
+            values: (claims, n) monthly mean NDVI, NaN for months without data
+        
+        Returns:
+            'target_months' (horizon,), 'predicted', 'lower', 'upper' (claims, horizon)
+            and 'valid' (claims,) marking claims with enough history to forecast
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        target_months = months[-1] + np.arange(1, self.horizon + 1)
+        
+        if self.method == 'harmonic':
+            predicted, spread = self._harmonic(months, values, target_months)
+        else:
+            predicted, spread = self._holt_winters(values)
+        
+        valid = ~np.isnan(predicted).any(axis=1)
+        return {
+            'target_months': target_months,
+            'predicted': predicted,
+            'lower': predicted - self.z_value * spread,
+            'upper': predicted + self.z_value * spread,
+            'valid': valid
+        }
+    
+    def _harmonic(self, months: np.ndarray, values: np.ndarray, target_months: np.ndarray):
+        # Mid-month dates keep the annual harmonics aligned with the monthly means
+        dates = months.astype('datetime64[D]') + 14
+        future = target_months.astype('datetime64[D]') + 14
+        
+        fit = self.seasonal.fit_batch(dates, values)
+        predicted = self.seasonal.predict(fit['coefficients'], future, origin=dates.min())
+        spread = self.seasonal.prediction_std(fit, future, origin=dates.min())
+        return predicted, spread
+    
+    def _holt_winters(self, values: np.ndarray):
+        n_claims, n_months = values.shape
+        season = self.SEASON_LENGTH
+        nan_result = np.full((n_claims, self.horizon), np.nan)
+        if n_months < 2 * season:
+            return nan_result, nan_result
+        
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN first seasons
+            first = np.nanmean(values[:, :season], axis=1)
+            second = np.nanmean(values[:, season:2 * season], axis=1)
+        
+        level = first
+        trend = (second - first) / season
+        seasonal = np.nan_to_num(values[:, :season] - first[:, np.newaxis])
+        
+        squared_errors = np.zeros(n_claims)
+        error_counts = np.zeros(n_claims)
+        for t in range(n_months):
+            position = t % season
+            expected = level + trend + seasonal[:, position]
+            observed = values[:, t]
+            has_value = ~np.isnan(observed)
+            y = np.where(has_value, observed, expected)
+            
+            if t >= season:
+                errors = np.where(has_value, y - expected, 0.0)
+                squared_errors += errors ** 2
+                error_counts += has_value
+            
+            new_level = self.alpha * (y - seasonal[:, position]) + (1 - self.alpha) * (level + trend)
+            trend = self.beta * (new_level - level) + (1 - self.beta) * trend
+            seasonal[:, position] = self.gamma * (y - new_level) + (1 - self.gamma) * seasonal[:, position]
+            level = new_level
+        
+        steps = np.arange(1, self.horizon + 1)
+        positions = (n_months + steps - 1) % season
+        predicted = level[:, np.newaxis] + steps * trend[:, np.newaxis] + seasonal[:, positions]
+        
+        sigma = np.sqrt(squared_errors / np.maximum(error_counts - 3, 1))
+        sigma = np.where(error_counts >= season, sigma, np.nan)
+        spread = sigma[:, np.newaxis] * np.sqrt(steps)
+        return np.where(np.isnan(spread), np.nan, predicted), spread
+
+
+def generate_forecasts(method: str = 'harmonic', horizon: int = 6, history_months: int = 60) -> int:
+    """
+    Nightly batch job: forecast all claims from monthly rollups and replace ndvi_forecasts
+    
+    Returns:
+        Number of claims forecast
+    """
+    from app import db
+    from app.models import MonitoringRollup, NDVIForecast
+    
+    today = date.today()
+    current_month = np.datetime64(today, 'M')
+    first_month = current_month - history_months + 1
+    
+    rows = db.session.query(
+        MonitoringRollup.claim_id,
+        MonitoringRollup.period_start,
+        MonitoringRollup.ndvi_sum / MonitoringRollup.observation_count
+    ).filter(
+        MonitoringRollup.resolution == 'month',
+        MonitoringRollup.period_start >= first_month.astype('datetime64[D]').item(),
+        MonitoringRollup.observation_count > 0
+    ).all()
+    
+    claim_ids = list({claim_id for claim_id, _, _ in rows})
+    claim_index = {claim_id: i for i, claim_id in enumerate(claim_ids)}
+    months = np.arange(first_month, current_month + 1)
+    
+    values = np.full((len(claim_ids), months.size), np.nan)
+    if rows:
+        row_index = np.fromiter((claim_index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        month_index = np.array([row[1] for row in rows], dtype='datetime64[M]') - first_month
+        values[row_index, month_index.astype(np.int64)] = [row[2] for row in rows]
+    
+    forecaster = NDVIForecaster(method=method, horizon=horizon)
+    result = forecaster.forecast(months, values)
+    generated_at = datetime.utcnow()
+    
+    records = []
+    for i in np.flatnonzero(result['valid']):
+        for h, target_month in enumerate(result['target_months']):
+            records.append({
+                'claim_id': claim_ids[i],
+                'target_month': target_month.astype('datetime64[D]').item(),
+                'horizon_months': h + 1,
+                'predicted_ndvi': float(result['predicted'][i, h]),
+                'lower_ndvi': float(result['lower'][i, h]),
+                'upper_ndvi': float(result['upper'][i, h]),
+                'model': method,
+                'generated_at': generated_at
+            })
+    
+    # Swap the whole forecast set in one transaction
+    NDVIForecast.query.delete()
+    if records:
+        db.session.execute(NDVIForecast.__table__.insert(), records)
+    db.session.commit()
+    
+    return int(result['valid'].sum())
@@ -0,0 +1,152 @@
+"""
+Monitoring Ingestion Service
+Stores satellite observations, updates running statistics and raises anomaly alerts
+"""
+
+import math
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app import db
+from app.models import FRAClaim, MonitoringData, Alert, ClaimNDVIStats, MonitoringRollup
+from .alert_incidents import record_detection
+from .ndvi_processor import NDVIProcessor
+from .anomaly_detector import StreamingAnomalyDetector
+
+REQUIRED_FIELDS = ['claim_id', 'observation_date', 'ndvi_mean']
+
+ndvi_processor = NDVIProcessor()
+
+
+def missing_fields(data: dict) -> List[str]:
+    return [field for field in REQUIRED_FIELDS if field not in data]
+
+
+def ingest_observation(claim: FRAClaim, data: dict,
+                       detector: StreamingAnomalyDetector) -> Tuple[MonitoringData, Optional[Alert]]:
+    """
+    Add one observation to the session (the caller commits)
+
+    Returns:
+        (monitoring record, new or updated anomaly alert, or None)
+
+    Raises:
+        ValueError: Malformed observation fields
+    """
+    # NaN/inf would poison the claim's running statistics and rollups for good
+    ndvi_mean = data['ndvi_mean']
+    if isinstance(ndvi_mean, bool) or not isinstance(ndvi_mean, (int, float)) \
+            or not math.isfinite(ndvi_mean) or not -1.0 <= ndvi_mean <= 1.0:
+        raise ValueError('ndvi_mean must be a finite number between -1 and 1')
+
+    # Rasters behind the observation feed the before/after change detection
+    raw_data_path = data.get('raw_data_path')
+    if raw_data_path is not None and (not isinstance(raw_data_path, str)
+                                      or not raw_data_path.strip() or len(raw_data_path) > 500):
+        raise ValueError('raw_data_path must be a file path of at most 500 characters')
+
+    additional_metrics = dict(data.get('additional_metrics') or {})
+    if data.get('health_class_area_ha') is not None:
+        class_areas = data['health_class_area_ha']
+        if not isinstance(class_areas, list) or len(class_areas) != len(ndvi_processor.HEALTH_CLASSES) \
+                or not all(isinstance(area, (int, float)) and not isinstance(area, bool)
+                           and math.isfinite(area) and area >= 0 for area in class_areas):
+            raise ValueError(f'health_class_area_ha must list non-negative hectares for: {list(ndvi_processor.HEALTH_CLASSES)}')
+        additional_metrics.update(ndvi_processor.health_class_metrics(class_areas))
+
+    # Create monitoring record
+    monitoring_record = MonitoringData(
+        claim_id=claim.id,
+        observation_date=datetime.fromisoformat(data['observation_date']).date(),
+        satellite_source=data.get('satellite_source', 'Sentinel-2'),
+        ndvi_mean=data['ndvi_mean'],
+        ndvi_min=data.get('ndvi_min'),
+        ndvi_max=data.get('ndvi_max'),
+        ndvi_std=data.get('ndvi_std'),
+        evi_mean=data.get('evi_mean'),
+        vegetation_loss_area=data.get('vegetation_loss_area'),
+        vegetation_gain_area=data.get('vegetation_gain_area'),
+        cloud_cover_percentage=data.get('cloud_cover_percentage'),
+        data_quality_score=data.get('data_quality_score'),
+        processing_version=data.get('processing_version', '1.0'),
+        raw_data_path=raw_data_path,
+        additional_metrics=additional_metrics or None
+    )
+
+    db.session.add(monitoring_record)
+
+    # Score against the claim's own baseline, then fold the observation
+    # into its running statistics (same transaction, no history query)
+    observation_date = monitoring_record.observation_date
+    stats = ClaimNDVIStats.locked_for_claim(claim.id)
+
+    detection = detector.evaluate(stats, observation_date, data['ndvi_mean'])
+    detector.update(stats, observation_date, data['ndvi_mean'])
+    stats.add_observation(observation_date, data['ndvi_mean'])
+    MonitoringRollup.record(claim.id, observation_date, data['ndvi_mean'])
+
+    # Repeat detections update the claim's open alert of the same type
+    alert = None
+    if detection:
+        alert, _ = record_detection(
+            claim.id,
+            affected_area_hectares=data.get('vegetation_loss_area', 0),
+            **detection
+        )
+
+    return monitoring_record, alert
+
+
+def ingest_batch(observations: List[dict], detector: StreamingAnomalyDetector,
+                 commit_every: int = 500,
+                 progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, any]:
+    """
+    Ingest many observations, committing every commit_every rows
+
+    Each observation runs in a savepoint, so a malformed row is reported
+    and skipped without discarding the rest of its batch.
+
+    Returns:
+        Counts of ingested observations, new and coalesced alerts, plus per-row errors
+    """
+    claim_codes = {data.get('claim_id') for data in observations}
+    claims = {
+        claim.claim_id: claim
+        for claim in FRAClaim.query.filter(FRAClaim.claim_id.in_(claim_codes)).all()
+    }
+
+    ingested = alerts = coalesced = 0
+    errors = []
+    for index, data in enumerate(observations):
+        missing = missing_fields(data)
+        claim = claims.get(data.get('claim_id'))
+        if missing:
+            errors.append({'index': index, 'error': f'Missing required fields: {missing}'})
+        elif claim is None:
+            errors.append({'index': index, 'error': 'Claim not found'})
+        else:
+            try:
+                with db.session.begin_nested():
+                    _, alert = ingest_observation(claim, data, detector)
+                ingested += 1
+                if alert is not None:
+                    if alert.occurrence_count == 1:
+                        alerts += 1
+                    else:
+                        coalesced += 1
+            except (ValueError, TypeError) as e:
+                errors.append({'index': index, 'error': str(e)})
+
+        if (index + 1) % commit_every == 0:
+            db.session.commit()
+            if progress:
+                progress(index + 1, len(observations))
+
+    db.session.commit()
+    return {
+        'ingested': ingested,
+        'alerts_created': alerts,
+        'alerts_coalesced': coalesced,
+        'failed': len(errors),
+        'errors': errors[:100]
+    }
@@ -0,0 +1,100 @@
+"""
+Job Tasks
+Long-running operations executed by the background worker
+"""
+
+import os
+import json
+
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from .jobs import job_task
+
+
+@job_task('export_report')
+def export_report(context, format='csv'):
+    """Claims report written to a downloadable CSV / NDJSON / JSON file"""
+    from .report_export import STREAM_FORMATS, report_metadata, stream_report
+    
+    if format not in STREAM_FORMATS:
+        raise ValueError(f'Invalid format. Must be one of: {list(STREAM_FORMATS)}')
+    
+    metadata = report_metadata()
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    path = context.result_file(f'fra_atlas_report.{STREAM_FORMATS[format][1]}')
+    
+    with open(path, 'w', newline='') as output:
+        for chunk in stream_report(format, batch_size, metadata):
+            output.write(chunk)
+    
+    return {'format': format, 'total_claims': metadata['total_claims']}
+
+
+@job_task('ingest_observations')
+def ingest_observations(context, observations_path, observation_count=None):
+    """
+    Bulk satellite ingestion with the same validation and alerting as single observations;
+    the batch is read from the file staged by the request, removed once the job ends
+    """
+    from .anomaly_detector import StreamingAnomalyDetector
+    from .ingestion import ingest_batch
+    
+    try:
+        with open(observations_path) as source:
+            observations = json.load(source)
+        
+        return ingest_batch(
+            observations,
+            StreamingAnomalyDetector.from_config(current_app.config),
+            commit_every=current_app.config.get('BULK_INGEST_COMMIT_EVERY', 500),
+            progress=context.progress
+        )
+    finally:
+        if os.path.exists(observations_path):
+            os.remove(observations_path)
+
+
+@job_task('forecast_ndvi')
+def forecast_ndvi(context, method=None, horizon=None, history_months=None):
+    from .forecasting import generate_forecasts
+    
+    config = current_app.config
+    forecast_count = generate_forecasts(
+        method=method or config['FORECAST_METHOD'],
+        horizon=horizon or config['FORECAST_HORIZON_MONTHS'],
+        history_months=history_months or config['FORECAST_HISTORY_MONTHS']
+    )
+    return {'claims_forecast': forecast_count}
+
+
+@job_task('parquet_export')
+def parquet_export(context, datasets=None, full=False):
+    from .parquet_export import ParquetExporter
+    
+    exporter = ParquetExporter(
+        current_app.config['PARQUET_EXPORT_DIR'],
+        batch_size=current_app.config['PARQUET_EXPORT_BATCH_SIZE']
+    )
+    return exporter.export(datasets=datasets, full=full)
+
+
+@job_task('spatial_export')
+def spatial_export(context, format='fgb', state='all', version=None):
+    """Claim layer for offline GIS; cached by (format, state, version) through the job row"""
+    from .spatial_export import SPATIAL_FORMATS, write_claims_layer
+    
+    if format not in SPATIAL_FORMATS:
+        raise ValueError(f'Invalid format. Must be one of: {list(SPATIAL_FORMATS)}')
+    
+    slug = 'all_states' if state == 'all' else secure_filename(state.lower().replace(' ', '_')) or 'state'
+    path = context.result_file(f'fra_claims_{slug}.{SPATIAL_FORMATS[format][2]}')
+    
+    result = write_claims_layer(
+        path, format,
+        state=None if state == 'all' else state,
+        batch_size=current_app.config.get('EXPORT_BATCH_SIZE', 1000),
+        progress=context.progress
+    )
+    return {'format': format, 'state': state, 'version': version, **result}
+
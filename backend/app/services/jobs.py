@@ -0,0 +1,275 @@
+"""
+Background Job Service
+Task registry, job lifecycle and the Celery wiring behind `celery -A app.celery`
+"""
+
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from celery import Celery, Task, shared_task
+from celery.schedules import crontab
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+# name -> callable(context, **params) returning a JSON-serializable result
+TASKS: Dict[str, Callable[..., Any]] = {}
+
+
+def job_task(name: str):
+    """Register a function as a background job task"""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """Handed to every task: progress reporting and a per-job result directory"""
+    
+    def __init__(self, job: Job, results_dir: str):
+        self.job_id = job.id
+        self.params = job.params or {}
+        self.results_dir = results_dir
+        self.result_path = None
+    
+    def progress(self, done: int, total: int, message: Optional[str] = None):
+        """
+        Record progress on its own connection, so it is visible to pollers
+        without committing the task's unfinished work
+        """
+        with db.engine.begin() as connection:
+            connection.execute(
+                Job.__table__.update().where(Job.__table__.c.id == self.job_id).values(
+                    progress=min(done / total, 1.0) if total else 0.0,
+                    progress_message=message or f'{done}/{total}'
+                )
+            )
+    
+    def result_file(self, filename: str) -> str:
+        """Path for the job's downloadable result; the last one requested is served"""
+        directory = os.path.join(self.results_dir, str(self.job_id))
+        os.makedirs(directory, exist_ok=True)
+        self.result_path = os.path.join(directory, filename)
+        return self.result_path
+
+
+def stage_job_input(name: str, payload: Any) -> str:
+    """
+    Write a large task input under JOB_RESULTS_DIR (shared with the workers) and
+    return its path, so Job.params stays small enough to scan for cached exports
+    """
+    directory = os.path.join(current_app.config.get('JOB_RESULTS_DIR', 'job_results'), 'inputs')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}-{uuid.uuid4()}.json')
+    with open(path, 'w') as output:
+        json.dump(payload, output, default=str)
+    return path
+
+
+def stale_before(seconds: Optional[int] = None) -> datetime:
+    """Queued or running jobs created/started before this are presumed lost (JOB_TIMEOUT by default)"""
+    if seconds is None:
+        seconds = current_app.config.get('JOB_TIMEOUT', 3 * 3600)
+    return datetime.utcnow() - timedelta(seconds=seconds)
+
+
+def run_job(job_id) -> Optional[Job]:
+    """
+    Execute a queued job in the current app context
+    
+    The job is claimed with a conditional update, so duplicate deliveries of a
+    queued job run it once. A job still 'running' past JOB_TIMEOUT lost its
+    worker, and a late redelivery (acks_late) takes it over; finished jobs are skipped.
+    """
+    jobs = Job.__table__
+    claimed = db.session.execute(
+        jobs.update().where(
+            jobs.c.id == job_id,
+            or_(jobs.c.status == 'queued',
+                and_(jobs.c.status == 'running', jobs.c.started_at < stale_before()))
+        ).values(status='running', started_at=datetime.utcnow(), progress=0.0)
+    ).rowcount
+    db.session.commit()
+    
+    job = db.session.get(Job, job_id)
+    if not claimed:
+        return job
+    
+    # Read before the task runs: after a failure the session must be rolled back
+    # before any ORM state (even job.task) can be loaded again
+    task = job.task
+    context = JobContext(job, current_app.config.get('JOB_RESULTS_DIR', 'job_results'))
+    try:
+        result = TASKS[task](context, **context.params)
+        job = db.session.get(Job, job_id)
+        job.status = 'succeeded'
+        job.result = result
+        job.result_path = context.result_path
+        job.progress = 1.0
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, task)
+        job = db.session.get(Job, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+    
+    return job
+
+
+def enqueue_job(task: str, params: Optional[dict] = None, created_by: Optional[str] = None) -> Job:
+    """
+    Persist a job and hand it to the worker
+    
+    With JOBS_EAGER the job runs inline before returning, which keeps tests and
+    single-process development setups free of a broker. If the broker cannot be
+    reached the job stays queued and recover_stale_jobs dispatches it again.
+    """
+    if task not in TASKS:
+        raise ValueError(f'Unknown job task: {task}')
+    
+    job = Job(task=task, params=params or {}, created_by=created_by)
+    db.session.add(job)
+    db.session.commit()
+    
+    if current_app.config.get('JOBS_EAGER'):
+        run_job(job.id)
+    else:
+        try:
+            run_job_task.delay(str(job.id))
+        except Exception:
+            logger.exception('Could not dispatch job %s (%s); left queued for recovery', job.id, task)
+    return job
+
+
+def recover_stale_jobs() -> Dict[str, int]:
+    """
+    Dispatch lingering queued jobs again and fail running ones that nothing took over
+    
+    Queued jobs older than JOB_REDISPATCH_AFTER were likely never handed to the
+    broker (down at enqueue, lost message); dispatching twice is harmless since
+    run_job claims a job once. A running job whose worker died is redelivered by
+    the broker after its visibility timeout (JOB_TIMEOUT) and taken over by
+    run_job, so it is only failed once twice that has passed without a new start.
+    """
+    timeout = current_app.config.get('JOB_TIMEOUT', 3 * 3600)
+    queued = [
+        job_id for (job_id,) in db.session.query(Job.id).filter(
+            Job.status == 'queued',
+            Job.created_at < stale_before(current_app.config.get('JOB_REDISPATCH_AFTER', 300))
+        )
+    ]
+    
+    jobs = Job.__table__
+    failed = db.session.execute(
+        jobs.update().where(
+            jobs.c.status == 'running', jobs.c.started_at < stale_before(2 * timeout)
+        ).values(
+            status='failed',
+            error='Worker lost: job was not finished or taken over within twice JOB_TIMEOUT',
+            finished_at=datetime.utcnow()
+        )
+    ).rowcount
+    db.session.commit()
+    
+    for job_id in queued:
+        run_job_task.delay(str(job_id))
+    
+    if queued or failed:
+        logger.warning('Recovered stale jobs: %d dispatched again, %d failed', len(queued), failed)
+    return {'requeued': len(queued), 'failed': failed}
+
+
+def job_accepted(job: Job):
+    """202 response pointing the client at the job status endpoint"""
+    status_url = f'/api/jobs/{job.id}'
+    return {
+        'job_id': str(job.id),
+        'task': job.task,
+        'status': job.status,
+        'status_url': status_url
+    }, 202, {'Location': status_url}
+
+
+@shared_task(name='jobs.run_job', ignore_result=True)
+def run_job_task(job_id: str):
+    run_job(uuid.UUID(job_id))
+
+
+@shared_task(name='jobs.run_scheduled', ignore_result=True)
+def run_scheduled_job(task: str, params: Optional[dict] = None):
+    """Beat entry point: scheduled runs are recorded as jobs like any other"""
+    job = Job(task=task, params=params or {}, created_by='scheduler')
+    db.session.add(job)
+    db.session.commit()
+    run_job(job.id)
+
+
+@shared_task(name='jobs.recover_stale', ignore_result=True)
+def recover_stale_jobs_task():
+    recover_stale_jobs()
+
+
+@shared_task(name='notifications.dispatch', ignore_result=True)
+def dispatch_notifications_task():
+    """Beat entry point for the alert digests; frequent and mostly idle, so no Job row is recorded"""
+    from .notifications import NotificationDispatcher
+    
+    NotificationDispatcher(current_app.config).dispatch()
+
+
+def init_jobs(app):
+    """Create the app's Celery instance (app.extensions['celery']) and register job tasks"""
+    
+    class FlaskTask(Task):
+        def __call__(self, *args, **kwargs):
+            with app.app_context():
+                return self.run(*args, **kwargs)
+    
+    celery_app = Celery(app.import_name, task_cls=FlaskTask)
+    celery_app.conf.update(
+        broker_url=app.config['CELERY_BROKER_URL'],
+        result_backend=app.config['CELERY_RESULT_BACKEND'],
+        task_ignore_result=True,
+        task_acks_late=True,
+        worker_prefetch_multiplier=1,
+        # Unacked tasks are redelivered once JOB_TIMEOUT has passed, when
+        # run_job treats a job still 'running' as lost and takes it over
+        broker_transport_options={'visibility_timeout': app.config.get('JOB_TIMEOUT', 3 * 3600)},
+        timezone=app.config.get('JOB_SCHEDULE_TIMEZONE', 'UTC'),
+        beat_schedule={
+            **{
+                name: {
+                    'task': 'jobs.run_scheduled',
+                    'schedule': crontab(**entry.get('schedule', {})),
+                    'args': (entry['task'], entry.get('params'))
+                }
+                for name, entry in app.config.get('JOB_SCHEDULE', {}).items()
+            },
+            'recover-stale-jobs': {
+                'task': 'jobs.recover_stale',
+                'schedule': crontab(minute='*/5')
+            },
+            'alert-notifications': {
+                'task': 'notifications.dispatch',
+                'schedule': crontab(**app.config.get('NOTIFICATION_DISPATCH_SCHEDULE', {'minute': '*'}))
+            }
+        }
+    )
+    celery_app.set_default()
+    app.extensions['celery'] = celery_app
+    
+    from . import job_tasks  # noqa: F401  (registers the tasks)
+    return celery_app
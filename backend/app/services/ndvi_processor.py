@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 import json
 from typing import List, Dict, Tuple, Optional
 
+from .seasonal_analysis import SeasonalDecomposer
+
 class NDVIProcessor:
     """
     NDVI (Normalized Difference Vegetation Index) processing service
@@ -19,6 +21,22 @@ class NDVIProcessor:
         self.MODERATE_THRESHOLD = 0.4
         self.ALERT_THRESHOLD = 0.3
         self.CRITICAL_THRESHOLD = 0.1
+        self.CHANGE_POINT_METHODS = ('window', 'pelt', 'binseg')
+        self.DEFAULT_CHANGE_POINT_METHOD = 'window'  # shared by every endpoint reporting change points
+        
+        # Health classes in uint8 code order (code 0 = lowest NDVI band)
+        self.HEALTH_CLASSES = ('severely_degraded', 'critical', 'degraded', 'moderate', 'healthy')
+        self.HEALTH_SCORES = (5, 20, 40, 70, 100)
+        self.HEALTH_RECOMMENDATIONS = (
+            "Emergency: Extreme vegetation loss. Urgent conservation action needed.",
+            "Critical: Severe vegetation loss detected. Immediate intervention required.",
+            "Alert: Vegetation is degraded. Investigate potential causes and implement conservation measures.",
+            "Monitor closely. Vegetation health is moderate, watch for declining trends.",
+            "Continue monitoring. Vegetation is in excellent condition."
+        )
+        self.NODATA_CLASS = 255
+        
+        self.seasonal = SeasonalDecomposer()
         
     def calculate_ndvi(self, nir_band: np.ndarray, red_band: np.ndarray) -> np.ndarray:
         """
@@ -43,6 +61,63 @@ class NDVIProcessor:
         
         return ndvi
     
+    def classify_health(self, ndvi, edges: Optional[Tuple[float, ...]] = None) -> np.ndarray:
+        """
+        Classify NDVI values of any shape into uint8 health class codes
+        
+        Args:
+            ndvi: Scalar, column or raster of NDVI values (NaN = no data)
+            edges: Increasing class edges, defaults to the processor thresholds
+            
+        Returns:
+            uint8 array of class codes (index into HEALTH_CLASSES for the default
+            edges), NODATA_CLASS where the input is NaN
+        """
+        values = np.asarray(ndvi, dtype=float)
+        if edges is None:
+            edges = (self.CRITICAL_THRESHOLD, self.ALERT_THRESHOLD,
+                     self.MODERATE_THRESHOLD, self.HEALTHY_THRESHOLD)
+        
+        codes = np.digitize(values, np.asarray(edges, dtype=float)).astype(np.uint8)
+        return np.where(np.isnan(values), np.uint8(self.NODATA_CLASS), codes)
+    
+    def class_area_histogram(self, ndvi_raster: np.ndarray, pixel_area_ha: float,
+                             zones: Optional[np.ndarray] = None,
+                             zone_count: Optional[int] = None) -> np.ndarray:
+        """
+        Hectares per health class from an NDVI raster
+        
+        Args:
+            ndvi_raster: NDVI raster (NaN = no data)
+            pixel_area_ha: Area of one pixel in hectares
+            zones: Optional co-registered integer raster of claim indices (-1 = outside)
+            zone_count: Number of zones, defaults to zones.max() + 1
+            
+        Returns:
+            Array of len(HEALTH_CLASSES) hectares, or (zone_count, len(HEALTH_CLASSES))
+            when zones are given
+        """
+        n_classes = len(self.HEALTH_CLASSES)
+        codes = self.classify_health(ndvi_raster)
+        valid = codes != self.NODATA_CLASS
+        
+        if zones is None:
+            counts = np.bincount(codes[valid].ravel(), minlength=n_classes)
+            return counts * float(pixel_area_ha)
+        
+        zones = np.asarray(zones)
+        valid &= zones >= 0
+        if zone_count is None:
+            zone_count = int(zones[valid].max()) + 1 if valid.any() else 0
+        
+        flat = zones[valid].astype(np.int64) * n_classes + codes[valid]
+        counts = np.bincount(flat.ravel(), minlength=zone_count * n_classes)
+        return counts[:zone_count * n_classes].reshape(zone_count, n_classes) * float(pixel_area_ha)
+    
+    def health_class_metrics(self, class_areas_ha) -> Dict[str, List[float]]:
+        """Compact additional_metrics entry for a class-area histogram"""
+        return {'health_class_area_ha': [round(float(area), 4) for area in class_areas_ha]}
+    
     def analyze_vegetation_health(self, ndvi_value: float) -> Dict[str, any]:
         """
         Analyze vegetation health based on NDVI value
@@ -53,42 +128,30 @@ class NDVIProcessor:
         Returns:
             Dictionary with health status and recommendations
         """
-        if ndvi_value >= self.HEALTHY_THRESHOLD:
-            status = "healthy"
-            health_score = 100
-            recommendation = "Continue monitoring. Vegetation is in excellent condition."
-            
-        elif ndvi_value >= self.MODERATE_THRESHOLD:
-            status = "moderate"
-            health_score = 70
-            recommendation = "Monitor closely. Vegetation health is moderate, watch for declining trends."
-            
-        elif ndvi_value >= self.ALERT_THRESHOLD:
-            status = "degraded"
-            health_score = 40
-            recommendation = "Alert: Vegetation is degraded. Investigate potential causes and implement conservation measures."
-            
-        elif ndvi_value >= self.CRITICAL_THRESHOLD:
-            status = "critical"
-            health_score = 20
-            recommendation = "Critical: Severe vegetation loss detected. Immediate intervention required."
-            
-        else:
-            status = "severely_degraded"
-            health_score = 5
-            recommendation = "Emergency: Extreme vegetation loss. Urgent conservation action needed."
+        code = int(self.classify_health(ndvi_value))
+        thresholds = {
+            'healthy': self.HEALTHY_THRESHOLD,
+            'moderate': self.MODERATE_THRESHOLD,
+            'alert': self.ALERT_THRESHOLD,
+            'critical': self.CRITICAL_THRESHOLD
+        }
+        
+        # NaN/None (cloud-masked or missing observation) has no health class
+        if code == self.NODATA_CLASS:
+            return {
+                'status': 'no_data',
+                'health_score': None,
+                'ndvi_value': None,
+                'recommendation': 'No valid NDVI observation; acquire a cloud-free scene',
+                'thresholds': thresholds
+            }
         
         return {
-            'status': status,
-            'health_score': health_score,
+            'status': self.HEALTH_CLASSES[code],
+            'health_score': self.HEALTH_SCORES[code],
             'ndvi_value': round(ndvi_value, 3),
-            'recommendation': recommendation,
-            'thresholds': {
-                'healthy': self.HEALTHY_THRESHOLD,
-                'moderate': self.MODERATE_THRESHOLD,
-                'alert': self.ALERT_THRESHOLD,
-                'critical': self.CRITICAL_THRESHOLD
-            }
+            'recommendation': self.HEALTH_RECOMMENDATIONS[code],
+            'thresholds': thresholds
         }
     
     def detect_change(self, before_ndvi: float, after_ndvi: float, 
@@ -151,12 +214,16 @@ class NDVIProcessor:
             'after_analysis': self.analyze_vegetation_health(after_ndvi)
         }
     
-    def process_time_series(self, time_series_data: List[Dict]) -> Dict[str, any]:
+    def process_time_series(self, time_series_data: List[Dict],
+                            change_point_method: Optional[str] = None,
+                            penalty: Optional[float] = None) -> Dict[str, any]:
         """
         Process a time series of NDVI measurements
         
         Args:
             time_series_data: List of dicts with 'date' and 'ndvi' keys
+            change_point_method: 'window', 'pelt' or 'binseg' (default DEFAULT_CHANGE_POINT_METHOD)
+            penalty: Change point penalty for 'pelt'/'binseg'
             
         Returns:
             Comprehensive time series analysis
@@ -164,10 +231,11 @@ class NDVIProcessor:
         if not time_series_data or len(time_series_data) < 2:
             return {'error': 'Insufficient data for time series analysis'}
         
-        # Sort by date
-        sorted_data = sorted(time_series_data, key=lambda x: x['date'])
-        ndvi_values = [item['ndvi'] for item in sorted_data]
-        dates = [item['date'] for item in sorted_data]
+        # Parse dates once and sort on the datetime64 array
+        dates = self.seasonal.to_datetime64([item['date'] for item in time_series_data])
+        order = np.argsort(dates, kind='stable')
+        dates = dates[order]
+        ndvi_values = np.asarray([item['ndvi'] for item in time_series_data], dtype=float)[order]
         
         # Basic statistics
         mean_ndvi = np.mean(ndvi_values)
@@ -191,13 +259,17 @@ class NDVIProcessor:
         # Seasonal analysis (if enough data)
         seasonal_patterns = None
         if len(ndvi_values) >= 12:  # At least a year of monthly data
-            seasonal_patterns = self._analyze_seasonal_patterns(sorted_data)
+            seasonal_patterns = self._analyze_seasonal_patterns(dates, ndvi_values)
+        
+        harmonic_fit = seasonal_patterns['harmonic_fit'] if seasonal_patterns else None
         
         # Anomaly detection
         anomalies = self._detect_anomalies(ndvi_values, mean_ndvi, std_ndvi)
         
         # Change points detection
-        change_points = self._detect_change_points(ndvi_values)
+        change_points = self.detect_change_points(
+            ndvi_values, method=change_point_method, penalty=penalty
+        )
         
         return {
             'statistics': {
@@ -207,56 +279,62 @@ class NDVIProcessor:
                 'max_ndvi': round(max_ndvi, 3),
                 'data_points': len(ndvi_values),
                 'time_span': {
-                    'start_date': dates[0],
-                    'end_date': dates[-1]
+                    'start_date': str(dates[0]),
+                    'end_date': str(dates[-1])
                 }
             },
             'trend_analysis': {
                 'overall_trend': overall_trend,
                 'trend_slope': round(trend_slope, 6),
-                'trend_strength': 'strong' if abs(trend_slope) > 0.01 else 'weak'
+                'trend_strength': 'strong' if abs(trend_slope) > 0.01 else 'weak',
+                'deseasonalized_slope_per_day': harmonic_fit['deseasonalized_trend_slope_per_day'] if harmonic_fit else None
             },
             'health_assessment': self.analyze_vegetation_health(mean_ndvi),
             'anomalies': anomalies,
             'change_points': change_points,
             'seasonal_patterns': seasonal_patterns,
             'latest_change': self.detect_change(
-                ndvi_values[-2], ndvi_values[-1], 
-                (datetime.fromisoformat(dates[-1]) - datetime.fromisoformat(dates[-2])).days
+                float(ndvi_values[-2]), float(ndvi_values[-1]),
+                int((dates[-1] - dates[-2]) // np.timedelta64(1, 'D'))
             ) if len(ndvi_values) >= 2 else None
         }
     
-    def _analyze_seasonal_patterns(self, time_series_data: List[Dict]) -> Dict[str, any]:
+    def _analyze_seasonal_patterns(self, dates: np.ndarray, ndvi_values: np.ndarray) -> Dict[str, any]:
         """Analyze seasonal vegetation patterns"""
-        monthly_data = {}
-        
-        for item in time_series_data:
-            date = datetime.fromisoformat(item['date'])
-            month = date.month
-            
-            if month not in monthly_data:
-                monthly_data[month] = []
-            monthly_data[month].append(item['ndvi'])
-        
-        # Calculate monthly averages
-        monthly_averages = {}
-        for month, values in monthly_data.items():
-            monthly_averages[month] = {
-                'mean_ndvi': round(np.mean(values), 3),
-                'std_ndvi': round(np.std(values), 3),
-                'data_points': len(values)
+        profile = self.seasonal.monthly_profile(dates, ndvi_values)
+        observed_months = np.flatnonzero(profile['count'])
+        
+        monthly_averages = {
+            int(month) + 1: {
+                'mean_ndvi': round(float(profile['mean'][month]), 3),
+                'std_ndvi': round(float(profile['std'][month]), 3),
+                'data_points': int(profile['count'][month])
             }
+            for month in observed_months
+        }
         
         # Find peak and low seasons
-        month_means = {month: data['mean_ndvi'] for month, data in monthly_averages.items()}
-        peak_month = max(month_means, key=month_means.get)
-        low_month = min(month_means, key=month_means.get)
+        month_means = profile['mean'][observed_months]
+        peak_month = int(observed_months[np.argmax(month_means)]) + 1
+        low_month = int(observed_months[np.argmin(month_means)]) + 1
+        
+        # Harmonic regression: seasonal shape and the deseasonalized trend
+        fit = self.seasonal.fit(dates, ndvi_values)
+        harmonic_fit = None
+        if not np.isnan(fit['trend_slope_per_day']):
+            harmonic_fit = {
+                'amplitude': round(float(fit['amplitude']), 3),
+                'peak_day_of_year': int(round(float(fit['peak_day_of_year']))),
+                'deseasonalized_trend_slope_per_day': round(float(fit['trend_slope_per_day']), 6),
+                'r_squared': round(float(fit['r_squared']), 3)
+            }
         
         return {
             'monthly_averages': monthly_averages,
             'peak_vegetation_month': peak_month,
             'lowest_vegetation_month': low_month,
-            'seasonal_variation': round(month_means[peak_month] - month_means[low_month], 3)
+            'seasonal_variation': round(monthly_averages[peak_month]['mean_ndvi'] - monthly_averages[low_month]['mean_ndvi'], 3),
+            'harmonic_fit': harmonic_fit
         }
     
     def _detect_anomalies(self, ndvi_values: List[float], mean_ndvi: float, 
@@ -279,31 +357,167 @@ class NDVIProcessor:
         
         return anomalies
     
-    def _detect_change_points(self, ndvi_values: List[float]) -> List[Dict]:
+    def detect_change_points(self, ndvi_values: List[float], method: Optional[str] = None,
+                             penalty: Optional[float] = None, threshold: float = 0.1,
+                             min_segment_length: int = 2) -> List[Dict]:
+        """
+        Detect change points in an NDVI series with the selected algorithm
+        
+        Args:
+            ndvi_values: NDVI values ordered by observation date
+            method: 'window' (moving window means), 'pelt' or 'binseg';
+                    DEFAULT_CHANGE_POINT_METHOD when omitted
+            penalty: Cost penalty per change point for 'pelt'/'binseg'
+                     (defaults to a BIC-style penalty from the series noise)
+            threshold: Minimum mean shift for the 'window' method
+            min_segment_length: Minimum observations between change points
+            
+        Returns:
+            List of change points with before/after segment means
+        """
+        method = method or self.DEFAULT_CHANGE_POINT_METHOD
+        if method not in self.CHANGE_POINT_METHODS:
+            raise ValueError(f'Invalid change point method. Must be one of: {list(self.CHANGE_POINT_METHODS)}')
+        
+        if method == 'window':
+            return self._detect_change_points(ndvi_values, threshold)
+        
+        values = np.asarray(ndvi_values, dtype=float)
+        min_segment_length = max(1, int(min_segment_length))
+        if values.size < 2 * min_segment_length:
+            return []
+        
+        if penalty is None:
+            penalty = self._default_penalty(values)
+        
+        if method == 'pelt':
+            breakpoints = self._pelt(values, penalty, min_segment_length)
+        else:
+            breakpoints = self._binary_segmentation(values, penalty, min_segment_length)
+        
+        return self._describe_segments(values, breakpoints)
+    
+    def _detect_change_points(self, ndvi_values: List[float], threshold: float = 0.1) -> List[Dict]:
         """Detect significant change points in NDVI time series"""
         change_points = []
         
-        if len(ndvi_values) < 3:
+        values = np.asarray(ndvi_values, dtype=float)
+        n = values.size
+        if n < 3:
             return change_points
         
-        # Simple change point detection using moving window
-        window_size = min(5, len(ndvi_values) // 3)
+        # Moving window means from a cumulative sum, O(n) overall
+        window_size = min(5, n // 3)
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        idx = np.arange(window_size, n - window_size)
+        before_means = (cumsum[idx] - cumsum[idx - window_size]) / window_size
+        after_means = (cumsum[idx + window_size] - cumsum[idx]) / window_size
+        magnitudes = np.abs(after_means - before_means)
+        
+        for pos in np.flatnonzero(magnitudes > threshold):
+            before_mean = before_means[pos]
+            after_mean = after_means[pos]
+            change_points.append({
+                'index': int(idx[pos]),
+                'change_magnitude': round(float(magnitudes[pos]), 3),
+                'change_type': 'increase' if after_mean > before_mean else 'decrease',
+                'before_mean': round(float(before_mean), 3),
+                'after_mean': round(float(after_mean), 3)
+            })
         
-        for i in range(window_size, len(ndvi_values) - window_size):
-            before_mean = np.mean(ndvi_values[i-window_size:i])
-            after_mean = np.mean(ndvi_values[i:i+window_size])
+        return change_points
+    
+    def _default_penalty(self, values: np.ndarray) -> float:
+        """BIC-style penalty scaled by a robust noise estimate (MAD of first differences)"""
+        diffs = np.diff(values)
+        sigma = np.median(np.abs(diffs - np.median(diffs))) / 0.6745 / np.sqrt(2) if diffs.size else 0.0
+        sigma = max(float(sigma), 0.01)
+        return 2 * sigma ** 2 * np.log(values.size)
+    
+    @staticmethod
+    def _segment_costs(cumsum: np.ndarray, cumsum_sq: np.ndarray,
+                       starts: np.ndarray, end: int) -> np.ndarray:
+        """Squared-error cost of segments [start, end) from cumulative sums"""
+        lengths = end - starts
+        sums = cumsum[end] - cumsum[starts]
+        return (cumsum_sq[end] - cumsum_sq[starts]) - sums ** 2 / lengths
+    
+    def _pelt(self, values: np.ndarray, penalty: float, min_size: int) -> List[int]:
+        """Pruned Exact Linear Time change point search for shifts in mean"""
+        n = values.size
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        cumsum_sq = np.concatenate(([0.0], np.cumsum(values ** 2)))
+        
+        best_cost = np.full(n + 1, np.inf)
+        best_cost[0] = -penalty
+        last_change = np.zeros(n + 1, dtype=int)
+        candidates = np.array([0])
+        
+        for t in range(min_size, n + 1):
+            eligible = candidates[t - candidates >= min_size]
+            segment_costs = best_cost[eligible] + self._segment_costs(cumsum, cumsum_sq, eligible, t)
+            total_costs = segment_costs + penalty
+            best = np.argmin(total_costs)
+            best_cost[t] = total_costs[best]
+            last_change[t] = eligible[best]
             
-            change_magnitude = abs(after_mean - before_mean)
+            # Prune start points that can never be optimal again
+            pending = candidates[t - candidates < min_size]
+            kept = eligible[segment_costs <= best_cost[t]]
+            candidates = np.concatenate((kept, pending, [t - min_size + 1]))
+        
+        breakpoints = []
+        t = last_change[n]
+        while t > 0:
+            breakpoints.append(int(t))
+            t = last_change[t]
+        return sorted(breakpoints)
+    
+    def _binary_segmentation(self, values: np.ndarray, penalty: float, min_size: int) -> List[int]:
+        """Binary segmentation: split recursively while the cost reduction beats the penalty"""
+        cumsum = np.concatenate(([0.0], np.cumsum(values)))
+        cumsum_sq = np.concatenate(([0.0], np.cumsum(values ** 2)))
+        
+        breakpoints = []
+        segments = [(0, values.size)]
+        while segments:
+            start, end = segments.pop()
+            splits = np.arange(start + min_size, end - min_size + 1)
+            if splits.size == 0:
+                continue
             
-            if change_magnitude > 0.1:  # Significant change threshold
-                change_points.append({
-                    'index': i,
-                    'change_magnitude': round(change_magnitude, 3),
-                    'change_type': 'increase' if after_mean > before_mean else 'decrease',
-                    'before_mean': round(before_mean, 3),
-                    'after_mean': round(after_mean, 3)
-                })
+            whole = self._segment_costs(cumsum, cumsum_sq, np.array([start]), end)[0]
+            left_lengths = splits - start
+            left_sums = cumsum[splits] - cumsum[start]
+            left = (cumsum_sq[splits] - cumsum_sq[start]) - left_sums ** 2 / left_lengths
+            right_lengths = end - splits
+            right_sums = cumsum[end] - cumsum[splits]
+            right = (cumsum_sq[end] - cumsum_sq[splits]) - right_sums ** 2 / right_lengths
+            gains = whole - left - right
+            
+            best = np.argmax(gains)
+            if gains[best] > penalty:
+                split = int(splits[best])
+                breakpoints.append(split)
+                segments.extend([(start, split), (split, end)])
         
+        return sorted(breakpoints)
+    
+    def _describe_segments(self, values: np.ndarray, breakpoints: List[int]) -> List[Dict]:
+        """Convert breakpoint indices into change point records"""
+        bounds = [0] + list(breakpoints) + [values.size]
+        means = [float(np.mean(values[bounds[i]:bounds[i + 1]])) for i in range(len(bounds) - 1)]
+        
+        change_points = []
+        for i, index in enumerate(breakpoints):
+            before_mean, after_mean = means[i], means[i + 1]
+            change_points.append({
+                'index': int(index),
+                'change_magnitude': round(abs(after_mean - before_mean), 3),
+                'change_type': 'increase' if after_mean > before_mean else 'decrease',
+                'before_mean': round(before_mean, 3),
+                'after_mean': round(after_mean, 3)
+            })
         return change_points
     
     def generate_alert_recommendation(self, analysis_result: Dict) -> Dict[str, any]:
@@ -0,0 +1,206 @@
+"""
+Notification Service
+Transactional alert outbox and the batched e-mail digest dispatcher
+"""
+
+import smtplib
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import FRAClaim, Alert, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def notification_recipients(config) -> List[str]:
+    return [address.strip() for address in config.get('ALERT_EMAIL_RECIPIENTS', []) if address.strip()]
+
+
+def _notification_event(session, alert: Alert, severities) -> Optional[str]:
+    """alert.created for a new alert at a notifying severity, alert.escalated when one reaches it"""
+    if alert in session.new:
+        return 'alert.created' if alert.severity in severities else None
+    history = inspect(alert).attrs.severity.history
+    if history.added and history.added[0] in severities and not (history.deleted and history.deleted[0] in severities):
+        return 'alert.escalated'
+    return None
+
+
+def _alert_payload(session, alert: Alert) -> dict:
+    claim = session.get(FRAClaim, alert.claim_id)
+    return {
+        'alert_id': str(alert.id),
+        'alert_type': alert.alert_type,
+        'severity': alert.severity,
+        'confidence_score': alert.confidence_score,
+        'affected_area_hectares': alert.affected_area_hectares,
+        'occurrence_count': alert.occurrence_count or 1,
+        'detected_at': (alert.detected_at or datetime.utcnow()).isoformat(),
+        'claim_id': claim.claim_id if claim else None,
+        'village_name': claim.village_name if claim else None,
+        'district': claim.district if claim else None,
+        'state': claim.state if claim else None
+    }
+
+
+# Assigning severity loads the previous value, so escalations of expired alerts are seen
+event.listen(Alert.severity, 'set', lambda *args: None, active_history=True)
+
+
+@event.listens_for(Session, 'before_flush')
+def _queue_alert_notifications(session, flush_context, instances):
+    """
+    Add outbox rows to the flush that writes the alert, so a notification exists
+    exactly when its alert commits; sending happens later, off the request path
+    """
+    if not has_app_context():
+        return
+    config = current_app.config
+    recipients = notification_recipients(config)
+    severities = config.get('NOTIFY_SEVERITIES', ('critical',))
+    if not recipients:
+        return
+    
+    for alert in [*session.new, *session.dirty]:
+        if not isinstance(alert, Alert):
+            continue
+        notification = _notification_event(session, alert, severities)
+        if notification is None:
+            continue
+        
+        if alert.id is None:
+            alert.id = uuid.uuid4()  # outbox rows reference it before the insert assigns one
+        payload = _alert_payload(session, alert)
+        for recipient in recipients:
+            session.add(NotificationOutbox(
+                alert_id=alert.id,
+                event=notification,
+                recipient=recipient,
+                payload=payload
+            ))
+
+
+def render_digest(recipient: str, notifications: List[NotificationOutbox], sender: str) -> EmailMessage:
+    """One e-mail summarising every pending notification of a recipient"""
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = f'FRA Atlas: {len(notifications)} alert notification{"s" if len(notifications) != 1 else ""}'
+    
+    lines = [f'{len(notifications)} alerts need attention:', '']
+    for notification in notifications:
+        alert = notification.payload
+        verb = 'escalated to' if notification.event == 'alert.escalated' else 'new'
+        lines.append(
+            f"- [{verb} {alert['severity']}] {alert['alert_type']} on claim {alert['claim_id']} "
+            f"({alert['village_name']}, {alert['district']}, {alert['state']}), "
+            f"{alert['affected_area_hectares'] or 0} ha, detected {alert['detected_at']}"
+        )
+    message.set_content('\n'.join(lines))
+    return message
+
+
+class NotificationDispatcher:
+    """
+    Sends due outbox rows as per-recipient digests over a single SMTP connection
+    
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so overlapping runs never send
+    the same notification twice. A failed digest is retried with exponential
+    backoff until max_attempts, after which its rows are marked failed.
+    """
+    
+    def __init__(self, config, smtp_factory: Optional[Callable[[], smtplib.SMTP]] = None):
+        self.config = config
+        self.smtp_factory = smtp_factory or self._connect
+        self.batch_size = config.get('NOTIFICATION_BATCH_SIZE', 500)
+        self.max_attempts = config.get('NOTIFICATION_MAX_ATTEMPTS', 6)
+        self.backoff_seconds = config.get('NOTIFICATION_BACKOFF_SECONDS', 60)
+        self.max_backoff_seconds = config.get('NOTIFICATION_MAX_BACKOFF_SECONDS', 3600)
+    
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.config['MAIL_SERVER'], self.config['MAIL_PORT'], timeout=30)
+        if self.config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if self.config.get('MAIL_USERNAME'):
+            smtp.login(self.config['MAIL_USERNAME'], self.config['MAIL_PASSWORD'])
+        return smtp
+    
+    def _due(self) -> List[NotificationOutbox]:
+        return NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= datetime.utcnow()
+        ).order_by(NotificationOutbox.created_at).limit(self.batch_size).with_for_update(skip_locked=True).all()
+    
+    def _retry_later(self, notifications: List[NotificationOutbox], error: Exception):
+        now = datetime.utcnow()
+        for notification in notifications:
+            notification.attempts += 1
+            notification.last_error = str(error)[:1000]
+            if notification.attempts >= self.max_attempts:
+                notification.status = 'failed'
+            else:
+                delay = min(self.backoff_seconds * 2 ** (notification.attempts - 1), self.max_backoff_seconds)
+                notification.next_attempt_at = now + timedelta(seconds=delay)
+    
+    def dispatch(self) -> Dict[str, int]:
+        """
+        Send one batch of due notifications
+        
+        Returns:
+            Digests and notifications sent, notifications deferred for retry and given up on
+        """
+        due = self._due()
+        if not due:
+            db.session.commit()
+            return {'digests_sent': 0, 'notifications_sent': 0, 'deferred': 0, 'failed': 0}
+        
+        by_recipient = defaultdict(list)
+        for notification in due:
+            by_recipient[notification.recipient].append(notification)
+        
+        sender = self.config.get('MAIL_DEFAULT_SENDER') or self.config.get('MAIL_USERNAME') or 'fra-atlas@localhost'
+        digests = sent = 0
+        try:
+            smtp = self.smtp_factory()
+        except (OSError, smtplib.SMTPException) as e:
+            logger.warning('SMTP connection failed; deferring %d notifications: %s', len(due), e)
+            self._retry_later(due, e)
+        else:
+            try:
+                for recipient, notifications in by_recipient.items():
+                    try:
+                        smtp.send_message(render_digest(recipient, notifications, sender))
+                    except (OSError, smtplib.SMTPException) as e:
+                        logger.warning('Digest to %s failed: %s', recipient, e)
+                        self._retry_later(notifications, e)
+                        continue
+                    now = datetime.utcnow()
+                    for notification in notifications:
+                        notification.status = 'sent'
+                        notification.sent_at = now
+                        notification.attempts += 1
+                    digests += 1
+                    sent += len(notifications)
+            finally:
+                try:
+                    smtp.quit()
+                except (OSError, smtplib.SMTPException):
+                    smtp.close()
+        
+        summary = {
+            'digests_sent': digests,
+            'notifications_sent': sent,
+            'deferred': sum(1 for notification in due if notification.status == 'pending'),
+            'failed': sum(1 for notification in due if notification.status == 'failed')
+        }
+        db.session.commit()
+        return summary
@@ -0,0 +1,294 @@
+"""
+Parquet Export Service
+Partitioned, incrementally refreshed Parquet datasets of claims, monitoring and alerts
+"""
+
+import os
+import json
+import shutil
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+from sqlalchemy import Column, func, literal_column, and_, extract
+
+from app import db
+from app.models import FRAClaim, MonitoringData, Alert
+
+MANIFEST_NAME = '_manifest.json'
+
+
+def row_fingerprint(table_name: str, joined_columns: Iterable[str] = ()):
+    """
+    Order-independent partition fingerprint: sum of the first 64 bits of each row's md5
+    
+    Joined columns (table.column) are hashed with the row, so a change on the joined
+    side (a claim's state or district) rewrites the partitions that carry it.
+    """
+    row = f"row({', '.join([f'{table_name}.*', *joined_columns])})" if joined_columns else table_name
+    return func.sum(literal_column(f"('x' || substr(md5({row}::text), 1, 16))::bit(64)::bigint"))
+
+
+def joined_columns(spec: dict) -> List[str]:
+    """table.column names of the exported columns that come from joined tables"""
+    columns = [getattr(expr, 'expression', expr) for _, expr, _ in spec['columns']]  # ORM attribute -> Column
+    return [
+        f'{column.table.name}.{column.name}'
+        for column in columns
+        if isinstance(column, Column) and column.table.name != spec['table'].name
+    ]
+
+
+def dataset_specs():
+    """
+    Dataset layouts: source table, hive partition keys and (name, expression, arrow type)
+    columns. Partition keys live in the directory names only, so they are not repeated
+    as file columns. Repeated text columns are dictionary-encoded and geometries are WKB.
+    """
+    import pyarrow as pa
+    
+    category = pa.dictionary(pa.int32(), pa.string())
+    
+    return {
+        'claims': {
+            'table': FRAClaim.__table__,
+            'joins': [],
+            'partitions': [('state', FRAClaim.state)],
+            'columns': [
+                ('id', FRAClaim.id, pa.string()),
+                ('claim_id', FRAClaim.claim_id, pa.string()),
+                ('village_name', FRAClaim.village_name, pa.string()),
+                ('district', FRAClaim.district, category),
+                ('block', FRAClaim.block, category),
+                ('tehsil', FRAClaim.tehsil, category),
+                ('area_hectares', FRAClaim.area_hectares, pa.float64()),
+                ('status', FRAClaim.status, category),
+                ('rights_type', FRAClaim.rights_type, category),
+                ('forest_type', FRAClaim.forest_type, category),
+                ('claimant_families', FRAClaim.claimant_families, pa.int32()),
+                ('application_date', FRAClaim.application_date, pa.timestamp('us')),
+                ('approval_date', FRAClaim.approval_date, pa.timestamp('us')),
+                ('last_updated', FRAClaim.last_updated, pa.timestamp('us')),
+                ('gps_surveyed', FRAClaim.gps_surveyed, pa.bool_()),
+                ('documents_verified', FRAClaim.documents_verified, pa.bool_()),
+                ('created_at', FRAClaim.created_at, pa.timestamp('us')),
+                ('geometry', func.ST_AsBinary(FRAClaim.geometry), pa.binary())
+            ]
+        },
+        'monitoring': {
+            'table': MonitoringData.__table__,
+            'joins': [(FRAClaim, FRAClaim.id == MonitoringData.claim_id)],
+            'partitions': [
+                ('year', extract('year', MonitoringData.observation_date)),
+                ('month', extract('month', MonitoringData.observation_date))
+            ],
+            'columns': [
+                ('id', MonitoringData.id, pa.string()),
+                ('claim_id', FRAClaim.claim_id, pa.string()),
+                ('state', FRAClaim.state, category),
+                ('district', FRAClaim.district, category),
+                ('observation_date', MonitoringData.observation_date, pa.date32()),
+                ('satellite_source', MonitoringData.satellite_source, category),
+                ('ndvi_mean', MonitoringData.ndvi_mean, pa.float64()),
+                ('ndvi_min', MonitoringData.ndvi_min, pa.float64()),
+                ('ndvi_max', MonitoringData.ndvi_max, pa.float64()),
+                ('ndvi_std', MonitoringData.ndvi_std, pa.float64()),
+                ('evi_mean', MonitoringData.evi_mean, pa.float64()),
+                ('savi_mean', MonitoringData.savi_mean, pa.float64()),
+                ('vegetation_loss_area', MonitoringData.vegetation_loss_area, pa.float64()),
+                ('vegetation_gain_area', MonitoringData.vegetation_gain_area, pa.float64()),
+                ('cloud_cover_percentage', MonitoringData.cloud_cover_percentage, pa.float64()),
+                ('data_quality_score', MonitoringData.data_quality_score, pa.float64()),
+                ('processed_at', MonitoringData.processed_at, pa.timestamp('us')),
+                ('processing_version', MonitoringData.processing_version, category)
+            ]
+        },
+        'alerts': {
+            'table': Alert.__table__,
+            'joins': [(FRAClaim, FRAClaim.id == Alert.claim_id)],
+            'partitions': [
+                ('year', extract('year', Alert.detected_at)),
+                ('month', extract('month', Alert.detected_at))
+            ],
+            'columns': [
+                ('id', Alert.id, pa.string()),
+                ('claim_id', FRAClaim.claim_id, pa.string()),
+                ('state', FRAClaim.state, category),
+                ('district', FRAClaim.district, category),
+                ('alert_type', Alert.alert_type, category),
+                ('severity', Alert.severity, category),
+                ('status', Alert.status, category),
+                ('detected_at', Alert.detected_at, pa.timestamp('us')),
+                ('affected_area_hectares', Alert.affected_area_hectares, pa.float64()),
+                ('confidence_score', Alert.confidence_score, pa.float64()),
+                ('reported_to_authorities', Alert.reported_to_authorities, pa.bool_()),
+                ('resolution_date', Alert.resolution_date, pa.timestamp('us')),
+                ('alert_geometry', func.ST_AsBinary(Alert.alert_geometry), pa.binary())
+            ]
+        }
+    }
+
+
+class ParquetExporter:
+    """
+    Writes each dataset as hive-partitioned Parquet (dataset/key=value/part-0.parquet).
+    
+    Every run fingerprints all partitions in SQL (row count plus an order-independent
+    hash of the row text) and compares them with the manifest of the previous run, so
+    only new or changed partitions are rewritten and vanished ones are deleted. Rows
+    are streamed from a server-side cursor in record batches.
+    """
+    
+    def __init__(self, output_dir: str, batch_size: int = 50000, compression: str = 'zstd'):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.compression = compression
+    
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.output_dir, MANIFEST_NAME)
+    
+    def load_manifest(self) -> Dict[str, Dict[str, dict]]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as manifest_file:
+            return json.load(manifest_file)
+    
+    def save_manifest(self, manifest: Dict[str, Dict[str, dict]]):
+        temporary = f'{self.manifest_path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(temporary, self.manifest_path)
+    
+    @staticmethod
+    def partition_path(names: Iterable[str], values: Iterable) -> str:
+        """Hive directory path with URI-encoded values (pyarrow's default segment encoding)"""
+        parts = []
+        for name, value in zip(names, values):
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            parts.append(f'{name}={quote(str(value), safe="")}')
+        return '/'.join(parts)
+    
+    def export(self, datasets: Optional[List[str]] = None, full: bool = False) -> Dict[str, dict]:
+        """
+        Export the named datasets (all by default)
+        
+        Args:
+            datasets: Subset of 'claims', 'monitoring', 'alerts'
+            full: Rewrite every partition regardless of the manifest
+        
+        Returns:
+            Per dataset: partitions written, unchanged and removed, and rows written
+        """
+        specs = dataset_specs()
+        unknown = set(datasets or []) - set(specs)
+        if unknown:
+            raise ValueError(f'Unknown datasets: {sorted(unknown)}. Must be among: {list(specs)}')
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = {} if full else self.load_manifest()
+        summary = {}
+        
+        for name in datasets or list(specs):
+            summary[name], manifest[name] = self._export_dataset(name, specs[name], manifest.get(name, {}), full)
+            # Persist progress per dataset so an interrupted run resumes where it stopped
+            self.save_manifest(manifest)
+        
+        return summary
+    
+    def _query(self, spec: dict, *columns):
+        query = db.session.query(*columns).select_from(spec['table'])
+        for target, condition in spec['joins']:
+            query = query.join(target, condition)
+        return query
+    
+    def _export_dataset(self, name: str, spec: dict, previous: Dict[str, dict],
+                        full: bool) -> Tuple[dict, Dict[str, dict]]:
+        partition_names = [key for key, _ in spec['partitions']]
+        partition_exprs = [expr for _, expr in spec['partitions']]
+        
+        fingerprints = self._query(
+            spec,
+            *partition_exprs,
+            func.count().label('rows'),
+            row_fingerprint(spec['table'].name, joined_columns(spec)).label('fingerprint')
+        ).group_by(*partition_exprs).all()
+        
+        current = {}
+        written = unchanged = rows_written = 0
+        for row in fingerprints:
+            values = row[:len(partition_exprs)]
+            path = self.partition_path(partition_names, values)
+            entry = {'rows': row.rows, 'fingerprint': str(row.fingerprint)}
+            
+            known = previous.get(path)
+            if not full and known and known['rows'] == entry['rows'] and known['fingerprint'] == entry['fingerprint']:
+                current[path] = known
+                unchanged += 1
+                continue
+            
+            conditions = [
+                expr.is_(None) if value is None else expr == value
+                for expr, value in zip(partition_exprs, values)
+            ]
+            rows_written += self._write_partition(name, spec, path, and_(*conditions))
+            current[path] = {**entry, 'exported_at': datetime.utcnow().isoformat()}
+            written += 1
+        
+        removed = [path for path in previous if path not in current]
+        for path in removed:
+            shutil.rmtree(os.path.join(self.output_dir, name, path), ignore_errors=True)
+        
+        return {
+            'partitions_written': written,
+            'partitions_unchanged': unchanged,
+            'partitions_removed': len(removed),
+            'rows_written': rows_written
+        }, current
+    
+    def _write_partition(self, name: str, spec: dict, path: str, condition) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        schema = pa.schema([(column, arrow_type) for column, _, arrow_type in spec['columns']])
+        directory = os.path.join(self.output_dir, name, path)
+        os.makedirs(directory, exist_ok=True)
+        
+        target = os.path.join(directory, 'part-0.parquet')
+        temporary = f'{target}.{uuid.uuid4().hex}.tmp'
+        
+        rows = self._query(
+            spec, *[expr.label(column) for column, expr, _ in spec['columns']]
+        ).filter(condition).yield_per(self.batch_size)
+        
+        count = 0
+        with pq.ParquetWriter(temporary, schema, compression=self.compression) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == self.batch_size:
+                    writer.write_batch(self._record_batch(batch, schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_batch(self._record_batch(batch, schema))
+                count += len(batch)
+        
+        os.replace(temporary, target)
+        return count
+    
+    @staticmethod
+    def _record_batch(rows: list, schema):
+        import pyarrow as pa
+        
+        arrays = []
+        for index, field in enumerate(schema):
+            values = [row[index] for row in rows]
+            if pa.types.is_string(field.type) or pa.types.is_dictionary(field.type):
+                values = [None if value is None else str(value) for value in values]
+            elif pa.types.is_binary(field.type):
+                values = [None if value is None else bytes(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
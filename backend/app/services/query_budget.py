@@ -0,0 +1,111 @@
+"""
+Query Budget Service
+Per-endpoint statement timeouts and query caps, answered with 503/504 when exceeded
+"""
+
+import logging
+from typing import Dict, Optional
+
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Postgres SQLSTATE for a statement cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised before executing a query beyond the request's query cap"""
+
+
+def budget_for(endpoint: Optional[str]) -> Dict[str, int]:
+    """Default budget overlaid with the endpoint's entry in QUERY_BUDGETS"""
+    budgets = current_app.config.get('QUERY_BUDGETS', {})
+    return {**budgets.get('default', {}), **budgets.get(endpoint or '', {})}
+
+
+def _active_budget() -> Optional[dict]:
+    return g.get('query_budget') if has_request_context() else None
+
+
+def _record_failure(reason: str):
+    g.query_budget_exceeded = reason
+    logger.warning(
+        'Query budget exceeded on %s %s (endpoint %s): %s after %d queries',
+        request.method, request.path, request.endpoint, reason, g.get('query_count', 0)
+    )
+
+
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    """SET LOCAL scopes the timeout to the transaction, so pooled connections come back clean"""
+    budget = _active_budget()
+    if not budget or not budget.get('statement_timeout_ms') or connection.dialect.name != 'postgresql':
+        return
+    g.query_budget_setup = True  # the budget's own statement does not count against it
+    try:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(budget['statement_timeout_ms'])}")
+    finally:
+        g.query_budget_setup = False
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(connection, cursor, statement, parameters, context, executemany):
+    budget = _active_budget()
+    if not budget or g.get('query_budget_setup'):
+        return
+    g.query_count = g.get('query_count', 0) + 1
+    max_queries = budget.get('max_queries')
+    if max_queries and g.query_count > max_queries:
+        _record_failure('query_limit')
+        raise QueryBudgetExceeded(f'Request exceeded its budget of {max_queries} queries')
+
+
+@event.listens_for(Engine, 'handle_error')
+def _record_statement_timeout(exception_context):
+    original = exception_context.original_exception
+    if _active_budget() is not None and getattr(original, 'pgcode', None) == QUERY_CANCELED:
+        _record_failure('statement_timeout')
+
+
+def _budget_response(reason: str):
+    budget = g.query_budget
+    if reason == 'statement_timeout':
+        status, message = 504, f"Query exceeded the {budget['statement_timeout_ms']} ms statement timeout"
+    else:
+        status, message = 503, f"Request exceeded its budget of {budget['max_queries']} queries"
+    
+    response = jsonify({'error': message, 'reason': reason})
+    response.status_code = status
+    response.headers['Retry-After'] = str(current_app.config.get('QUERY_BUDGET_RETRY_AFTER', 30))
+    return response
+
+
+def init_query_budgets(app):
+    """
+    Attach a budget to every request and turn budget failures into 503/504
+    
+    Resources catch their own exceptions and answer 500, so the budget
+    outcome is recorded on `g` when it happens and the 500 is rewritten
+    after the request. Streamed responses that fail mid-body keep their
+    status (it was already sent); the failure is still logged.
+    """
+    
+    @app.before_request
+    def attach_query_budget():
+        g.query_budget = budget_for(request.endpoint)
+        g.query_count = 0
+    
+    @app.errorhandler(QueryBudgetExceeded)
+    def query_budget_exceeded(error):
+        return _budget_response('query_limit')
+    
+    @app.after_request
+    def answer_budget_failures(response):
+        reason = g.get('query_budget_exceeded')
+        if reason and response.status_code >= 500:
+            return _budget_response(reason)
+        return response
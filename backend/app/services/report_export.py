@@ -0,0 +1,239 @@
+"""
+Report Export Service
+Single-query claims report and incremental CSV / NDJSON / JSON / Arrow writers
+"""
+
+import io
+import csv
+import json
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func, desc, true
+
+from app import db
+from app.models import FRAClaim, MonitoringData, Alert
+from .columnar import to_column
+
+EXPORT_CSV_HEADERS = [
+    'claim_id', 'village_name', 'district', 'state', 
+    'area_hectares', 'status', 'claimant_families',
+    'application_date', 'approval_date', 'latest_ndvi',
+    'last_monitored', 'active_alerts'
+]
+
+
+def export_report_query(include_alert_details=True):
+    """Claims with their latest NDVI observation and active alerts, as one query"""
+    latest = db.session.query(
+        MonitoringData.ndvi_mean,
+        MonitoringData.observation_date
+    ).filter(
+        MonitoringData.claim_id == FRAClaim.id
+    ).order_by(desc(MonitoringData.observation_date)).limit(1).subquery().lateral('latest')
+    
+    alert_columns = [
+        Alert.claim_id,
+        func.count(Alert.id).label('active_alerts')
+    ]
+    if include_alert_details:
+        alert_columns.append(func.json_agg(func.json_build_object(
+            'type', Alert.alert_type,
+            'severity', Alert.severity,
+            'detected_at', Alert.detected_at
+        )).label('alert_details'))
+    active = db.session.query(*alert_columns).filter(
+        Alert.status == 'active'
+    ).group_by(Alert.claim_id).subquery('active')
+    
+    columns = [
+        FRAClaim.claim_id,
+        FRAClaim.village_name,
+        FRAClaim.district,
+        FRAClaim.state,
+        FRAClaim.area_hectares,
+        FRAClaim.status,
+        FRAClaim.claimant_families,
+        FRAClaim.application_date,
+        FRAClaim.approval_date,
+        latest.c.ndvi_mean.label('latest_ndvi'),
+        latest.c.observation_date.label('last_monitored'),
+        func.coalesce(active.c.active_alerts, 0).label('active_alerts')
+    ]
+    if include_alert_details:
+        columns.append(active.c.alert_details)
+    
+    return db.session.query(*columns).outerjoin(
+        latest, true()
+    ).outerjoin(
+        active, active.c.claim_id == FRAClaim.id
+    ).order_by(FRAClaim.claim_id)
+
+
+def export_record(row):
+    """JSON-ready report row"""
+    return {
+        'claim_id': row.claim_id,
+        'village_name': row.village_name,
+        'district': row.district,
+        'state': row.state,
+        'area_hectares': float(row.area_hectares),
+        'status': row.status,
+        'claimant_families': row.claimant_families,
+        'application_date': row.application_date.isoformat() if row.application_date else None,
+        'approval_date': row.approval_date.isoformat() if row.approval_date else None,
+        'latest_ndvi': float(row.latest_ndvi) if row.latest_ndvi is not None else None,
+        'last_monitored': row.last_monitored.isoformat() if row.last_monitored else None,
+        'active_alerts': row.active_alerts,
+        'alert_details': row.alert_details or []
+    }
+
+
+def stream_csv(rows, batch_size):
+    """CSV text in chunks of batch_size rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_HEADERS)
+    
+    for count, row in enumerate(rows, 1):
+        writer.writerow([
+            row.claim_id, row.village_name, row.district,
+            row.state, float(row.area_hectares), row.status,
+            row.claimant_families,
+            row.application_date.isoformat() if row.application_date else None,
+            row.approval_date.isoformat() if row.approval_date else None,
+            float(row.latest_ndvi) if row.latest_ndvi is not None else None,
+            row.last_monitored.isoformat() if row.last_monitored else None,
+            row.active_alerts
+        ])
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows, batch_size):
+    """One JSON object per line, in chunks of batch_size rows"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(export_record(row)))
+        if len(lines) == batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_json(rows, batch_size, metadata):
+    """The legacy {'report_metadata', 'claims_data'} document, written incrementally"""
+    yield '{"report_metadata": ' + json.dumps(metadata) + ', "claims_data": ['
+    separator = ''
+    chunk = []
+    for row in rows:
+        chunk.append(separator + json.dumps(export_record(row)))
+        separator = ', '
+        if len(chunk) == batch_size:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk) + ']}'
+
+
+def report_columns(rows):
+    """Column arrays of a list of report rows (alert details excluded)"""
+    return {
+        'claim_id': to_column([row.claim_id for row in rows]),
+        'village_name': to_column([row.village_name for row in rows]),
+        'district': to_column([row.district for row in rows]),
+        'state': to_column([row.state for row in rows]),
+        'area_hectares': to_column([row.area_hectares for row in rows], float),
+        'status': to_column([row.status for row in rows]),
+        'claimant_families': to_column([row.claimant_families for row in rows], float),
+        'application_date': to_column([row.application_date for row in rows], 'datetime64[s]'),
+        'approval_date': to_column([row.approval_date for row in rows], 'datetime64[s]'),
+        'latest_ndvi': to_column([row.latest_ndvi for row in rows], float),
+        'last_monitored': to_column([row.last_monitored for row in rows], 'datetime64[D]'),
+        'active_alerts': np.array([row.active_alerts for row in rows], dtype=np.int64)
+    }
+
+
+def report_arrow_schema(metadata):
+    """Fixed schema of the Arrow report, so every record batch matches the stream header"""
+    import pyarrow as pa
+    
+    return pa.schema([
+        ('claim_id', pa.string()),
+        ('village_name', pa.string()),
+        ('district', pa.string()),
+        ('state', pa.string()),
+        ('area_hectares', pa.float64()),
+        ('status', pa.string()),
+        ('claimant_families', pa.float64()),
+        ('application_date', pa.timestamp('s')),
+        ('approval_date', pa.timestamp('s')),
+        ('latest_ndvi', pa.float64()),
+        ('last_monitored', pa.date32()),
+        ('active_alerts', pa.int64())
+    ], metadata={'metadata': json.dumps(metadata, default=str)})
+
+
+def stream_arrow(rows, batch_size, metadata):
+    """Arrow IPC stream, one record batch per batch_size rows"""
+    import pyarrow as pa
+    
+    schema = report_arrow_schema(metadata)
+    buffer = io.BytesIO()
+    
+    def drain():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+    
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.write_batch(_record_batch(batch, schema))
+                batch = []
+                yield drain()
+        if batch:
+            writer.write_batch(_record_batch(batch, schema))
+    yield drain()
+
+
+def _record_batch(rows, schema):
+    import pyarrow as pa
+    
+    columns = report_columns(rows)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(columns[field.name], type=field.type, from_pandas=True) for field in schema],
+        schema=schema
+    )
+
+
+# format -> (mimetype, file extension) of the streamed text formats
+STREAM_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'json': ('application/json', 'json')
+}
+
+
+def report_metadata():
+    return {
+        'generated_at': datetime.utcnow().isoformat(),
+        'total_claims': FRAClaim.query.count(),
+        'report_type': 'comprehensive_fra_analysis'
+    }
+
+
+def stream_report(format_type, batch_size, metadata):
+    """Text chunks of the report, read through a server-side cursor batch_size rows at a time"""
+    rows = export_report_query(include_alert_details=format_type != 'csv').yield_per(batch_size)
+    if format_type == 'csv':
+        return stream_csv(rows, batch_size)
+    if format_type == 'ndjson':
+        return stream_ndjson(rows, batch_size)
+    return stream_json(rows, batch_size, metadata)
@@ -0,0 +1,67 @@
+"""
+Monitoring Rollup Service
+Period bucketing and resolution planning for multi-resolution NDVI queries
+"""
+
+from datetime import date, timedelta
+from typing import Optional
+
+# Coarsening order; 'raw' reads monitoring_data directly
+RESOLUTIONS = ('raw', 'week', 'month')
+ROLLUP_RESOLUTIONS = ('week', 'month')
+
+AVERAGE_PERIOD_DAYS = {
+    'week': 7.0,
+    'month': 30.44
+}
+
+
+def period_start(resolution: str, day: date) -> date:
+    """First day of the rollup period containing day (weeks start on Monday, as date_trunc)"""
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'Invalid rollup resolution. Must be one of: {list(ROLLUP_RESOLUTIONS)}')
+
+
+def choose_resolution(start: date, end: date, point_budget: int,
+                      expected_raw_points: Optional[float] = None) -> str:
+    """
+    Pick the finest resolution whose point count fits the budget
+    
+    Args:
+        start, end: Requested date range
+        point_budget: Maximum number of points the caller wants back
+        expected_raw_points: Estimated raw observations in the range; raw is
+                             only considered when an estimate is available
+        
+    Returns:
+        'raw', 'week' or 'month' ('month' when nothing fits)
+    """
+    span_days = max((end - start).days, 1)
+    
+    if expected_raw_points is not None and expected_raw_points <= point_budget:
+        return 'raw'
+    
+    for resolution in ROLLUP_RESOLUTIONS:
+        if span_days / AVERAGE_PERIOD_DAYS[resolution] <= point_budget:
+            return resolution
+    return 'month'
+
+
+def expected_raw_points(stats, start: date, end: date) -> Optional[float]:
+    """
+    Estimate observations in [start, end] from a claim's running statistics;
+    None without statistics (e.g. before rebuild-ndvi-stats), leaving the
+    choice to the span of the range
+    """
+    if stats is None or not stats.observation_count or stats.origin_date is None:
+        return None
+    
+    first, last = stats.origin_date, stats.latest_observation_date or stats.origin_date
+    history_days = max((last - first).days, 1)
+    overlap_days = (min(end, last) - max(start, first)).days
+    if overlap_days < 0:
+        return 0.0
+    return stats.observation_count * min(1.0, (overlap_days + 1) / history_days)
@@ -0,0 +1,150 @@
+"""
+Seasonal Analysis Service
+Vectorized monthly aggregation and harmonic-regression deseasonalization of NDVI series
+"""
+
+import numpy as np
+from typing import Dict, Sequence
+
+
+class SeasonalDecomposer:
+    """
+    Seasonal engine for NDVI time series built on datetime64 arrays.
+    Fits NDVI ~ intercept + trend + sum_k (cos, sin)(2*pi*k*t / period) by least
+    squares, for one claim or for a claims x dates matrix in a single pass.
+    """
+    
+    def __init__(self, harmonics: int = 2, period_days: float = 365.25):
+        self.harmonics = harmonics
+        self.period_days = period_days
+    
+    @staticmethod
+    def to_datetime64(dates: Sequence) -> np.ndarray:
+        """Convert ISO strings, dates or datetimes to a datetime64[D] array"""
+        return np.asarray(dates, dtype='datetime64[s]').astype('datetime64[D]')
+    
+    @staticmethod
+    def months(dates: np.ndarray) -> np.ndarray:
+        """Zero-based calendar month (0 = January) of each datetime64 value"""
+        return dates.astype('datetime64[M]').astype(np.int64) % 12
+    
+    def monthly_profile(self, dates: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Per-calendar-month count, mean and standard deviation via np.bincount
+        
+        Args:
+            dates: datetime64[D] array
+            values: NDVI values aligned with dates
+            
+        Returns:
+            Dict of length-12 arrays: 'count', 'mean', 'std' (NaN for empty months)
+        """
+        values = np.asarray(values, dtype=float)
+        month_index = self.months(dates)
+        
+        counts = np.bincount(month_index, minlength=12)
+        sums = np.bincount(month_index, weights=values, minlength=12)
+        sums_sq = np.bincount(month_index, weights=values ** 2, minlength=12)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+            variances = np.maximum(sums_sq / counts - means ** 2, 0.0)
+        
+        return {'count': counts, 'mean': means, 'std': np.sqrt(variances)}
+    
+    def design_matrix(self, dates: np.ndarray, origin: np.datetime64 = None) -> np.ndarray:
+        """Columns: intercept, trend (years since origin), then cos/sin pairs per harmonic"""
+        if origin is None:
+            origin = dates.min()
+        t_days = (dates - origin).astype(np.float64)
+        # Harmonic phase is anchored to the calendar so peaks map to day-of-year
+        day_of_year = (dates - dates.astype('datetime64[Y]')).astype(np.float64)
+        
+        columns = [np.ones_like(t_days), t_days / self.period_days]
+        for k in range(1, self.harmonics + 1):
+            angle = 2 * np.pi * k * day_of_year / self.period_days
+            columns.extend([np.cos(angle), np.sin(angle)])
+        return np.column_stack(columns)
+    
+    def fit(self, dates: np.ndarray, values: np.ndarray) -> Dict[str, any]:
+        """
+        Harmonic regression for a single series
+        
+        Returns:
+            Coefficients, seasonal component, deseasonalized series and summary metrics
+        """
+        values = np.asarray(values, dtype=float)
+        result = self.fit_batch(dates, values[np.newaxis, :])
+        return {key: value[0] for key, value in result.items()}
+    
+    def fit_batch(self, dates: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Harmonic regression for many series sharing a date grid
+        
+        Args:
+            dates: datetime64[D] array of length n
+            values: (claims, n) matrix, NaN where a claim has no observation
+            
+        Returns:
+            Dict of per-claim arrays: 'coefficients' (claims, p), 'seasonal' and
+            'deseasonalized' (claims, n), 'trend_slope_per_day', 'amplitude',
+            'peak_day_of_year', 'r_squared', 'residual_std' (claims,)
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        design = self.design_matrix(dates)
+        n_params = design.shape[1]
+        
+        observed = ~np.isnan(values)
+        filled = np.where(observed, values, 0.0)
+        weights = observed.astype(float)
+        
+        # Per-claim normal equations X'WX b = X'Wy, solved as one stacked system
+        xtwx = np.einsum('ni,mn,nj->mij', design, weights, design)
+        xtwy = np.einsum('ni,mn->mi', design, filled)
+        normal_inverse = np.linalg.pinv(xtwx)
+        coefficients = np.einsum('mij,mj->mi', normal_inverse, xtwy)
+        
+        point_counts = observed.sum(axis=1)
+        coefficients[point_counts < n_params + 1] = np.nan
+        
+        seasonal = coefficients[:, 2:] @ design[:, 2:].T
+        fitted = coefficients @ design.T
+        deseasonalized = np.where(observed, values - seasonal, np.nan)
+        
+        residuals = np.where(observed, values - fitted, 0.0)
+        ss_res = (residuals ** 2).sum(axis=1)
+        means = filled.sum(axis=1) / np.maximum(point_counts, 1)
+        ss_tot = (np.where(observed, values - means[:, np.newaxis], 0.0) ** 2).sum(axis=1)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r_squared = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+            residual_std = np.sqrt(ss_res / np.maximum(point_counts - n_params, 1))
+        
+        # Annual harmonic amplitude and the day of year it peaks
+        cos_coef, sin_coef = coefficients[:, 2], coefficients[:, 3]
+        amplitude = np.hypot(cos_coef, sin_coef)
+        peak_day = np.mod(np.arctan2(sin_coef, cos_coef) * self.period_days / (2 * np.pi), self.period_days)
+        
+        return {
+            'coefficients': coefficients,
+            'seasonal': seasonal,
+            'deseasonalized': deseasonalized,
+            'trend_slope_per_day': coefficients[:, 1] / self.period_days,
+            'amplitude': amplitude,
+            'peak_day_of_year': peak_day,
+            'r_squared': r_squared,
+            'residual_std': np.where(np.isnan(coefficients[:, 0]), np.nan, residual_std),
+            'normal_inverse': normal_inverse
+        }
+    
+    def predict(self, coefficients: np.ndarray, dates: np.ndarray, origin: np.datetime64) -> np.ndarray:
+        """Evaluate fitted models (claims, p) at dates, using the origin of the fit"""
+        design = self.design_matrix(dates, origin=origin)
+        return np.atleast_2d(coefficients) @ design.T
+    
+    def prediction_std(self, fit: Dict[str, np.ndarray], dates: np.ndarray,
+                       origin: np.datetime64) -> np.ndarray:
+        """Standard error of new observations at dates: sigma * sqrt(1 + x' (X'WX)^-1 x)"""
+        design = self.design_matrix(dates, origin=origin)
+        leverage = np.einsum('hi,mij,hj->mh', design, fit['normal_inverse'], design)
+        return fit['residual_std'][:, np.newaxis] * np.sqrt(1 + leverage)
@@ -0,0 +1,254 @@
+"""
+Snapshot Cache Service
+Versioned response snapshots with single-flight recomputation and refresh-ahead
+"""
+
+import json
+import threading
+import time
+import uuid
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySnapshotBackend:
+    """In-process backend; locks and versions are shared by the threads of one worker"""
+    
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._versions = {}
+        self._mutex = threading.Lock()
+    
+    def get(self, key: str) -> Optional[dict]:
+        with self._mutex:
+            item = self._entries.get(key)
+            if item is None or item[1] <= time.time():
+                return None
+            return item[0]
+    
+    def set(self, key: str, entry: dict, ttl: int):
+        now = time.time()
+        with self._mutex:
+            # Snapshots of superseded data versions are never read again; drop them on expiry
+            for stale in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+                del self._entries[stale]
+            self._entries[key] = (entry, now + ttl)
+    
+    def acquire(self, key: str, timeout: int) -> Optional[str]:
+        now = time.time()
+        with self._mutex:
+            held = self._locks.get(key)
+            if held is not None and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[key] = (token, now + timeout)
+            return token
+    
+    def release(self, key: str, token: str):
+        with self._mutex:
+            if self._locks.get(key, (None,))[0] == token:
+                del self._locks[key]
+    
+    def versions(self, names: Iterable[str]) -> Tuple[int, ...]:
+        with self._mutex:
+            return tuple(self._versions.get(name, 0) for name in names)
+    
+    def bump(self, names: Iterable[str]):
+        with self._mutex:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+
+class RedisSnapshotBackend:
+    """Redis backend; snapshots, locks and versions are shared across workers and hosts"""
+    
+    # Delete the lock only if this worker still owns it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    
+    def __init__(self, client, prefix: str = 'fra:snapshot:'):
+        self.client = client
+        self.prefix = prefix
+    
+    def get(self, key: str) -> Optional[dict]:
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+    
+    def set(self, key: str, entry: dict, ttl: int):
+        self.client.set(self.prefix + key, json.dumps(entry, default=str), ex=ttl)
+    
+    def acquire(self, key: str, timeout: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.client.set(self.prefix + 'lock:' + key, token, nx=True, ex=timeout):
+            return token
+        return None
+    
+    def release(self, key: str, token: str):
+        self.client.eval(self.RELEASE_SCRIPT, 1, self.prefix + 'lock:' + key, token)
+    
+    def versions(self, names: Iterable[str]) -> Tuple[int, ...]:
+        values = self.client.mget([self.prefix + 'version:' + name for name in names])
+        return tuple(int(value) if value is not None else 0 for value in values)
+    
+    def bump(self, names: Iterable[str]):
+        pipeline = self.client.pipeline()
+        for name in names:
+            pipeline.incr(self.prefix + 'version:' + name)
+        pipeline.execute()
+
+
+class SnapshotCache:
+    """
+    Caches computed payloads per (name, parameters, data version of the source tables).
+    
+    Writers bump a per-table version counter on commit, so a snapshot is never served
+    after its data changed. Concurrent misses for the same key compute once: the
+    first caller takes a short lock and the others poll for its result. Hits within
+    refresh_ahead seconds of expiry trigger one background recomputation, so hot
+    keys are replaced before they expire instead of missing all at once.
+    """
+    
+    def __init__(self, backend, ttl: int = 300, refresh_ahead: int = 60,
+                 lock_timeout: int = 30, poll_interval: float = 0.05):
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+    
+    def key(self, name: str, params: Dict[str, Any], tables: Iterable[str]) -> str:
+        tables = sorted(tables)
+        versions = self.backend.versions(tables)
+        version = '.'.join(f'{table}={value}' for table, value in zip(tables, versions))
+        return f'{name}:{json.dumps(params, sort_keys=True, default=str)}:{version}'
+    
+    def get_or_compute(self, name: str, params: Dict[str, Any], tables: Iterable[str],
+                       compute: Callable[[], Any]) -> Tuple[Any, str]:
+        """
+        Cached payload for name/params at the current version of tables
+        
+        Returns:
+            (payload, status) where status is 'hit', 'refreshing' (hit that started
+            a background refresh), 'miss' or 'shared' (computed by a concurrent caller)
+        """
+        key = self.key(name, params, tables)
+        entry = self.backend.get(key)
+        if entry is not None:
+            if entry['expires_at'] - time.time() <= self.refresh_ahead and self._refresh_async(key, compute):
+                return entry['payload'], 'refreshing'
+            return entry['payload'], 'hit'
+        
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            token = self.backend.acquire(key, self.lock_timeout)
+            if token is not None:
+                try:
+                    return self._store(key, compute()), 'miss'
+                finally:
+                    self.backend.release(key, token)
+            
+            time.sleep(self.poll_interval)
+            entry = self.backend.get(key)
+            if entry is not None:
+                return entry['payload'], 'shared'
+            if time.monotonic() > deadline:
+                # The lock holder is stuck; serve a fresh computation rather than an error
+                return compute(), 'miss'
+    
+    def _store(self, key: str, payload: Any) -> Any:
+        self.backend.set(key, {'payload': payload, 'expires_at': time.time() + self.ttl}, self.ttl)
+        return payload
+    
+    def _refresh_async(self, key: str, compute: Callable[[], Any]) -> bool:
+        token = self.backend.acquire(key, self.lock_timeout)
+        if token is None:
+            return False  # another caller is already refreshing
+        
+        app = current_app._get_current_object()
+        
+        def refresh():
+            try:
+                with app.app_context():
+                    self._store(key, compute())
+            except Exception:
+                logger.exception('Background snapshot refresh failed for %s', key)
+            finally:
+                self.backend.release(key, token)
+        
+        threading.Thread(target=refresh, daemon=True).start()
+        return True
+
+
+def create_snapshot_backend(config):
+    """Redis backend from REDIS_URL when reachable, otherwise the in-process backend"""
+    if config.get('SNAPSHOT_CACHE_BACKEND', 'redis') == 'redis':
+        try:
+            import redis
+            client = redis.Redis.from_url(config['REDIS_URL'], socket_connect_timeout=0.5, socket_timeout=2)
+            client.ping()
+            return RedisSnapshotBackend(client)
+        except Exception as e:
+            # Versions are then per process: other workers' writes go unseen until the TTL expires
+            logger.error(
+                'Redis unavailable for snapshot cache (%s); using in-process cache with a %ss TTL',
+                e, config.get('SNAPSHOT_FALLBACK_TTL', 15)
+            )
+    return MemorySnapshotBackend()
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    """Per-app snapshot cache, created on first use"""
+    if 'snapshot_cache' not in current_app.extensions:
+        config = current_app.config
+        backend = create_snapshot_backend(config)
+        ttl = config.get('SNAPSHOT_CACHE_TTL', 300)
+        refresh_ahead = config.get('SNAPSHOT_REFRESH_AHEAD', 60)
+        if isinstance(backend, MemorySnapshotBackend) and config.get('SNAPSHOT_CACHE_BACKEND', 'redis') == 'redis':
+            # Fallback from Redis: bound how long a worker can serve data another worker changed
+            ttl = min(ttl, config.get('SNAPSHOT_FALLBACK_TTL', 15))
+            refresh_ahead = min(refresh_ahead, ttl // 2)
+        current_app.extensions['snapshot_cache'] = SnapshotCache(
+            backend,
+            ttl=ttl,
+            refresh_ahead=refresh_ahead,
+            lock_timeout=config.get('SNAPSHOT_LOCK_TIMEOUT', 30)
+        )
+    return current_app.extensions['snapshot_cache']
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_written_tables(session, flush_context, instances):
+    written = session.info.setdefault('written_tables', set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(instance, '__tablename__', None)
+        if table:
+            written.add(table)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_data_versions(session):
+    if session.in_nested_transaction():
+        return  # savepoint released; bump once the outer transaction commits
+    written = session.info.pop('written_tables', None)
+    if written and has_app_context():
+        try:
+            get_snapshot_cache().backend.bump(sorted(written))
+        except Exception:
+            logger.exception('Could not bump snapshot data versions for %s', sorted(written))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_written_tables(session, previous_transaction):
+    # Savepoint and failed-flush rollbacks keep the tables written by the rest of the transaction
+    if previous_transaction.parent is None:
+        session.info.pop('written_tables', None)
+
+
+def bump_data_versions(*tables: str):
+    """Invalidate snapshots of tables written outside the ORM unit of work (Core/bulk statements)"""
+    get_snapshot_cache().backend.bump(sorted(tables))
@@ -0,0 +1,138 @@
+"""
+Spatial Export Service
+FlatGeobuf / GeoPackage claim layers with built-in spatial indexes
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy import and_, func, or_
+
+from app import db
+from app.models import FRAClaim, Job
+from .jobs import stale_before
+
+# format -> (OGR driver, mimetype, file extension)
+SPATIAL_FORMATS = {
+    'fgb': ('FlatGeobuf', 'application/flatgeobuf', 'fgb'),
+    'gpkg': ('GPKG', 'application/geopackage+sqlite3', 'gpkg')
+}
+
+LAYER_SCHEMA = {
+    'geometry': 'Polygon',
+    'properties': OrderedDict([
+        ('claim_id', 'str:50'),
+        ('village_name', 'str:100'),
+        ('district', 'str:100'),
+        ('state', 'str:50'),
+        ('block', 'str:100'),
+        ('tehsil', 'str:100'),
+        ('area_ha', 'float'),
+        ('status', 'str:30'),
+        ('rights_type', 'str:50'),
+        ('forest_type', 'str:50'),
+        ('families', 'int'),
+        ('applied_on', 'str:10'),  # ISO dates; FlatGeobuf has no date field type
+        ('approved_on', 'str:10'),
+        ('gps_surveyed', 'bool')
+    ])
+}
+
+
+def claims_query(state: Optional[str] = None):
+    query = FRAClaim.query
+    if state:
+        query = query.filter(FRAClaim.state.ilike(f'%{state}%'))
+    return query
+
+
+def claims_version(state: Optional[str] = None) -> str:
+    """
+    Data version of a state's claims: row count plus the latest last_updated
+    
+    Computed on every export request, so it must stay cheap; inserts and edits
+    advance last_updated and deletions change the count.
+    """
+    count, last_updated = db.session.query(
+        func.count(FRAClaim.id),
+        func.max(FRAClaim.last_updated)
+    ).filter(*([FRAClaim.state.ilike(f'%{state}%')] if state else [])).one()
+    return f'{count}-{last_updated.strftime("%Y%m%d%H%M%S%f") if last_updated else 0}'
+
+
+def find_cached_export(params: Dict[str, str]) -> Optional[Job]:
+    """
+    Latest succeeded export job for the same format, state and version, or one
+    still in flight; queued or running jobs past JOB_TIMEOUT are presumed lost
+    """
+    return Job.query.filter(
+        Job.task == 'spatial_export',
+        Job.params.contains(params),
+        or_(
+            Job.status == 'succeeded',
+            and_(Job.status.in_(['queued', 'running']),
+                 func.coalesce(Job.started_at, Job.created_at) >= stale_before())
+        )
+    ).order_by(Job.created_at.desc()).first()
+
+
+def write_claims_layer(path: str, format_type: str, state: Optional[str] = None,
+                       batch_size: int = 1000, progress=None) -> Dict[str, int]:
+    """
+    Write claim polygons and attributes to a FlatGeobuf or GeoPackage file
+    
+    Both drivers build their spatial index on close (FlatGeobuf: packed Hilbert
+    R-tree, GeoPackage: rtree extension), so clients can fetch only the features
+    in their area of interest. Rows stream from a server-side cursor.
+    """
+    import fiona
+    from shapely import wkb
+    from shapely.geometry import mapping
+    
+    driver = SPATIAL_FORMATS[format_type][0]
+    total = claims_query(state).count()
+    
+    rows = db.session.query(
+        FRAClaim.claim_id,
+        FRAClaim.village_name,
+        FRAClaim.district,
+        FRAClaim.state,
+        FRAClaim.block,
+        FRAClaim.tehsil,
+        FRAClaim.area_hectares,
+        FRAClaim.status,
+        FRAClaim.rights_type,
+        FRAClaim.forest_type,
+        FRAClaim.claimant_families,
+        FRAClaim.application_date,
+        FRAClaim.approval_date,
+        FRAClaim.gps_surveyed,
+        func.ST_AsBinary(FRAClaim.geometry)
+    ).filter(
+        FRAClaim.geometry.isnot(None),
+        *([FRAClaim.state.ilike(f'%{state}%')] if state else [])
+    ).order_by(FRAClaim.claim_id).yield_per(batch_size)
+    
+    written = 0
+    with fiona.open(path, 'w', driver=driver, schema=LAYER_SCHEMA, crs='EPSG:4326',
+                    layer='fra_claims', SPATIAL_INDEX='YES') as layer:
+        batch = []
+        for row in rows:
+            *attributes, geometry = row
+            properties = OrderedDict(zip(LAYER_SCHEMA['properties'], attributes))
+            for key in ('applied_on', 'approved_on'):
+                if properties[key] is not None:
+                    properties[key] = properties[key].date().isoformat()
+            batch.append({'geometry': mapping(wkb.loads(bytes(geometry))), 'properties': properties})
+            
+            if len(batch) == batch_size:
+                layer.writerecords(batch)
+                written += len(batch)
+                batch = []
+                if progress:
+                    progress(written, total)
+        if batch:
+            layer.writerecords(batch)
+            written += len(batch)
+    
+    return {'features': written, 'skipped_without_geometry': total - written}
@@ -35,6 +35,10 @@ class Config:
     
     # Pagination
     CLAIMS_PER_PAGE = 50
+    EXPORT_BATCH_SIZE = 1000  # rows fetched per server-side cursor batch in streaming exports
+    EXPORT_NPZ_MAX_ROWS = 100000  # .npz report exports are built in memory; larger reports use arrow/csv/ndjson
+    PARQUET_EXPORT_DIR = os.environ.get('PARQUET_EXPORT_DIR') or 'exports/parquet'
+    PARQUET_EXPORT_BATCH_SIZE = 50000  # rows per Parquet record batch
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
     
     # External API keys
@@ -47,6 +51,22 @@ class Config:
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     
+    # Background jobs; JOBS_EAGER runs them inline in the request (tests, no broker)
+    JOBS_EAGER = os.environ.get('JOBS_EAGER', 'false').lower() in ['true', 'on', '1']
+    JOB_RESULTS_DIR = os.environ.get('JOB_RESULTS_DIR') or 'job_results'
+    JOB_TIMEOUT = 3 * 3600  # seconds a job may stay queued or running before it counts as lost
+    JOB_REDISPATCH_AFTER = 300  # seconds before a job still queued is handed to the broker again
+    EXPORT_ASYNC_THRESHOLD = 20000  # claims above which report exports run as a job
+    BULK_INGEST_MAX_OBSERVATIONS = 100000
+    BULK_INGEST_COMMIT_EVERY = 500
+    JOB_SCHEDULE_TIMEZONE = 'Asia/Kolkata'
+    JOB_SCHEDULE = {
+        'nightly-ndvi-forecast': {'task': 'forecast_ndvi', 'schedule': {'hour': 1, 'minute': 0}},
+        'nightly-parquet-export': {'task': 'parquet_export', 'schedule': {'hour': 2, 'minute': 0}}
+    }
+    # Beat runs the notification dispatcher directly, without a Job row per run
+    NOTIFICATION_DISPATCH_SCHEDULE = {'minute': '*'}
+    
     # File upload settings
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'geojson', 'json', 'shp', 'kml'}
@@ -55,6 +75,59 @@ class Config:
     NDVI_ALERT_THRESHOLD = 0.3
     NDVI_CRITICAL_THRESHOLD = 0.1
     DEFORESTATION_AREA_THRESHOLD = 0.5  # hectares
+    PROCESSING_SLA_DAYS = 90  # application-to-approval target for performance metrics
+    CHANGE_DETECTION_BLOCK_ROWS = 512  # raster rows read per strip
+    
+    # Multi-resolution monitoring queries
+    MONITORING_POINT_BUDGET = 120  # max points returned before switching to rollups
+    TRENDS_ROLLUP_MIN_DAYS = 180  # VegetationTrendsAPI reads monthly rollups from this range up
+    NDVI_COMPARISON_MAX_CLAIMS = 200  # claims per multi-claim NDVI comparison request
+    
+    # Nightly NDVI forecasts
+    FORECAST_METHOD = 'harmonic'  # harmonic or holt_winters
+    FORECAST_HORIZON_MONTHS = 6
+    FORECAST_HISTORY_MONTHS = 60
+    
+    # Cached NDVIProcessor analyses (entries, keyed by claim data version)
+    ANALYSIS_CACHE_SIZE = 1024
+    
+    # Versioned response snapshots (dashboard); 'redis' falls back to in-process when unreachable
+    SNAPSHOT_CACHE_BACKEND = os.environ.get('SNAPSHOT_CACHE_BACKEND') or 'redis'
+    SNAPSHOT_CACHE_TTL = 300  # seconds
+    SNAPSHOT_REFRESH_AHEAD = 60  # recompute in the background when this close to expiry
+    SNAPSHOT_LOCK_TIMEOUT = 30  # seconds a single-flight recomputation may hold its lock
+    SNAPSHOT_FALLBACK_TTL = 15  # TTL cap when Redis is unreachable and versions are per process
+    
+    # Alert event feed (/api/alerts/stream); 'redis' uses a Redis stream, falling back to in-process
+    ALERT_EVENTS_BACKEND = os.environ.get('ALERT_EVENTS_BACKEND') or 'redis'
+    ALERT_EVENTS_MAX_LEN = 10000  # events kept for Last-Event-ID resume
+    ALERT_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+    ALERT_STREAM_MAX_SECONDS = 300  # connection lifetime before the client reconnects and resumes
+    # Streams hold a gthread worker thread each; cap them per worker (of 16 threads)
+    # so dashboards cannot starve ordinary requests, answering 503 beyond it
+    ALERT_STREAM_MAX_CONNECTIONS = int(os.environ.get('ALERT_STREAM_MAX_CONNECTIONS') or 4)
+    ALERT_STREAM_RETRY_AFTER = 30
+    
+    # Streaming anomaly detection (per-claim baselines)
+    ANOMALY_EWM_ALPHA = 0.2
+    ANOMALY_Z_THRESHOLD = 2.5
+    ANOMALY_CRITICAL_Z = 4.0
+    ANOMALY_MIN_HISTORY = 6
+    ANOMALY_MIN_SEASONAL = 3  # at least 2; lower values are raised to 2
+    
+    # Per-request database budgets, keyed by endpoint ('blueprint.resourceclass') over 'default';
+    # a statement timeout answers 504, exceeding max_queries answers 503
+    QUERY_BUDGETS = {
+        'default': {
+            'statement_timeout_ms': int(os.environ.get('STATEMENT_TIMEOUT_MS') or 5000),
+            'max_queries': 500
+        },
+        'analytics.dashboardstatsapi': {'statement_timeout_ms': 15000},
+        'analytics.performancemetricsapi': {'statement_timeout_ms': 15000},
+        'analytics.exportreportapi': {'statement_timeout_ms': 120000, 'max_queries': 50},
+        'monitoring.deforestationalertsapi': {'statement_timeout_ms': 10000, 'max_queries': 50}
+    }
+    QUERY_BUDGET_RETRY_AFTER = 30  # seconds, sent with 503/504 budget responses
     
     # Email settings for alerts
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
@@ -63,6 +136,14 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     ALERT_EMAIL_RECIPIENTS = os.environ.get('ALERT_EMAIL_RECIPIENTS', '').split(',')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    
+    # Alert notifications: outbox rows per recipient, sent as digests by the scheduled dispatcher
+    NOTIFY_SEVERITIES = ('critical',)
+    NOTIFICATION_BATCH_SIZE = 500  # outbox rows per dispatcher run
+    NOTIFICATION_MAX_ATTEMPTS = 6
+    NOTIFICATION_BACKOFF_SECONDS = 60  # doubled after every failed attempt
+    NOTIFICATION_MAX_BACKOFF_SECONDS = 3600
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -83,7 +164,14 @@ class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    JOBS_EAGER = True
     WTF_CSRF_ENABLED = False
+    
+    # Local SMTP stand-in, e.g. `python -m aiosmtpd -n -l localhost:1025`
+    MAIL_SERVER = 'localhost'
+    MAIL_PORT = 1025
+    MAIL_USE_TLS = False
+    MAIL_USERNAME = None
 
 # Configuration dictionary
 config = {
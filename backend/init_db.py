@@ -54,7 +54,10 @@ def load_sample_data():
     import json
     import uuid
     from datetime import datetime, date
-    from app.models import FRAClaim, MonitoringData, Alert
+    from app.models import FRAClaim
+    from app.services.alert_incidents import record_detection
+    from app.services.anomaly_detector import StreamingAnomalyDetector
+    from app.services.ingestion import ingest_observation
     from geoalchemy2.shape import from_shape
     from shapely.geometry import shape
     
@@ -63,6 +66,7 @@ def load_sample_data():
     app = create_app()
     
     with app.app_context():
+        detector = StreamingAnomalyDetector.from_config(app.config)
         try:
             # Sample data files
             data_files = [
@@ -112,25 +116,23 @@ def load_sample_data():
                     
                     db.session.add(claim)
                     
-                    # Add sample monitoring data
+                    # Add sample monitoring data through the ingest path, so the
+                    # running statistics, detector state and rollups are seeded too
                     if props.get('ndvi_baseline'):
-                        monitoring = MonitoringData(
-                            id=uuid.uuid4(),
-                            claim_id=claim.id,
-                            observation_date=date.today(),
-                            satellite_source='Sentinel-2',
-                            ndvi_mean=props['ndvi_baseline'],
-                            cloud_cover_percentage=10.0,
-                            data_quality_score=0.95,
-                            processing_version='1.0'
-                        )
-                        db.session.add(monitoring)
+                        db.session.flush()  # the stats and rollup upserts reference the claim row
+                        ingest_observation(claim, {
+                            'observation_date': date.today().isoformat(),
+                            'satellite_source': 'Sentinel-2',
+                            'ndvi_mean': props['ndvi_baseline'],
+                            'cloud_cover_percentage': 10.0,
+                            'data_quality_score': 0.95,
+                            'processing_version': '1.0'
+                        }, detector)
                         
                         # Create alert if NDVI is low
                         if props['ndvi_baseline'] < 0.3:
-                            alert = Alert(
-                                id=uuid.uuid4(),
-                                claim_id=claim.id,
+                            record_detection(
+                                claim.id,
                                 alert_type='deforestation',
                                 severity='high' if props['ndvi_baseline'] < 0.1 else 'medium',
                                 confidence_score=0.85,
@@ -139,7 +141,6 @@ def load_sample_data():
                                     'detection_method': 'baseline_analysis'
                                 }
                             )
-                            db.session.add(alert)
                     
                     total_claims += 1
             
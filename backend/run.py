@@ -1,6 +1,7 @@
 import os
+import click
 from app import create_app, db
-from app.models import FRAClaim, MonitoringData, Alert
+from app.models import FRAClaim, MonitoringData, Alert, ClaimNDVIStats, MonitoringRollup, NDVIForecast, AnalyticsRollup, NotificationOutbox
 from config.settings import config
 
 # Create Flask application
@@ -14,7 +15,12 @@ def make_shell_context():
         'db': db,
         'FRAClaim': FRAClaim,
         'MonitoringData': MonitoringData,
-        'Alert': Alert
+        'Alert': Alert,
+        'ClaimNDVIStats': ClaimNDVIStats,
+        'MonitoringRollup': MonitoringRollup,
+        'NDVIForecast': NDVIForecast,
+        'AnalyticsRollup': AnalyticsRollup,
+        'NotificationOutbox': NotificationOutbox
     }
 
 @app.cli.command()
@@ -29,14 +35,199 @@ def load_sample_data():
     from init_db import load_sample_data
     load_sample_data()
 
+@app.cli.command()
+def rebuild_ndvi_stats():
+    
+    from app.services.anomaly_detector import StreamingAnomalyDetector
+    
+    with app.app_context():
+        print("Rebuilding running NDVI statistics...")
+        
+        detector = StreamingAnomalyDetector.from_config(app.config)
+        ClaimNDVIStats.query.delete()
+        
+        rows = db.session.query(
+            MonitoringData.claim_id,
+            MonitoringData.observation_date,
+            MonitoringData.ndvi_mean
+        ).filter(
+            MonitoringData.ndvi_mean.isnot(None)
+        ).order_by(
+            MonitoringData.claim_id,
+            MonitoringData.observation_date
+        ).yield_per(5000)
+        
+        stats = None
+        total_claims = 0
+        for claim_id, observation_date, ndvi_mean in rows:
+            if stats is None or stats.claim_id != claim_id:
+                stats = ClaimNDVIStats(claim_id=claim_id)
+                db.session.add(stats)
+                total_claims += 1
+            detector.update(stats, observation_date, ndvi_mean)
+            stats.add_observation(observation_date, ndvi_mean)
+        
+        db.session.commit()
+        print(f"✅ Rebuilt NDVI statistics for {total_claims} claims")
+
+@app.cli.command()
+def rebuild_rollups():
+    
+    from sqlalchemy import func, insert, literal, cast, Date
+    from app.services.rollups import ROLLUP_RESOLUTIONS
+    
+    with app.app_context():
+        print("Rebuilding weekly and monthly monitoring rollups...")
+        
+        MonitoringRollup.query.delete()
+        
+        for resolution in ROLLUP_RESOLUTIONS:
+            period = cast(func.date_trunc(resolution, MonitoringData.observation_date), Date)
+            select = db.session.query(
+                MonitoringData.claim_id,
+                literal(resolution),
+                period,
+                func.count(MonitoringData.ndvi_mean),
+                func.sum(MonitoringData.ndvi_mean),
+                func.sum(MonitoringData.ndvi_mean * MonitoringData.ndvi_mean),
+                func.min(MonitoringData.ndvi_mean),
+                func.max(MonitoringData.ndvi_mean),
+                func.now()
+            ).filter(
+                MonitoringData.ndvi_mean.isnot(None)
+            ).group_by(MonitoringData.claim_id, period)
+            
+            db.session.execute(insert(MonitoringRollup.__table__).from_select([
+                'claim_id', 'resolution', 'period_start', 'observation_count',
+                'ndvi_sum', 'ndvi_sum_sq', 'ndvi_min', 'ndvi_max', 'updated_at'
+            ], select.statement))
+        
+        db.session.commit()
+        print(f"✅ Rebuilt {MonitoringRollup.query.count()} rollup rows")
+
+@app.cli.command()
+def rebuild_analytics_rollups():
+    
+    from app.services.analytics_rollups import rebuild_rollups
+    from app.services.snapshot_cache import bump_data_versions
+    
+    with app.app_context():
+        print("Rebuilding time-bucketed analytics rollups...")
+        
+        row_count = rebuild_rollups()
+        db.session.commit()
+        # Core statements bypass the flush hooks; invalidate snapshots read from the rollups
+        bump_data_versions('analytics_rollups')
+        print(f"✅ Rebuilt {row_count} analytics rollup rows")
+
+@app.cli.command()
+def add_alert_severity_rank():
+    
+    from sqlalchemy import text
+    
+    with app.app_context():
+        print("Adding the stored alert severity rank and its listing index...")
+        
+        # Generated column: Postgres computes it for existing rows while adding it
+        rank_expression = Alert.__table__.c.severity_rank.computed.sqltext
+        db.session.execute(text(
+            "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS severity_rank smallint "
+            f"GENERATED ALWAYS AS ({rank_expression}) STORED"
+        ))
+        db.session.commit()
+        
+        for index in Alert.__table__.indexes:
+            if index.name == 'idx_alerts_active_rank_detected':
+                index.create(db.engine, checkfirst=True)
+        print("✅ Alert severity rank ready")
+
+@app.cli.command()
+def compact_alerts():
+    
+    from sqlalchemy import text
+    from app.services.alert_incidents import compact_open_alerts
+    from app.services.analytics_rollups import rebuild_rollups
+    from app.services.snapshot_cache import bump_data_versions
+    
+    with app.app_context():
+        print("Coalescing duplicate open alerts into incidents...")
+        
+        db.session.execute(text(
+            "ALTER TABLE alerts ADD COLUMN IF NOT EXISTS occurrence_count integer NOT NULL DEFAULT 1"
+        ))
+        db.session.execute(text("ALTER TABLE alerts ADD COLUMN IF NOT EXISTS last_seen_at timestamp"))
+        db.session.execute(text("UPDATE alerts SET last_seen_at = detected_at WHERE last_seen_at IS NULL"))
+        
+        result = compact_open_alerts()
+        if result['duplicates_removed']:
+            rebuild_rollups()
+        db.session.commit()
+        bump_data_versions('alerts', 'analytics_rollups')
+        
+        # Built after compaction: it allows one open alert per claim and type
+        for index in Alert.__table__.indexes:
+            if index.name == 'uq_alerts_open_claim_type':
+                index.create(db.engine, checkfirst=True)
+        print(f"✅ Merged {result['duplicates_removed']} duplicate alerts into {result['incidents']} incidents")
+
+@app.cli.command()
+def dispatch_notifications():
+    
+    from app.services.notifications import NotificationDispatcher
+    
+    with app.app_context():
+        print("Dispatching due alert notifications...")
+        
+        summary = NotificationDispatcher(app.config).dispatch()
+        print(f"✅ Sent {summary['notifications_sent']} notifications in {summary['digests_sent']} digests "
+              f"({summary['deferred']} deferred, {summary['failed']} failed)")
+
+@app.cli.command()
+def forecast_ndvi():
+    
+    from app.services.forecasting import generate_forecasts
+    
+    with app.app_context():
+        print("Generating NDVI forecasts for all claims...")
+        
+        forecast_count = generate_forecasts(
+            method=app.config['FORECAST_METHOD'],
+            horizon=app.config['FORECAST_HORIZON_MONTHS'],
+            history_months=app.config['FORECAST_HISTORY_MONTHS']
+        )
+        print(f"✅ Forecast {forecast_count} claims")
+
+@app.cli.command()
+@click.option('--dataset', 'datasets', multiple=True, help='claims, monitoring or alerts (repeatable; default all)')
+@click.option('--full', is_flag=True, help='Rewrite every partition, ignoring the manifest')
+def export_parquet(datasets, full):
+    
+    from app.services.parquet_export import ParquetExporter
+    
+    with app.app_context():
+        exporter = ParquetExporter(
+            app.config['PARQUET_EXPORT_DIR'],
+            batch_size=app.config['PARQUET_EXPORT_BATCH_SIZE']
+        )
+        print(f"Exporting Parquet datasets to {exporter.output_dir}...")
+        
+        summary = exporter.export(datasets=list(datasets) or None, full=full)
+        for name, result in summary.items():
+            print(f"✅ {name}: {result['partitions_written']} partitions written "
+                  f"({result['rows_written']} rows), {result['partitions_unchanged']} unchanged, "
+                  f"{result['partitions_removed']} removed")
+
 @app.cli.command()
 def create_test_data():
     
     from datetime import datetime, date, timedelta
     import uuid
     import random
+    from app.services.anomaly_detector import StreamingAnomalyDetector
+    from app.services.alert_incidents import record_detection
     
     with app.app_context():
+        detector = StreamingAnomalyDetector.from_config(app.config)
         print("Creating test data...")
         
         # Sample states and districts
@@ -72,9 +263,14 @@ def create_test_data():
             
             db.session.add(claim)
             
-            # Add monitoring data
-            for j in range(random.randint(5, 15)):
-                obs_date = date.today() - timedelta(days=random.randint(1, 365))
+            stats = ClaimNDVIStats(claim_id=claim.id)
+            db.session.add(stats)
+            db.session.flush()  # the rollup upserts reference the claim row
+            
+            # Add monitoring data, oldest first: the running baselines assume chronological input
+            days_ago = sorted(random.sample(range(1, 366), random.randint(5, 15)), reverse=True)
+            for days in days_ago:
+                obs_date = date.today() - timedelta(days=days)
                 ndvi_val = round(random.uniform(0.1, 0.8), 3)
                 
                 monitoring = MonitoringData(
@@ -90,18 +286,19 @@ def create_test_data():
                     processing_version='1.0'
                 )
                 db.session.add(monitoring)
-                
+                detector.update(stats, obs_date, ndvi_val)
+                stats.add_observation(obs_date, ndvi_val)
+                MonitoringRollup.record(claim.id, obs_date, ndvi_val)
                 
                 if ndvi_val < 0.3 and random.random() < 0.5:
-                    alert = Alert(
-                        id=uuid.uuid4(),
-                        claim_id=claim.id,
+                    # Repeat detections of a type join the claim's open incident
+                    record_detection(
+                        claim.id,
                         alert_type=random.choice(['deforestation', 'vegetation_degradation']),
                         severity='critical' if ndvi_val < 0.15 else 'high',
                         confidence_score=random.uniform(0.7, 0.95),
                         detected_at=datetime.combine(obs_date, datetime.min.time())
                     )
-                    db.session.add(alert)
         
         db.session.commit()
         print("✅ Test data created successfully!")
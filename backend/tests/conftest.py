@@ -0,0 +1,45 @@
+"""
+Shared fixtures: the app on TestingConfig (in-memory SQLite, eager jobs)
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.ext.compiler import compiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from config.settings import TestingConfig  # noqa: E402
+
+
+# Postgres column types of the models, rendered for the in-memory database
+@compiles(JSONB, 'sqlite')
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return 'JSON'
+
+
+@compiles(UUID, 'sqlite')
+def _uuid_on_sqlite(type_, compiler, **kw):
+    return 'CHAR(32)'
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestingConfig)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def jobs_table(app):
+    """Only the jobs table: the PostGIS-backed tables cannot be created on SQLite"""
+    from app.models import Job
+    
+    Job.__table__.create(db.engine)
+    yield Job
+    db.session.remove()
+    Job.__table__.drop(db.engine)
@@ -0,0 +1,81 @@
+"""
+Job lifecycle under JOBS_EAGER: enqueue_job runs the task inline through run_job
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.services.jobs import TASKS, enqueue_job, job_task, run_job
+
+
+@pytest.fixture
+def tasks():
+    @job_task('test_sum')
+    def test_sum(context, values):
+        context.progress(1, 2)
+        return {'total': sum(values)}
+    
+    @job_task('test_fail')
+    def test_fail(context):
+        raise RuntimeError('boom')
+    
+    yield
+    TASKS.pop('test_sum', None)
+    TASKS.pop('test_fail', None)
+
+
+def test_eager_job_succeeds(app, jobs_table, tasks):
+    job = enqueue_job('test_sum', {'values': [1, 2, 3]}, created_by='tests')
+    
+    job = db.session.get(jobs_table, job.id)
+    assert job.status == 'succeeded'
+    assert job.result == {'total': 6}
+    assert job.progress == 1.0
+    assert job.started_at is not None and job.finished_at >= job.started_at
+
+
+def test_eager_job_failure_is_recorded(app, jobs_table, tasks):
+    job = enqueue_job('test_fail')
+    
+    job = db.session.get(jobs_table, job.id)
+    assert job.status == 'failed'
+    assert job.error == 'boom'
+    assert job.finished_at is not None
+
+
+def test_unknown_task_is_rejected(app, jobs_table):
+    with pytest.raises(ValueError):
+        enqueue_job('no_such_task')
+    assert jobs_table.query.count() == 0
+
+
+def test_finished_job_is_not_run_again(app, jobs_table, tasks):
+    job = enqueue_job('test_fail')
+    
+    job = run_job(job.id)
+    assert job.status == 'failed'
+    assert job.error == 'boom'
+
+
+def test_stale_running_job_is_taken_over(app, jobs_table, tasks):
+    job = jobs_table(task='test_sum', params={'values': [4]}, status='running',
+                     started_at=datetime.utcnow() - timedelta(seconds=app.config['JOB_TIMEOUT'] + 60))
+    db.session.add(job)
+    db.session.commit()
+    
+    job = run_job(job.id)
+    assert job.status == 'succeeded'
+    assert job.result == {'total': 4}
+
+
+def test_recently_started_job_is_left_alone(app, jobs_table, tasks):
+    job = jobs_table(task='test_sum', params={'values': [4]}, status='running',
+                     started_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    
+    job = run_job(job.id)
+    assert job.status == 'running'
+    assert job.result is None
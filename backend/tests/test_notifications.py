@@ -0,0 +1,124 @@
+"""
+NotificationDispatcher: per-recipient digests, backoff schedule and the max-attempts cutoff
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.notifications import NotificationDispatcher, render_digest
+
+
+class RecordingSMTP:
+    """Injected SMTP connection that records messages and can refuse recipients"""
+    
+    def __init__(self, refuse=()):
+        self.sent = []
+        self.refuse = set(refuse)
+        self.closed = False
+    
+    def send_message(self, message):
+        if message['To'] in self.refuse:
+            raise smtplib.SMTPRecipientsRefused({message['To']: (550, b'no such user')})
+        self.sent.append(message)
+    
+    def quit(self):
+        self.closed = True
+    
+    def close(self):
+        self.closed = True
+
+
+def notification(recipient, severity='critical', event='alert.created', attempts=0):
+    return SimpleNamespace(
+        recipient=recipient,
+        event=event,
+        status='pending',
+        attempts=attempts,
+        last_error=None,
+        sent_at=None,
+        next_attempt_at=datetime.utcnow(),
+        payload={
+            'alert_type': 'deforestation',
+            'severity': severity,
+            'claim_id': 'CFR-2024-OD-001',
+            'village_name': 'Test Village',
+            'district': 'Kendrapada',
+            'state': 'Odisha',
+            'affected_area_hectares': 2.5,
+            'detected_at': '2024-06-01T00:00:00'
+        }
+    )
+
+
+def dispatcher(app, due, smtp=None, **config):
+    instance = NotificationDispatcher({**app.config, **config}, smtp_factory=lambda: smtp)
+    instance._due = lambda: due
+    return instance
+
+
+def test_digest_per_recipient(app):
+    due = [notification('a@example.org'), notification('b@example.org'),
+           notification('a@example.org', event='alert.escalated')]
+    smtp = RecordingSMTP()
+    
+    summary = dispatcher(app, due, smtp).dispatch()
+    
+    assert summary == {'digests_sent': 2, 'notifications_sent': 3, 'deferred': 0, 'failed': 0}
+    assert sorted(message['To'] for message in smtp.sent) == ['a@example.org', 'b@example.org']
+    digest_a = next(message for message in smtp.sent if message['To'] == 'a@example.org')
+    assert digest_a['Subject'] == 'FRA Atlas: 2 alert notifications'
+    assert 'escalated to critical' in digest_a.get_content()
+    assert all(item.status == 'sent' and item.attempts == 1 for item in due)
+    assert smtp.closed
+
+
+def test_render_digest_singular_subject():
+    message = render_digest('a@example.org', [notification('a@example.org')], 'fra-atlas@localhost')
+    assert message['Subject'] == 'FRA Atlas: 1 alert notification'
+    assert 'new critical' in message.get_content()
+
+
+def test_failed_digest_backs_off_exponentially(app):
+    due = [notification('a@example.org', attempts=attempts) for attempts in range(3)]
+    smtp = RecordingSMTP(refuse={'a@example.org'})
+    started = datetime.utcnow()
+    
+    summary = dispatcher(app, due, smtp, NOTIFICATION_BACKOFF_SECONDS=60,
+                         NOTIFICATION_MAX_BACKOFF_SECONDS=150, NOTIFICATION_MAX_ATTEMPTS=6).dispatch()
+    
+    assert summary['deferred'] == 3
+    delays = [(item.next_attempt_at - started).total_seconds() for item in due]
+    # 60 s after the first failure, doubled after each one, capped at the maximum
+    assert delays[0] == pytest.approx(60, abs=5)
+    assert delays[1] == pytest.approx(120, abs=5)
+    assert delays[2] == pytest.approx(150, abs=5)
+    assert all(item.status == 'pending' and item.last_error for item in due)
+
+
+def test_gives_up_after_max_attempts(app):
+    last_try = notification('a@example.org', attempts=5)
+    other = notification('b@example.org')
+    smtp = RecordingSMTP(refuse={'a@example.org'})
+    
+    summary = dispatcher(app, [last_try, other], smtp, NOTIFICATION_MAX_ATTEMPTS=6).dispatch()
+    
+    assert summary == {'digests_sent': 1, 'notifications_sent': 1, 'deferred': 0, 'failed': 1}
+    assert last_try.status == 'failed' and last_try.attempts == 6
+    assert other.status == 'sent'
+
+
+def test_connection_failure_defers_everything(app):
+    due = [notification('a@example.org'), notification('b@example.org')]
+    
+    def refuse_connection():
+        raise ConnectionRefusedError('SMTP server unreachable')
+    
+    instance = NotificationDispatcher(app.config, smtp_factory=refuse_connection)
+    instance._due = lambda: due
+    summary = instance.dispatch()
+    
+    assert summary == {'digests_sent': 0, 'notifications_sent': 0, 'deferred': 2, 'failed': 0}
+    assert all(item.next_attempt_at > datetime.utcnow() + timedelta(seconds=30) for item in due)